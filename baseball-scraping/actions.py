@@ -0,0 +1,343 @@
+import logging
+from dataclasses import dataclass, fields
+from typing import Optional
+from game_state import Base, Half, FieldPosition
+
+# Teams are stored relative to the half inning so an action doesn't depend on which half it was parsed in
+BATTING = 'batting'
+FIELDING = 'fielding'
+
+
+class ParsedEventError(Exception):
+    """Raised when replaying an event whose description could not be parsed"""
+
+
+def side_team(side, game_state):
+    if side == BATTING:
+        return 'away' if game_state.half == Half.TOP else 'home'
+    return 'home' if game_state.half == Half.TOP else 'away'
+
+
+def get_runner_current_base(runner_id, game_state):
+    for base, occupant in game_state.bases_occupied.items():
+        if occupant == runner_id:
+            return base
+    return None
+
+
+def occupy_base(base, player_id, game_state):
+    if game_state.bases_occupied.get(base, -1) == -1:
+        game_state.bases_occupied[base] = player_id
+    else:
+        logging.info(f"Error: Base {base.name.lower()} already occupied when trying to place player (ID: {player_id}).")
+
+
+def score_runner(player_id, game_state):
+    # Remove runner from bases if present
+    for base in [Base.FIRST, Base.SECOND, Base.THIRD]:
+        if game_state.bases_occupied.get(base, -1) == player_id:
+            game_state.bases_occupied[base] = -1
+            break
+    logging.info(f"Player (ID: {player_id}) scored.")
+
+
+def _replace_on_base(game_state, old_player_id, new_player_id):
+    for base, occupant in game_state.bases_occupied.items():
+        if occupant == old_player_id:
+            game_state.bases_occupied[base] = new_player_id
+            logging.info(f"Player {new_player_id} replaces {old_player_id} on {base.name}.")
+            return
+    logging.info(f"Warning: Could not find {old_player_id} on any base to replace.")
+
+
+def _replace_position_player(game_state, team, old_player_id, new_player_id):
+    logging.info(f"entered replace position player/pitcher function: ")
+    logging.info(f" team: team")
+    logging.info(f" old_player_id: old_player_id")
+    logging.info(f" new_player_id: new_player_id")
+
+    # Determine which team's position players and flags we are working with
+    if team == 'home':
+        position_players = game_state.home_position_players
+        current_pitcher = game_state.home_pitcher
+    elif team == 'away':
+        position_players = game_state.away_position_players
+        current_pitcher = game_state.away_pitcher
+    else:
+        raise ValueError("Team must be 'home' or 'away'")
+
+    logging.info(f"current_pitcher: {current_pitcher}")
+
+
+    # Replace a position player in the field
+    for position, player_id in position_players.items():
+        if player_id == old_player_id:
+            logging.info(f"Replacing {old_player_id} at {position} with {new_player_id} for {team}")
+            game_state.set_position_player(team, position, new_player_id)
+            return
+
+    # If the old player is the pitcher, replace the pitcher
+    if old_player_id == current_pitcher or current_pitcher is None:
+        logging.info(f"Replacing pitcher for {team}: {old_player_id} with {new_player_id}")
+        if team == 'home':
+            game_state.home_pitcher = new_player_id
+        else:
+            game_state.away_pitcher = new_player_id
+
+
+def _replace_in_batting_order(game_state, team, old_player_id, new_player_id, batting_position=None):
+    lineup = game_state.home_lineup if team == 'home' else game_state.away_lineup
+
+    if batting_position is not None:
+        # If a batting position is specified, insert the new player at that position
+        lineup[batting_position - 1] = new_player_id
+        logging.info(f"Inserted {new_player_id} into the {team} batting order at position {batting_position}.")
+    else:
+        # Find the old player in the batting lineup and replace them with the new player
+        for idx, player_id in enumerate(lineup):
+            if player_id == old_player_id:
+                lineup[idx] = new_player_id
+                logging.info(f"Replaced {old_player_id} with {new_player_id} in the {team} batting order at position {idx + 1}.")
+                return
+
+        logging.info(f"Warning: Could not find {old_player_id} in the {team} batting order to replace with {new_player_id}.")
+
+
+@dataclass(frozen=True)
+class AdvanceRunners:
+    """Force every runner ahead by the number of bases the batter took"""
+    bases: int
+
+    def apply(self, game_state):
+        # Move runners starting from 3rd base to 1st base
+        for base in [Base.THIRD, Base.SECOND, Base.FIRST]:
+            runner_id = game_state.bases_occupied.get(base, -1)
+            if runner_id != -1:
+                new_base_index = base.value + self.bases
+                if new_base_index >= 4:
+                    # Runner scores
+                    game_state.bases_occupied[base] = -1
+                    logging.info(f"Runner (ID: {runner_id}) scored from {base.name.lower()}.")
+                else:
+                    new_base = Base(new_base_index)
+                    if game_state.bases_occupied.get(new_base, -1) == -1:
+                        game_state.bases_occupied[base] = -1
+                        game_state.bases_occupied[new_base] = runner_id
+                        logging.info(
+                            f"Runner (ID: {runner_id}) advanced from {base.name.lower()} to {new_base.name.lower()}.")
+                    else:
+                        logging.info(
+                            f"Error: Base {new_base.name.lower()} already occupied when moving runner (ID: {runner_id}).")
+
+
+@dataclass(frozen=True)
+class Occupy:
+    """Put a player on an empty base"""
+    base: Base
+    player_id: int
+
+    def apply(self, game_state):
+        occupy_base(self.base, self.player_id, game_state)
+
+
+@dataclass(frozen=True)
+class ScoreRunner:
+    """Take a player off the bases after a home run"""
+    player_id: int
+
+    def apply(self, game_state):
+        score_runner(self.player_id, game_state)
+
+
+@dataclass(frozen=True)
+class MoveRunner:
+    """
+    Move a runner from wherever they are to to_base, None meaning they scored or were put out.
+    With occupy the runner only takes the base if it is empty.
+    """
+    runner_id: int
+    to_base: Optional[Base]
+    occupy: bool = False
+
+    def apply(self, game_state):
+        current_base = get_runner_current_base(self.runner_id, game_state)
+        if current_base is None:
+            logging.info(f"Error: Runner (ID: {self.runner_id}) not found on any base.")
+            return
+
+        game_state.bases_occupied[current_base] = -1
+        if self.to_base is None:
+            logging.info(f"Runner (ID: {self.runner_id}) left the bases from {current_base.name.lower()}.")
+        elif self.occupy:
+            occupy_base(self.to_base, self.runner_id, game_state)
+            logging.info(f"Runner (ID: {self.runner_id}) moved to {self.to_base.name.lower()}.")
+        else:
+            game_state.bases_occupied[self.to_base] = self.runner_id
+            logging.info(f"Runner (ID: {self.runner_id}) moved to {self.to_base.name.lower()}.")
+
+
+@dataclass(frozen=True)
+class ClearBaseIf:
+    """Remove a runner caught on the base they were leaving"""
+    base: Base
+    player_id: int
+
+    def apply(self, game_state):
+        if game_state.bases_occupied.get(self.base, -1) == self.player_id:
+            game_state.bases_occupied[self.base] = -1
+            logging.info(f"Player (ID: {self.player_id}) was put out leaving {self.base.name}.")
+        else:
+            logging.info(f"Warning: No player found on {self.base.name} to put out (Expected Player ID: {self.player_id}).")
+
+
+@dataclass(frozen=True)
+class PickoffError:
+    """Score the named runners, then advance everyone else a base starting from base"""
+    base: str
+    scorer_ids: tuple = ()
+
+    def apply(self, game_state):
+        scored_players = []
+        for player_id in self.scorer_ids:
+            for base, occupant in game_state.bases_occupied.items():
+                if occupant == player_id:
+                    game_state.bases_occupied[base] = -1
+                    scored_players.append(player_id)
+                    logging.info(f"Player (ID: {player_id}) scored.")
+                    break
+
+        # No further base advancements when the pickoff error occurred at 3B
+        if self.base == '3B':
+            return
+
+        runner_on_first = game_state.bases_occupied.get(Base.FIRST, -1)
+        runner_on_second = game_state.bases_occupied.get(Base.SECOND, -1)
+        advances = [(Base.FIRST, Base.SECOND, runner_on_first), (Base.SECOND, Base.THIRD, runner_on_second)]
+        if self.base == '2B':
+            advances.reverse()
+
+        for from_base, to_base, runner in advances:
+            if runner != -1 and runner not in scored_players:
+                game_state.bases_occupied[from_base] = -1
+                game_state.bases_occupied[to_base] = runner
+                logging.info(f"Runner on {from_base.name} (Player ID: {runner}) advanced to {to_base.name}.")
+
+
+@dataclass(frozen=True)
+class ReplaceOnBase:
+    old_id: int
+    new_id: int
+
+    def apply(self, game_state):
+        _replace_on_base(game_state, self.old_id, self.new_id)
+
+
+@dataclass(frozen=True)
+class ReplaceInLineup:
+    side: str
+    old_id: int
+    new_id: int
+    slot: Optional[int] = None
+
+    def apply(self, game_state):
+        _replace_in_batting_order(game_state, side_team(self.side, game_state), self.old_id, self.new_id, self.slot)
+
+
+@dataclass(frozen=True)
+class ReplaceFielder:
+    """Replace a player in the field, or the pitcher if they aren't playing a position"""
+    side: str
+    old_id: int
+    new_id: Optional[int]
+
+    def apply(self, game_state):
+        _replace_position_player(game_state, side_team(self.side, game_state), self.old_id, self.new_id)
+
+
+@dataclass(frozen=True)
+class SetFielder:
+    side: str
+    position: FieldPosition
+    player_id: Optional[int]
+
+    def apply(self, game_state):
+        team = side_team(self.side, game_state)
+        game_state.set_position_player(team, self.position, self.player_id)
+        logging.info(f"Placed {self.player_id} at {self.position} for team {team}.")
+
+
+@dataclass(frozen=True)
+class ClearFielderIf:
+    """Clear a position if the given player is the one occupying it"""
+    side: str
+    position: FieldPosition
+    player_id: int
+
+    def apply(self, game_state):
+        team = side_team(self.side, game_state)
+        if game_state.get_position_player(team, self.position) == self.player_id:
+            game_state.set_position_player(team, self.position, None)
+
+
+@dataclass(frozen=True)
+class ClearPitcherIf:
+    side: str
+    player_id: int
+
+    def apply(self, game_state):
+        if side_team(self.side, game_state) == 'away':
+            if game_state.away_pitcher == self.player_id:
+                game_state.away_pitcher = None
+                logging.info(f"found an offensive sub where the person being subbed out is the pitcher")
+        elif game_state.home_pitcher == self.player_id:
+            game_state.home_pitcher = None
+            logging.info(f"found an offensive sub where the person being subbed out is the pitcher")
+
+
+@dataclass(frozen=True)
+class Fail:
+    """Stands in for a description the parser raised on, so replaying it fails the game like the handler did"""
+    error: str
+
+    def apply(self, game_state):
+        raise ParsedEventError(self.error)
+
+
+ACTION_TYPES = {cls.__name__: cls for cls in [
+    AdvanceRunners, Occupy, ScoreRunner, MoveRunner, ClearBaseIf, PickoffError, ReplaceOnBase,
+    ReplaceInLineup, ReplaceFielder, SetFielder, ClearFielderIf, ClearPitcherIf, Fail,
+]}
+
+
+def apply_actions(actions, game_state):
+    for action in actions:
+        action.apply(game_state)
+
+
+def action_to_dict(action) -> dict:
+    data = {"op": type(action).__name__}
+    for field in fields(action):
+        value = getattr(action, field.name)
+        if isinstance(value, (Base, FieldPosition)):
+            value = value.name
+        elif isinstance(value, tuple):
+            value = list(value)
+        data[field.name] = value
+    return data
+
+
+def action_from_dict(data: dict):
+    cls = ACTION_TYPES[data["op"]]
+    kwargs = {}
+    for field in fields(cls):
+        if field.name not in data:
+            continue
+        value = data[field.name]
+        if field.name in ("base", "to_base") and value is not None and cls is not PickoffError:
+            value = Base[value]
+        elif field.name == "position" and value is not None:
+            value = FieldPosition[value]
+        elif isinstance(value, list):
+            value = tuple(value)
+        kwargs[field.name] = value
+    return cls(**kwargs)
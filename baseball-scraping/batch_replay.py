@@ -0,0 +1,591 @@
+import argparse
+import logging
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from actions import (AdvanceRunners, Occupy, ScoreRunner, MoveRunner, ClearBaseIf, ReplaceOnBase, ReplaceInLineup,
+                     ReplaceFielder, SetFielder, ClearFielderIf, ClearPitcherIf, Fail, ParsedEventError, BATTING)
+from event_cache import parse_game, player_maps, load_parsed_events
+from event_handlers import get_closest_player_id, set_player_registry
+from game_state import GameState, Base, Half, FieldPosition
+from main import (DECISION_COLUMNS, STATCAST_CSV, GameProcessor, replay_game, bases_settled_by_statcast,
+                  decision_events, possible_decision_events, caught_stealing_events, extract_player_name,
+                  determine_base_from_description)
+from pitch_index import load_pitch_index
+from player_registry import PlayerRegistry
+from statcast_at_bats import index_at_bats
+
+# Player ids are stored as ints. An empty base or lineup slot is -1 like in GameState, and None
+# (an empty field position, a pitcher that was subbed out, a name that didn't resolve) is NONE_ID.
+EMPTY = -1
+NONE_ID = -2
+HOME, AWAY = 0, 1
+POSITIONS = list(FieldPosition)
+HALF_NAMES = ["Top", "Bot"]
+
+OP_ADVANCE, OP_OCCUPY, OP_SCORE, OP_MOVE, OP_CLEAR_BASE, OP_REPLACE_ON_BASE, OP_LINEUP, OP_FIELDER, \
+    OP_SET_FIELDER, OP_CLEAR_FIELDER, OP_CLEAR_PITCHER, OP_FAIL, OP_FALLBACK = range(13)
+ACTION_WIDTH = 5
+
+# Decision row layout, in DECISION_COLUMNS order. Player columns hold ids as strings in process_event's
+# frames, except the field positions which hold the ints themselves.
+COL_IS_DECISION, COL_INNING, COL_HALF, COL_AT_BAT, COL_DEFICIT, COL_OUTS = range(1, 7)
+COL_THIRD, COL_SECOND, COL_FIRST, COL_HOME_PITCHER, COL_AWAY_PITCHER = range(7, 12)
+LINEUP_COLS = slice(12, 30)
+FIELDER_COLS = slice(30, 48)
+STRING_COLUMNS = range(COL_THIRD, LINEUP_COLS.stop)
+
+
+class ScalarFallback(Exception):
+    """Raised while compiling a game the batch can't represent, which is then replayed by replay_game"""
+
+
+def _player(player_id) -> int:
+    if player_id is None:
+        return NONE_ID
+    if isinstance(player_id, (bool, float)) or not isinstance(player_id, (int, np.integer)):
+        raise ScalarFallback(f"player id {player_id!r} is not an int")
+    return int(player_id)
+
+
+def _decode(value):
+    return None if value == NONE_ID else int(value)
+
+
+def encode_action(action, fallbacks: list) -> list:
+    """One row of the action table. Anything without a vectorized op is kept in fallbacks and applied to a GameState"""
+    side = lambda action: 0 if action.side == BATTING else 1
+    try:
+        if isinstance(action, AdvanceRunners) and action.bases >= 0:
+            return [OP_ADVANCE, action.bases, 0, 0, 0]
+        if isinstance(action, Occupy) and isinstance(action.base, Base):
+            return [OP_OCCUPY, action.base.value - 1, _player(action.player_id), 0, 0]
+        if isinstance(action, ScoreRunner):
+            return [OP_SCORE, _player(action.player_id), 0, 0, 0]
+        if isinstance(action, MoveRunner) and (action.to_base is None or isinstance(action.to_base, Base)):
+            to_base = -1 if action.to_base is None else action.to_base.value - 1
+            return [OP_MOVE, _player(action.runner_id), to_base, int(action.occupy), 0]
+        if isinstance(action, ClearBaseIf) and isinstance(action.base, Base):
+            return [OP_CLEAR_BASE, action.base.value - 1, _player(action.player_id), 0, 0]
+        if isinstance(action, ReplaceOnBase):
+            return [OP_REPLACE_ON_BASE, _player(action.old_id), _player(action.new_id), 0, 0]
+        if isinstance(action, ReplaceInLineup) and (action.slot is None or 1 <= action.slot <= 9):
+            return [OP_LINEUP, side(action), _player(action.old_id), _player(action.new_id), action.slot or 0]
+        if isinstance(action, ReplaceFielder):
+            return [OP_FIELDER, side(action), _player(action.old_id), _player(action.new_id), 0]
+        if isinstance(action, SetFielder) and action.position in POSITIONS:
+            return [OP_SET_FIELDER, side(action), POSITIONS.index(action.position), _player(action.player_id), 0]
+        if isinstance(action, ClearFielderIf) and action.position in POSITIONS:
+            return [OP_CLEAR_FIELDER, side(action), POSITIONS.index(action.position), _player(action.player_id), 0]
+        if isinstance(action, ClearPitcherIf):
+            return [OP_CLEAR_PITCHER, side(action), _player(action.player_id), 0, 0]
+        if isinstance(action, Fail):
+            fallbacks.append(action)
+            return [OP_FAIL, len(fallbacks) - 1, 0, 0, 0]
+    except ScalarFallback:
+        pass
+    # PickoffError and unusual arguments
+    fallbacks.append(action)
+    return [OP_FALLBACK, len(fallbacks) - 1, 0, 0, 0]
+
+
+class GameProgram:
+    """
+    A game compiled for batch replay. Everything process_event works out from the event alone is
+    precomputed per event, so the batch only has to carry the state the actions change.
+    """
+
+    def __init__(self, game_pk, game_data, parsed_events, at_bat_index, statcast_first=False):
+        self.game_pk = game_pk
+        self.game_data = game_data
+        self.parsed_events = parsed_events
+        self.at_bat_index = at_bat_index
+        self.statcast_first = statcast_first
+        self.scalar_reason = None
+        try:
+            self._compile()
+        except ScalarFallback as e:
+            self.scalar_reason = str(e)
+        except Exception as e:
+            # replay_game will raise the same error, or the batch was wrong to expect it
+            self.scalar_reason = f"{type(e).__name__}: {e}"
+
+    def _compile(self):
+        game_data = self.game_data
+        home_lineup = [int(player_id) if isinstance(player_id, str) else player_id
+                       for player_id in game_data.home_lineup]
+        away_lineup = [int(player_id) if isinstance(player_id, str) else player_id
+                       for player_id in game_data.away_lineup]
+        if len(home_lineup) != 9 or len(away_lineup) != 9:
+            raise ScalarFallback("lineups don't have nine batters")
+        home_bullpen = [int(player_id) if isinstance(player_id, str) else player_id
+                        for player_id in game_data.home_bullpen]
+        away_bullpen = [int(player_id) if isinstance(player_id, str) else player_id
+                        for player_id in game_data.away_bullpen]
+
+        self.lineups = np.array([[_player(p) for p in home_lineup], [_player(p) for p in away_lineup]])
+        self.pitchers = np.array([_player(home_bullpen[0] if home_bullpen else None),
+                                  _player(away_bullpen[0] if away_bullpen else None)])
+        self.fielders = np.full((2, len(POSITIONS)), NONE_ID)
+        for team, lineup, position_map in [(HOME, home_lineup, game_data.home_position_map),
+                                           (AWAY, away_lineup, game_data.away_position_map)]:
+            position_map = {int(k): v for k, v in position_map.items()}
+            for player_id in lineup:
+                field_position = next((fp for fp in FieldPosition if fp.value == position_map.get(player_id)), None)
+                if field_position:
+                    self.fielders[team, POSITIONS.index(field_position)] = _player(player_id)
+
+        player_map = player_maps(game_data)[2]
+        events = []
+        for inning in game_data.game_summary:
+            half_str, inning_number_str = inning['inning'].split()
+            events.extend((event, int(inning_number_str[:-2]), Half.TOP if half_str == 'Top' else Half.BOTTOM)
+                          for event in inning['events'])
+
+        n = len(events)
+        self.event_types = [event['type'] for event, _, _ in events]
+        self.inning = np.array([inning_number for _, inning_number, _ in events], dtype=np.int64)
+        self.half = np.array([0 if half == Half.TOP else 1 for _, _, half in events], dtype=np.int64)
+        self.typed = np.array([bool(event['type']) for event, _, _ in events], dtype=bool)
+        self.at_bat = np.zeros(n, dtype=np.int64)
+        self.sync_bases = np.full((n, 3), EMPTY, dtype=np.int64)
+        self.has_statcast = np.zeros(n, dtype=bool)
+        self.cs_base = np.full(n, -1, dtype=np.int64)
+        self.cs_player = np.zeros(n, dtype=np.int64)
+        self.decision = np.array([event['type'] in decision_events for event, _, _ in events], dtype=bool)
+        self.possible = np.array([event['type'] in possible_decision_events for event, _, _ in events], dtype=bool)
+        self.injury_left = np.zeros(n, dtype=bool)
+        self.soft_bunt = np.zeros(n, dtype=bool)
+        self.outs_update = np.zeros(n, dtype=np.int64)
+        self.score = np.full((n, 2), -1, dtype=np.int64)
+        self.action_count = np.zeros(n, dtype=np.int64)
+        actions = []
+        self.fallbacks = []
+
+        for i, (event, inning_number, half) in enumerate(events):
+            if not isinstance(event['atbat_index'], int):
+                raise ScalarFallback(f"at bat index {event['atbat_index']!r} is not an int")
+            self.at_bat[i] = event['atbat_index']
+            description = event['description']
+            if self.possible[i]:
+                lowered = description.lower()
+                self.injury_left[i] = event['type'] == 'Injury' and 'left the game' in lowered
+                self.soft_bunt[i] = 'soft bunt' in lowered
+
+            key = (str(inning_number), half.value, str(event['atbat_index']))
+            if event['type']:
+                statcast_bases = self.at_bat_index.get(key)
+                if statcast_bases is not None:
+                    self.has_statcast[i] = True
+                    self.sync_bases[i] = [_player(player_id) for player_id in statcast_bases]
+                    self._compile_synchronization(i, event, player_map)
+
+            if event['score_update']:
+                self.score[i] = [event['score_update'][game_data.home_abbr],
+                                 event['score_update'][game_data.away_abbr]]
+            if event['outs_update']:
+                self.outs_update[i] = event['outs_update']
+
+            event_actions = self.parsed_events[i]
+            if event['type'] == 'Offensive Substitution' and 'Pinch-runner' in description:
+                if any(isinstance(action, ReplaceOnBase) and action.new_id in self.at_bat_index.get(key, ())
+                       for action in event_actions):
+                    # GameReplay.replay_pinch_runner could roll the at bat back, which the lockstep can't
+                    raise ScalarFallback("a pinch-runner may replay their at bat")
+            if self.statcast_first and bases_settled_by_statcast(event, events[i + 1] if i + 1 < n else None,
+                                                                 self.at_bat_index):
+                event_actions = []
+            self.action_count[i] = len(event_actions)
+            actions.extend(encode_action(action, self.fallbacks) for action in event_actions)
+
+        self.actions = np.array(actions, dtype=np.int64).reshape(-1, ACTION_WIDTH)
+        self.action_start = np.cumsum(self.action_count) - self.action_count
+
+    def _compile_synchronization(self, i, event, player_map):
+        """The parts of synchronize_bases that only depend on the description"""
+        description = event['description']
+        if event['type'] in caught_stealing_events:
+            player_id = get_closest_player_id(extract_player_name(description), player_map)
+            base_to_check, _ = determine_base_from_description(description)
+            if player_id:
+                if base_to_check is None:
+                    raise ScalarFallback("caught stealing without a base")
+                self.cs_base[i] = base_to_check.value - 1
+                self.cs_player[i] = _player(player_id)
+
+        if event['type'] == 'Offensive Substitution' and "runner" in description:
+            old_player_name = description.split("replaces")[1].strip().rstrip('.').lower()
+            new_player_name = re.search(r'runner\s+(.+?)\s+replaces', description, re.IGNORECASE).group(1).lower()
+            reversed_player_map = {name.lower(): player_id for player_id, name in player_map.items()}
+            old_player_id = reversed_player_map.get(old_player_name)
+            new_player_id = reversed_player_map.get(new_player_name)
+            if old_player_id and new_player_id:
+                bases = self.sync_bases[i]
+                bases[bases == new_player_id] = old_player_id
+
+
+class GameBatch:
+    """
+    Replays many games in lockstep with their state in arrays shaped games x slots. Step t applies event t
+    of every game still running, one vectorized update per action type. Actions without a vectorized form
+    run on a GameState built from the game's row and written back, and games that can't be compiled at all
+    are replayed by replay_game.
+    """
+
+    def __init__(self, programs: list):
+        self.programs = programs
+        self.scalar = {i: program.scalar_reason for i, program in enumerate(programs) if program.scalar_reason}
+        self.batched = np.array([i for i in range(len(programs)) if i not in self.scalar], dtype=np.int64)
+        self.errors = {}
+        self.scalar_frames = {}
+
+        compiled = [programs[i] for i in self.batched]
+        games = len(programs)
+        self.event_count = np.zeros(games, dtype=np.int64)
+        self.event_count[self.batched] = [len(program.event_types) for program in compiled]
+        self.event_offset = np.cumsum(self.event_count) - self.event_count
+
+        def stack(name, empty_shape=(0,), dtype=np.int64):
+            arrays = [getattr(program, name) for program in compiled]
+            return np.concatenate(arrays) if arrays else np.zeros(empty_shape, dtype=dtype)
+
+        self.ev_inning = stack('inning')
+        self.ev_half = stack('half')
+        self.ev_typed = stack('typed', dtype=bool)
+        self.ev_at_bat = stack('at_bat')
+        self.ev_sync_bases = stack('sync_bases', (0, 3))
+        self.ev_has_statcast = stack('has_statcast', dtype=bool)
+        self.ev_cs_base = stack('cs_base')
+        self.ev_cs_player = stack('cs_player')
+        self.ev_decision = stack('decision', dtype=bool)
+        self.ev_possible = stack('possible', dtype=bool)
+        self.ev_injury_left = stack('injury_left', dtype=bool)
+        self.ev_soft_bunt = stack('soft_bunt', dtype=bool)
+        self.ev_outs_update = stack('outs_update')
+        self.ev_score = stack('score', (0, 2))
+        self.ev_action_count = stack('action_count')
+        self.actions = stack('actions', (0, ACTION_WIDTH))
+        # Action rows and fallback indexes are per game, so shift them into the batch-wide tables
+        action_offsets = np.cumsum([0] + [len(program.actions) for program in compiled])
+        self.ev_action_start = (np.concatenate([program.action_start + offset for program, offset
+                                                in zip(compiled, action_offsets)])
+                                if compiled else np.zeros(0, dtype=np.int64))
+        self.fallbacks = []
+        for program, start, stop in zip(compiled, action_offsets[:-1], action_offsets[1:]):
+            indirect = np.isin(self.actions[start:stop, 0], [OP_FAIL, OP_FALLBACK])
+            self.actions[start:stop, 1][indirect] += len(self.fallbacks)
+            self.fallbacks.extend(program.fallbacks)
+
+        # The state of every game is one decision row, and the parts actions change are views into it,
+        # so snapshotting the state before an event is a single row copy
+        self.state = np.zeros((games, len(DECISION_COLUMNS)), dtype=np.int32)
+        self.bases = self.state[:, COL_FIRST:COL_THIRD - 1:-1]
+        self.pitchers = self.state[:, COL_HOME_PITCHER:COL_AWAY_PITCHER + 1]
+        # Lineup and fielder columns alternate home and away, viewed as [game, team, slot]
+        self.lineups = self.state[:, LINEUP_COLS].reshape(games, 9, 2).transpose(0, 2, 1)
+        self.fielders = self.state[:, FIELDER_COLS].reshape(games, len(POSITIONS), 2).transpose(0, 2, 1)
+        self.inning = self.state[:, COL_INNING]
+        self.half = self.state[:, COL_HALF]
+        self.at_bat = self.state[:, COL_AT_BAT]
+        self.outs = self.state[:, COL_OUTS]
+        self.score = np.zeros((games, 2), dtype=np.int64)
+        self.bases[:] = EMPTY
+        self.lineups[:] = EMPTY
+        self.fielders[:] = NONE_ID
+        self.pitchers[:] = NONE_ID
+        self.inning[:] = 1
+        self.at_bat[:] = 1
+        for i, program in zip(self.batched, compiled):
+            self.lineups[i] = program.lineups
+            self.fielders[i] = program.fielders
+            self.pitchers[i] = program.pitchers
+        self.failed = np.zeros(games, dtype=bool)
+        self.failed[list(self.scalar)] = True
+
+        self.rows = np.zeros((len(self.ev_inning), len(DECISION_COLUMNS)), dtype=np.int32)
+
+    def __len__(self):
+        return int(self.event_count.sum())
+
+    def run(self):
+        for step in range(int(self.event_count.max(initial=0))):
+            games = np.flatnonzero((self.event_count > step) & ~self.failed)
+            if len(games):
+                self._step(step, games)
+        for i, reason in self.scalar.items():
+            self._replay_scalar(i, reason)
+        return self
+
+    def _step(self, step, games):
+        events = self.event_offset[games] + step
+
+        new_half = (self.inning[games] != self.ev_inning[events]) | (self.half[games] != self.ev_half[events])
+        self.outs[games[new_half]] = 0
+        self.inning[games] = self.ev_inning[events]
+        self.half[games] = self.ev_half[events]
+
+        # A new at bat, where the bases are replaced with Statcast's
+        new_at_bat = self.ev_typed[events] & (self.at_bat[games] != self.ev_at_bat[events])
+        synced, synced_events = games[new_at_bat], events[new_at_bat]
+        self.at_bat[synced] = self.ev_at_bat[synced_events]
+        has_statcast = self.ev_has_statcast[synced_events]
+        synced, synced_events = synced[has_statcast], synced_events[has_statcast]
+        new_bases = self.ev_sync_bases[synced_events].copy()
+        caught = np.flatnonzero(self.ev_cs_base[synced_events] >= 0)
+        cs_base = self.ev_cs_base[synced_events[caught]]
+        cs_player = self.ev_cs_player[synced_events[caught]]
+        moved = self.bases[synced[caught], cs_base] != cs_player
+        new_bases[caught[moved], cs_base[moved]] = cs_player[moved]
+        self.bases[synced] = new_bases
+
+        runners_on = (self.bases[games] != EMPTY).any(axis=1)
+        is_decision = self.ev_decision[events] | (self.ev_possible[events] & (
+            self.ev_injury_left[events] | (self.ev_soft_bunt[events] & runners_on & (self.outs[games] < 2))))
+
+        self.state[games, COL_IS_DECISION] = is_decision
+        self.state[games, COL_DEFICIT] = self.score[games, HOME] - self.score[games, AWAY]
+        self.rows[events] = self.state[games]
+
+        counts = self.ev_action_count[events]
+        for slot in range(int(counts.max(initial=0))):
+            acting = (counts > slot) & ~self.failed[games]
+            action_rows = self.actions[self.ev_action_start[events[acting]] + slot]
+            acting_games = games[acting]
+            for op in np.unique(action_rows[:, 0]):
+                selected = action_rows[:, 0] == op
+                self._apply(op, acting_games[selected], action_rows[selected])
+
+        scored = self.ev_score[events, 0] >= 0
+        self.score[games[scored]] = self.ev_score[events[scored]]
+        outs_update = self.ev_outs_update[events]
+        self.outs[games[outs_update != 0]] = outs_update[outs_update != 0]
+
+    def _team(self, side, games):
+        # The batting side is away in the top half and home in the bottom, the fielding side the opposite
+        return np.where(side == 0, 1 - self.half[games], self.half[games])
+
+    def _apply(self, op, games, args):
+        bases = self.bases
+        if op == OP_ADVANCE:
+            advance = args[:, 1]
+            for base in (2, 1, 0):
+                runner = bases[games, base]
+                on_base = runner != EMPTY
+                target = base + advance
+                bases[games[on_base & (target >= 3)], base] = EMPTY
+                moving = on_base & (target < 3)
+                moving_games, moving_targets, moving_runners = games[moving], target[moving], runner[moving]
+                free = bases[moving_games, moving_targets] == EMPTY
+                bases[moving_games[free], base] = EMPTY
+                bases[moving_games[free], moving_targets[free]] = moving_runners[free]
+        elif op == OP_OCCUPY:
+            free = bases[games, args[:, 1]] == EMPTY
+            bases[games[free], args[free, 1]] = args[free, 2]
+        elif op in (OP_SCORE, OP_MOVE, OP_REPLACE_ON_BASE):
+            # The first base holding the player, like iterating over bases_occupied
+            matches = bases[games] == args[:, 1:2]
+            found = matches.any(axis=1)
+            found_games, found_bases, args = games[found], matches.argmax(axis=1)[found], args[found]
+            if op == OP_REPLACE_ON_BASE:
+                bases[found_games, found_bases] = args[:, 2]
+                return
+            bases[found_games, found_bases] = EMPTY
+            if op == OP_MOVE:
+                to_base, occupy = args[:, 2], args[:, 3].astype(bool)
+                direct = (to_base >= 0) & ~occupy
+                bases[found_games[direct], to_base[direct]] = args[direct, 1]
+                occupying = np.flatnonzero((to_base >= 0) & occupy)
+                free = bases[found_games[occupying], to_base[occupying]] == EMPTY
+                occupying = occupying[free]
+                bases[found_games[occupying], to_base[occupying]] = args[occupying, 1]
+        elif op == OP_CLEAR_BASE:
+            caught = bases[games, args[:, 1]] == args[:, 2]
+            bases[games[caught], args[caught, 1]] = EMPTY
+        elif op == OP_LINEUP:
+            team = self._team(args[:, 1], games)
+            slotted = args[:, 4] > 0
+            self.lineups[games[slotted], team[slotted], args[slotted, 4] - 1] = args[slotted, 3]
+            games, team, args = games[~slotted], team[~slotted], args[~slotted]
+            matches = self.lineups[games, team] == args[:, 2:3]
+            found = matches.any(axis=1)
+            self.lineups[games[found], team[found], matches.argmax(axis=1)[found]] = args[found, 3]
+        elif op == OP_FIELDER:
+            team = self._team(args[:, 1], games)
+            matches = self.fielders[games, team] == args[:, 2:3]
+            found = matches.any(axis=1)
+            self.fielders[games[found], team[found], matches.argmax(axis=1)[found]] = args[found, 3]
+            pitcher = self.pitchers[games, team]
+            # A player who isn't in the field is taken to be the pitcher
+            replace_pitcher = ~found & ((pitcher == args[:, 2]) | (pitcher == NONE_ID))
+            self.pitchers[games[replace_pitcher], team[replace_pitcher]] = args[replace_pitcher, 3]
+        elif op == OP_SET_FIELDER:
+            self.fielders[games, self._team(args[:, 1], games), args[:, 2]] = args[:, 3]
+        elif op == OP_CLEAR_FIELDER:
+            team = self._team(args[:, 1], games)
+            playing = self.fielders[games, team, args[:, 2]] == args[:, 3]
+            self.fielders[games[playing], team[playing], args[playing, 2]] = NONE_ID
+        elif op == OP_CLEAR_PITCHER:
+            team = self._team(args[:, 1], games)
+            pitching = self.pitchers[games, team] == args[:, 2]
+            self.pitchers[games[pitching], team[pitching]] = NONE_ID
+        elif op == OP_FAIL:
+            for game, index in zip(games, args[:, 1]):
+                self.failed[game] = True
+                self.errors[game] = ParsedEventError(self.fallbacks[index].error)
+        else:
+            for game, index in zip(games, args[:, 1]):
+                self._apply_fallback(game, self.fallbacks[index])
+
+    def _apply_fallback(self, game, action):
+        game_state = self.game_state(game)
+        try:
+            action.apply(game_state)
+        except Exception as e:
+            self.failed[game] = True
+            self.errors[game] = e
+            return
+        try:
+            self._store_game_state(game, game_state)
+        except ScalarFallback as e:
+            # The action left state the arrays can't hold, so start the game over on its own
+            self.failed[game] = True
+            self.scalar[game] = str(e)
+
+    def game_state(self, game) -> GameState:
+        """The GameState process_event would have for a game at its current event"""
+        decode = lambda values: [None if value == NONE_ID else int(value) for value in values]
+        game_state = GameState(
+            inning=int(self.inning[game]), half=Half.TOP if self.half[game] == 0 else Half.BOTTOM,
+            score_home=int(self.score[game, HOME]), score_away=int(self.score[game, AWAY]),
+            outs=int(self.outs[game]), at_bat=int(self.at_bat[game]),
+            bases_occupied=dict(zip([Base.FIRST, Base.SECOND, Base.THIRD], decode(self.bases[game]))),
+            home_lineup=decode(self.lineups[game, HOME]), away_lineup=decode(self.lineups[game, AWAY]),
+            home_pitcher=_decode(self.pitchers[game, HOME]), away_pitcher=_decode(self.pitchers[game, AWAY]),
+            home_position_players=dict(zip(POSITIONS, decode(self.fielders[game, HOME]))),
+            away_position_players=dict(zip(POSITIONS, decode(self.fielders[game, AWAY]))),
+        )
+        return game_state
+
+    def _store_game_state(self, game, game_state):
+        if list(game_state.bases_occupied) != [Base.FIRST, Base.SECOND, Base.THIRD]:
+            raise ScalarFallback(f"bases {game_state.bases_occupied}")
+        self.bases[game] = [_player(game_state.bases_occupied[base]) for base in (Base.FIRST, Base.SECOND, Base.THIRD)]
+        self.lineups[game] = [[_player(p) for p in game_state.home_lineup], [_player(p) for p in game_state.away_lineup]]
+        self.pitchers[game] = [_player(game_state.home_pitcher), _player(game_state.away_pitcher)]
+        self.fielders[game] = [[_player(game_state.home_position_players[pos]) for pos in POSITIONS],
+                               [_player(game_state.away_position_players[pos]) for pos in POSITIONS]]
+
+    def _replay_scalar(self, game, reason):
+        program = self.programs[game]
+        logging.info(f"Replaying game {program.game_pk} on its own: {reason}")
+        try:
+            self.scalar_frames[game] = replay_game(program.game_data, None, program.parsed_events,
+                                                   program.statcast_first, program.at_bat_index)
+        except Exception as e:
+            self.errors[game] = e
+
+    def decisions(self, game) -> pd.DataFrame:
+        """Decision rows of the game at index game, as replay_game returns them. Raises the game's replay error"""
+        if game in self.errors:
+            raise self.errors[game]
+        if game in self.scalar_frames:
+            return self.scalar_frames[game]
+        start = int(self.event_offset[game])
+        rows = self.rows[start:start + int(self.event_count[game])].copy()
+        event_types = self.programs[game].event_types
+
+        frame = {"Event_Type": event_types, "Is_Decision": rows[:, COL_IS_DECISION].astype(bool)}
+        for column in (COL_INNING, COL_AT_BAT, COL_DEFICIT, COL_OUTS):
+            frame[DECISION_COLUMNS[column]] = rows[:, column].astype(np.int64)
+        frame["Half"] = np.array(HALF_NAMES, dtype=object)[rows[:, COL_HALF]]
+        for column in range(COL_THIRD, len(DECISION_COLUMNS)):
+            frame[DECISION_COLUMNS[column]] = np.array([_cell(column, value) for value in rows[:, column]], dtype=object)
+        return pd.DataFrame(frame, columns=DECISION_COLUMNS)
+
+
+def _cell(column, value):
+    """A decision cell the way create_decision_point writes it, see _get_player_representation"""
+    if column in STRING_COLUMNS:
+        return None if value in (EMPTY, NONE_ID) else str(value)
+    if column >= FIELDER_COLS.start:
+        return None if value == NONE_ID else int(value)
+    return int(value)
+
+
+def replay_batched(game_data, at_bat_summary) -> pd.DataFrame:
+    """Replay engine for regression.py that runs a single game through the batch"""
+    program = GameProgram(game_data.game_pk, game_data, parse_game(game_data), index_at_bats(at_bat_summary))
+    return GameBatch([program]).run().decisions(0)
+
+
+def validate(batch: GameBatch) -> dict:
+    """Compare every game of a batch with process_event's rows for it, as the CSV text write_decisions produces"""
+    summary = {"identical": 0, "mismatched": [], "both_failed": 0}
+    for game, program in enumerate(batch.programs):
+        try:
+            expected = replay_game(program.game_data, None, program.parsed_events, program.statcast_first,
+                                   program.at_bat_index).to_csv(index=False)
+        except Exception:
+            expected = None
+        try:
+            produced = batch.decisions(game).to_csv(index=False)
+        except Exception:
+            produced = None
+        if produced == expected:
+            summary["both_failed" if expected is None else "identical"] += 1
+        else:
+            summary["mismatched"].append(program.game_pk)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay games in lockstep batches and check them against process_event")
+    parser.add_argument("--games-csv", default="urls/gameday_urls2023.csv")
+    parser.add_argument("--num-games", type=int, default=None)
+    parser.add_argument("--scraped-dir", default="scraped_games")
+    parser.add_argument("--statcast", default=STATCAST_CSV)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--statcast-first", action="store_true")
+    parser.add_argument("--validate", action="store_true", help="compare every game with the per-game replay")
+    parser.add_argument("--no-player-registry", action="store_true",
+                        help="resolve names without the season registry, like create_dataset(use_player_registry=False)")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    if not args.no_player_registry:
+        set_player_registry(PlayerRegistry.load_or_build(args.scraped_dir))
+    processor = GameProcessor(args.scraped_dir)
+    pitch_index = load_pitch_index(args.statcast)
+    game_pks = pd.read_csv(args.games_csv)['game_pk'].tolist()[:args.num_games]
+    game_pks = [game_pk for game_pk in game_pks if (processor.scraped_dir / f"game_{game_pk}.json").exists()]
+
+    compile_seconds = replay_seconds = 0.0
+    events = scalar = failed = 0
+    mismatched = []
+    for start in range(0, len(game_pks), args.batch_size):
+        ts = time.perf_counter()
+        programs = []
+        for game_pk in game_pks[start:start + args.batch_size]:
+            game_data = processor.load_game_data(str(game_pk))
+            parsed_events = load_parsed_events(game_data, processor.scraped_dir / f"game_{game_pk}.json")
+            programs.append(GameProgram(game_pk, game_data, parsed_events, pitch_index.game(game_pk).at_bat_index(),
+                                        args.statcast_first))
+        batch = GameBatch(programs)
+        compile_seconds += time.perf_counter() - ts
+        ts = time.perf_counter()
+        batch.run()
+        replay_seconds += time.perf_counter() - ts
+        events += len(batch)
+        scalar += len(batch.scalar)
+        failed += len(batch.errors)
+        if args.validate:
+            mismatched += validate(batch)["mismatched"]
+
+    print(f"{len(game_pks)} games compiled in {compile_seconds:.1f}s, {events} events replayed in "
+          f"{replay_seconds:.2f}s ({events / max(replay_seconds, 1e-9):,.0f} events/s), "
+          f"{scalar} games replayed on their own, {failed} failed")
+    if args.validate:
+        print(f"{len(game_pks) - len(mismatched)} games match process_event, mismatched: {mismatched}")
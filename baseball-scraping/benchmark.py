@@ -0,0 +1,161 @@
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import random
+import resource
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from main import GameProcessor, replay_game, load_statcast_at_bats
+from metrics import percentile
+from statcast_at_bats import build_statcast_stub
+
+BASELINE_PATH = Path("benchmarks/baseline.json")
+SEASON_CSV = "urls/gameday_urls2023.csv"
+SAMPLE_SIZE = 500
+SAMPLE_SEED = 2023
+
+# Fixed subsets of the committed scraped_games, each given by the csv of game_pks it replays
+SUBSETS = {
+    "short": "urls/gameday_urls2023_short.csv",
+    "weird": "urls/weird_games.csv",
+    "sample500": SEASON_CSV,
+}
+
+
+def subset_game_pks(subset: str, scraped_dir: str = "scraped_games") -> list:
+    game_pks = [int(game_pk) for game_pk in pd.read_csv(SUBSETS[subset])['game_pk']]
+    game_pks = [game_pk for game_pk in game_pks if (Path(scraped_dir) / f"game_{game_pk}.json").exists()]
+    if subset == "sample500":
+        # Sort before sampling so the subset only depends on the seed, not on the csv order
+        game_pks = sorted(random.Random(SAMPLE_SEED).sample(sorted(game_pks), SAMPLE_SIZE))
+    return game_pks
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is the peak of the whole process so far, in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(game_pks: list, statcast: pd.DataFrame, scraped_dir: str = "scraped_games") -> dict:
+    """Replay each game through replay_game and collect throughput and latency numbers"""
+    processor = GameProcessor(scraped_dir)
+    at_bats_by_game = {game_pk: at_bats for game_pk, at_bats in statcast.groupby('game_pk')}
+    empty_at_bats = statcast.iloc[0:0]
+
+    latencies = []
+    total_events = 0
+    failures = []
+    start = time.perf_counter()
+    for game_pk in game_pks:
+        game_data = processor.load_game_data(str(game_pk))
+        num_events = sum(len(inning['events']) for inning in game_data.game_summary)
+
+        ts = time.perf_counter()
+        try:
+            replay_game(game_data, at_bats_by_game.get(game_pk, empty_at_bats))
+        except Exception as e:
+            failures.append((game_pk, str(e)))
+            continue
+        latencies.append(time.perf_counter() - ts)
+        total_events += num_events
+    elapsed = time.perf_counter() - start
+
+    replay_time = sum(latencies)
+    return {
+        "games": len(latencies),
+        "failed_games": len(failures),
+        "events": total_events,
+        "replay_seconds": replay_time,
+        "wall_seconds": elapsed,
+        "events_per_second": total_events / replay_time if replay_time else 0.0,
+        "game_latency_p50": percentile(latencies, 50),
+        "game_latency_p95": percentile(latencies, 95),
+        "game_latency_p99": percentile(latencies, 99),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_subset(subset: str, statcast_csv: str = None) -> dict:
+    logging.disable(logging.CRITICAL)
+    game_pks = subset_game_pks(subset)
+    statcast = load_statcast_at_bats(statcast_csv) if statcast_csv else build_statcast_stub(game_pks)
+    return run_benchmark(game_pks, statcast)
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return a description of every subset whose throughput or latency regressed past the tolerance"""
+    regressions = []
+    for subset, result in results.items():
+        reference = baseline.get(subset)
+        if not reference:
+            continue
+        if result["events_per_second"] < reference["events_per_second"] * (1 - tolerance):
+            regressions.append(f"{subset}: events/s {result['events_per_second']:.1f} "
+                               f"vs baseline {reference['events_per_second']:.1f}")
+        if result["game_latency_p95"] > reference["game_latency_p95"] * (1 + tolerance):
+            regressions.append(f"{subset}: p95 game latency {result['game_latency_p95']:.3f}s "
+                               f"vs baseline {reference['game_latency_p95']:.3f}s")
+        if result["failed_games"] > reference["failed_games"]:
+            regressions.append(f"{subset}: {result['failed_games']} failed games "
+                               f"vs baseline {reference['failed_games']}")
+    return regressions
+
+
+def format_results(results: dict) -> str:
+    lines = [f"{'subset':<11}{'games':>6}{'events':>8}{'events/s':>10}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'rss MB':>8}"]
+    for subset, r in results.items():
+        lines.append(f"{subset:<11}{r['games']:>6}{r['events']:>8}{r['events_per_second']:>10.1f}"
+                     f"{r['game_latency_p50']:>8.3f}{r['game_latency_p95']:>8.3f}{r['game_latency_p99']:>8.3f}"
+                     f"{r['peak_rss_mb']:>8.1f}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark season replay on fixed subsets of scraped_games")
+    parser.add_argument("--subset", choices=list(SUBSETS), action="append",
+                        help="subset to run, may be repeated (default: all subsets)")
+    parser.add_argument("--statcast", help="statcast csv to use instead of the stub built from games/")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    subsets = args.subset or list(SUBSETS)
+
+    results = {}
+    for subset in subsets:
+        # Each subset runs in a process of its own, so its peak RSS isn't the peak of a larger subset before it
+        with mp.get_context().Pool(1) as pool:
+            results[subset] = pool.apply(run_subset, (subset, args.statcast))
+        print(f"finished {subset}: {results[subset]['games']} games", flush=True)
+
+    print(format_results(results))
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        baseline.update(results)
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(baseline, indent=2))
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}, run with --update-baseline to create one")
+        return 0
+
+    regressions = compare_to_baseline(results, json.loads(baseline_path.read_text()), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Only the standard library is imported at the top. Each subcommand imports what it needs when it runs, so
+# `cli.py --help` or a typo never pays for pandas, and scrape is the only command that loads selenium.
+# Modules that must not be loaded just by starting the CLI
+HEAVY_MODULES = ["pandas", "numpy", "selenium", "tqdm", "unidecode", "scraper", "main"]
+# Median seconds allowed per measurement of `bench startup`, on top of a bare interpreter for the commands
+STARTUP_BUDGETS = {
+    "cli --help": 0.05,
+    "import main": 0.6,
+    "worker fork": 0.05,
+    "worker spawn": 0.8,
+}
+HERE = Path(__file__).resolve().parent
+
+
+def scrape(args, rest) -> int:
+    if args.replay:
+        from pipeline import run_pipeline
+
+        print(run_pipeline(args.games_csv, args.scraped_dir, scrapers=args.scrapers, replayers=args.replayers))
+        return 0
+    from scraper import GameScraper
+
+    from sharding import parse_shard
+
+    shard = parse_shard(args.shard) if args.shard else None
+    GameScraper(args.games_csv, args.scraped_dir).scrape_games(args.start, args.end, shard, args.shard_root)
+    return 0
+
+
+def process(args, rest) -> int:
+    from main import main
+
+    main(rest)
+    return 0
+
+
+def validate(args, rest) -> int:
+    from validate import main
+
+    return main(rest)
+
+
+def merge(args, rest) -> int:
+    from sharding import main
+
+    return main(["merge", *rest])
+
+
+def serve(args, rest) -> int:
+    from query_service import main
+
+    return main(rest)
+
+
+def dataset_stats(scraped_dir="scraped_games", games_dir="games", season_dir="season_columns") -> dict:
+    """Counts of what each stage has produced so far, reading the season file only when it exists"""
+    stats = {
+        "scraped_games": sum(1 for _ in Path(scraped_dir).glob("game_*.json")),
+        "decision_csvs": sum(1 for _ in Path(games_dir).glob("game_*_decisions.csv")),
+    }
+    if (Path(season_dir) / "meta.json").exists():
+        import numpy as np
+        from season_columns import load_season
+
+        season = load_season(season_dir, columns=["Is_Decision", "Event_Type"])
+        codes, counts = np.unique(season["Event_Type"], return_counts=True)
+        top = np.argsort(-counts)[:10]
+        stats.update({
+            "season_games": len(season.game_pks),
+            "season_rows": len(season),
+            "season_decisions": int(np.asarray(season["Is_Decision"]).sum()),
+            "event_types": dict(zip(season.event_type_names(codes[top]).tolist(), counts[top].tolist())),
+        })
+    return stats
+
+
+def stats(args, rest) -> int:
+    for key, value in dataset_stats(args.scraped_dir, args.games_dir, args.season_dir).items():
+        if isinstance(value, dict):
+            print(f"{key}:")
+            for name, count in value.items():
+                print(f"  {name}: {count}")
+        else:
+            print(f"{key}: {value}")
+    return 0
+
+
+def _run_seconds(command: list) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def _worker_ready(ready):
+    # What a replay worker imports before it can take its first game
+    import main  # noqa: F401
+
+    ready.put(os.getpid())
+
+
+def _spawn_seconds(method: str) -> float:
+    import multiprocessing as mp
+
+    ctx = mp.get_context(method)
+    ready = ctx.Queue()
+    start = time.perf_counter()
+    process = ctx.Process(target=_worker_ready, args=(ready,))
+    process.start()
+    ready.get()
+    seconds = time.perf_counter() - start
+    process.join()
+    return seconds
+
+
+def measure_startup(runs: int = 5) -> dict:
+    """
+    Median seconds of starting a bare interpreter, the CLI, an interpreter importing main, and a replay
+    worker from a parent that already imported main. The commands are reported above the bare interpreter.
+    """
+    python = sys.executable
+    commands = {
+        "interpreter": [python, "-c", "pass"],
+        "cli --help": [python, "cli.py", "--help"],
+        "import main": [python, "-c", "import main"],
+    }
+    seconds = {name: statistics.median(_run_seconds(command) for _ in range(runs))
+               for name, command in commands.items()}
+    for name in commands:
+        if name != "interpreter":
+            seconds[name] -= seconds["interpreter"]
+    # Forked workers inherit the parent's imports, spawned ones import everything again
+    import main  # noqa: F401
+    for method in ["fork", "spawn"]:
+        seconds[f"worker {method}"] = statistics.median(_spawn_seconds(method) for _ in range(runs))
+    return seconds
+
+
+def loaded_heavy_modules() -> list:
+    """Heavy modules a fresh interpreter has loaded after importing this module"""
+    code = f"import sys, cli; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=HERE, check=True, capture_output=True, text=True)
+    return [module for module in output.stdout.strip().split(",") if module]
+
+
+def bench_replay(args, rest) -> int:
+    from benchmark import main
+
+    return main(rest)
+
+
+def bench_queries(args, rest) -> int:
+    from query_load_test import main
+
+    return main(rest)
+
+
+def bench_startup(args, rest) -> int:
+    heavy = loaded_heavy_modules()
+    seconds = measure_startup(args.runs)
+    over = False
+    for name, value in seconds.items():
+        budget = STARTUP_BUDGETS.get(name)
+        over |= budget is not None and value > budget
+        verdict = "" if budget is None else f" (budget {budget * 1000:.0f} ms{', OVER' if value > budget else ''})"
+        print(f"{name}: {value * 1000:.1f} ms{verdict}")
+    print(f"heavy modules loaded by importing cli: {', '.join(heavy) or 'none'}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"seconds": seconds, "budgets": STARTUP_BUDGETS, "heavy_modules": heavy}, f, indent=2)
+    return 1 if over or heavy else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Scrape, replay and check the decision dataset")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scrape_parser = commands.add_parser("scrape", help="scrape gameday pages into scraped_games/")
+    scrape_parser.add_argument("--games-csv", default="urls/gameday_urls2023.csv")
+    scrape_parser.add_argument("--scraped-dir", default="scraped_games")
+    scrape_parser.add_argument("--start", type=int, default=0)
+    scrape_parser.add_argument("--end", type=int, default=None)
+    scrape_parser.add_argument("--replay", action="store_true", help="replay games as they are scraped")
+    scrape_parser.add_argument("--scrapers", type=int, default=1)
+    scrape_parser.add_argument("--replayers", type=int, default=1)
+    scrape_parser.add_argument("--shard", help="scrape only shard i of N, given as i/N, like 2/4")
+    scrape_parser.add_argument("--shard-root", default="shards")
+    scrape_parser.set_defaults(handler=scrape)
+
+    # process, validate and bench replay pass the rest of the command line on, so their own --help lists it
+    commands.add_parser("process", help="replay scraped games into decision CSVs (main.py)",
+                        add_help=False).set_defaults(handler=process, forward=True)
+    commands.add_parser("validate", help="check invariants of the decision dataset (validate.py)",
+                        add_help=False).set_defaults(handler=validate, forward=True)
+    commands.add_parser("merge", help="combine the outputs of sharded runs (sharding.py merge)",
+                        add_help=False).set_defaults(handler=merge, forward=True)
+    commands.add_parser("serve", help="serve lookups by game, player and situation over HTTP (query_service.py)",
+                        add_help=False).set_defaults(handler=serve, forward=True)
+
+    stats_parser = commands.add_parser("stats", help="count scraped games, decision CSVs and season rows")
+    stats_parser.add_argument("--scraped-dir", default="scraped_games")
+    stats_parser.add_argument("--games-dir", default="games")
+    stats_parser.add_argument("--season-dir", default="season_columns")
+    stats_parser.set_defaults(handler=stats)
+
+    bench_parser = commands.add_parser("bench", help="startup cost, replay throughput or query service load")
+    targets = bench_parser.add_subparsers(dest="target", required=True)
+    startup_parser = targets.add_parser("startup", help="time starting the CLI and a replay worker")
+    startup_parser.add_argument("--runs", type=int, default=5, help="measurements per figure, the median is kept")
+    startup_parser.add_argument("--report", help="write the figures as JSON")
+    startup_parser.set_defaults(handler=bench_startup)
+    targets.add_parser("replay", help="replay throughput against the baseline",
+                       add_help=False).set_defaults(handler=bench_replay, forward=True)
+    targets.add_parser("queries", help="load test the query service (query_load_test.py)",
+                       add_help=False).set_defaults(handler=bench_queries, forward=True)
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if rest and not getattr(args, "forward", False):
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    return args.handler(args, rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
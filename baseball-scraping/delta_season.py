@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from game_data import DECISION_COLUMNS
+from season_columns import (GAMES_DIR, SEASON_DIR, PLAYER_COLUMNS, BASE_COLUMNS, HALF_CODES, COLUMN_DTYPES, Season,
+                            game_pk_from_path, read_game_columns)
+
+DELTA_DIR = "season_deltas"
+
+# Pitchers, lineups and fielders only change on substitutions, so they are stored once per roster snapshot
+ROSTER_COLUMNS = [column for column in PLAYER_COLUMNS if column not in BASE_COLUMNS]
+ROSTER_INDEX = {column: i for i, column in enumerate(ROSTER_COLUMNS)}
+# What every row stores itself, plus the id of the roster snapshot it was played with
+EVENT_COLUMNS = [column for column in DECISION_COLUMNS if column not in ROSTER_INDEX] + ["Roster"]
+HALF_NAMES = np.array([None] + sorted(HALF_CODES, key=HALF_CODES.get), dtype=object)
+
+
+def _read_game(path):
+    return game_pk_from_path(path), read_game_columns(path)
+
+
+class DeltaSeason(Season):
+    """
+    A Season whose roster columns are kept as a table of distinct roster snapshots, one row per snapshot,
+    with every decision row pointing at its snapshot by id. Roster columns are rebuilt only when asked for.
+    """
+
+    def __init__(self, columns: dict, rosters: np.ndarray, game_pks: np.ndarray, offsets: np.ndarray,
+                 event_types: list):
+        super().__init__(columns, game_pks, offsets, event_types)
+        self.rosters = rosters
+
+    def __getitem__(self, column) -> np.ndarray:
+        if column in ROSTER_INDEX:
+            return self.rosters[self.columns["Roster"], ROSTER_INDEX[column]]
+        return self.columns[column]
+
+    def frame(self, rows: slice = slice(None)) -> pd.DataFrame:
+        """Decision rows as replay_game returns them, so to_csv gives back the decision CSV text"""
+        rosters = self.rosters[self.columns["Roster"][rows]]
+        data = {}
+        for column in DECISION_COLUMNS:
+            if column in ROSTER_INDEX:
+                values = rosters[:, ROSTER_INDEX[column]]
+            else:
+                values = self.columns[column][rows]
+            if column == "Event_Type":
+                data[column] = self.event_type_names(values)
+            elif column == "Half":
+                data[column] = HALF_NAMES[values + 1]
+            elif column in PLAYER_COLUMNS:
+                data[column] = pd.arrays.IntegerArray(values.astype(np.int64), values == -1)
+            else:
+                data[column] = np.asarray(values)
+        return pd.DataFrame(data, columns=DECISION_COLUMNS)
+
+    def game(self, game_pk) -> pd.DataFrame:
+        return self.frame(self.game_slice(game_pk))
+
+    def iter_games(self):
+        """(game_pk, decision rows) of every game, rehydrated one game at a time"""
+        for i, game_pk in enumerate(self.game_pks):
+            yield int(game_pk), self.frame(slice(int(self.offsets[i]), int(self.offsets[i + 1])))
+
+
+class RosterTable:
+    """Distinct rosters in the order they were first seen. Ids are never reused, so an id names one roster"""
+
+    def __init__(self, rosters: np.ndarray = None):
+        self.rows = list(rosters) if rosters is not None else []
+        self.ids = {row.tobytes(): snapshot for snapshot, row in enumerate(self.rows)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def encode(self, rosters: np.ndarray) -> np.ndarray:
+        """Snapshot id of every row of a game's roster matrix, only looking up rows where the roster changed"""
+        if not len(rosters):
+            return np.empty(0, dtype=np.int32)
+        changes = np.flatnonzero(np.r_[True, (rosters[1:] != rosters[:-1]).any(axis=1)])
+        snapshots = []
+        for row in rosters[changes]:
+            key = row.tobytes()
+            if key not in self.ids:
+                self.ids[key] = len(self.rows)
+                self.rows.append(row.copy())
+            snapshots.append(self.ids[key])
+        return np.repeat(np.asarray(snapshots, dtype=np.int32), np.diff(np.r_[changes, len(rosters)]))
+
+    def to_array(self) -> np.ndarray:
+        if not self.rows:
+            return np.empty((0, len(ROSTER_COLUMNS)), dtype=np.int32)
+        return np.stack(self.rows).astype(np.int32, copy=False)
+
+
+def load_delta_season(delta_dir=DELTA_DIR, mmap=True) -> DeltaSeason:
+    delta_dir = Path(delta_dir)
+    with open(delta_dir / "meta.json") as f:
+        meta = json.load(f)
+    mmap_mode = "r" if mmap else None
+    columns = {column: np.load(delta_dir / f"{column}.npy", mmap_mode=mmap_mode) for column in EVENT_COLUMNS}
+    return DeltaSeason(columns, np.load(delta_dir / "rosters.npy", mmap_mode=mmap_mode),
+                       np.load(delta_dir / "game_pks.npy"), np.load(delta_dir / "offsets.npy"), meta["event_types"])
+
+
+def build_delta_season(games_dir=GAMES_DIR, delta_dir=DELTA_DIR, workers=None) -> DeltaSeason:
+    """
+    Write the delta-encoded season from the decision CSVs, only re-reading the ones that are new or changed
+    since the last build. Snapshots of the previous build keep their ids.
+    """
+    delta_dir = Path(delta_dir)
+    delta_dir.mkdir(parents=True, exist_ok=True)
+    sources = {game_pk_from_path(path): path for path in Path(games_dir).glob("game_*_decisions.csv")}
+    stamps = {game_pk: [os.path.getmtime(path), os.path.getsize(path)] for game_pk, path in sources.items()}
+
+    previous = None
+    previous_stamps = {}
+    if (delta_dir / "meta.json").exists():
+        previous = load_delta_season(delta_dir, mmap=False)
+        with open(delta_dir / "meta.json") as f:
+            previous_stamps = {int(game_pk): stamp for game_pk, stamp in json.load(f)["sources"].items()}
+
+    stale = sorted(game_pk for game_pk in sources if previous_stamps.get(game_pk) != stamps[game_pk])
+    games = {}
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for game_pk, arrays in executor.map(_read_game, [sources[game_pk] for game_pk in stale], chunksize=16):
+                games[game_pk] = arrays
+
+    event_types = list(previous.event_types) if previous else []
+    for arrays in games.values():
+        for event_type in pd.unique(arrays["Event_Type"]):
+            if event_type not in event_types:
+                event_types.append(event_type)
+    event_codes = {event_type: code for code, event_type in enumerate(event_types)}
+    roster_table = RosterTable(previous.rosters if previous else None)
+
+    pieces = {column: [] for column in EVENT_COLUMNS}
+    lengths = []
+    game_pks = sorted(sources)
+    for game_pk in game_pks:
+        if game_pk in games:
+            arrays = games[game_pk]
+            arrays["Event_Type"] = np.fromiter((event_codes[e] for e in arrays["Event_Type"]), dtype=np.int16,
+                                               count=len(arrays["Event_Type"]))
+            rosters = np.column_stack([arrays[column] for column in ROSTER_COLUMNS]).astype(np.int32, copy=False)
+            arrays["Roster"] = roster_table.encode(rosters)
+        else:
+            rows = previous.game_slice(game_pk)
+            arrays = {column: previous.columns[column][rows] for column in EVENT_COLUMNS}
+        for column in EVENT_COLUMNS:
+            pieces[column].append(arrays[column].astype(COLUMN_DTYPES.get(column, np.int32), copy=False))
+        lengths.append(len(arrays["Event_Type"]))
+
+    offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+    (delta_dir / "meta.json").unlink(missing_ok=True)
+    for column in EVENT_COLUMNS:
+        dtype = COLUMN_DTYPES.get(column, np.int32)
+        np.save(delta_dir / f"{column}.npy", np.concatenate(pieces[column]) if pieces[column] else np.empty(0, dtype))
+    np.save(delta_dir / "rosters.npy", roster_table.to_array())
+    np.save(delta_dir / "game_pks.npy", np.asarray(game_pks, dtype=np.int64))
+    np.save(delta_dir / "offsets.npy", offsets)
+    with open(delta_dir / "meta.json", "w") as f:
+        json.dump({
+            "columns": EVENT_COLUMNS,
+            "roster_columns": ROSTER_COLUMNS,
+            "event_types": event_types,
+            "sources": {str(game_pk): stamps[game_pk] for game_pk in game_pks},
+        }, f)
+    return load_delta_season(delta_dir)
+
+
+def directory_bytes(directory) -> int:
+    return sum(path.stat().st_size for path in Path(directory).glob("*") if path.is_file())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the delta-encoded season and compare its size")
+    parser.add_argument("--games-dir", default=GAMES_DIR)
+    parser.add_argument("--output", default=DELTA_DIR)
+    parser.add_argument("--validate", action="store_true", help="check every game rehydrates to its CSV text")
+    args = parser.parse_args()
+
+    season = build_delta_season(args.games_dir, args.output)
+    print(f"Wrote {len(season)} rows for {len(season.game_pks)} games with {len(season.rosters)} roster snapshots "
+          f"to {args.output}/")
+    sizes = {"decision CSVs": directory_bytes(args.games_dir), "delta season": directory_bytes(args.output)}
+    if Path(SEASON_DIR, "meta.json").exists():
+        sizes["season columns"] = directory_bytes(SEASON_DIR)
+    for name, size in sizes.items():
+        print(f"  {name}: {size / 1e6:.1f} MB")
+
+    if args.validate:
+        sources = {game_pk_from_path(path): path for path in Path(args.games_dir).glob("game_*_decisions.csv")}
+        mismatched = [game_pk for game_pk, df in season.iter_games()
+                      if df.to_csv(index=False) != Path(sources[game_pk]).read_text()]
+        print(f"{len(season.game_pks) - len(mismatched)} games rehydrate to their CSV, mismatched: {mismatched}")
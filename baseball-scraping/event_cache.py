@@ -0,0 +1,110 @@
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+
+import event_handlers
+from actions import Fail, action_to_dict, action_from_dict
+from event_handlers import parse_event
+
+# Bump whenever a parser in event_handlers changes what it emits, so cached games are parsed again
+PARSER_VERSION = 2
+PARSED_DIR = "parsed_games"
+
+
+def player_maps(game_data):
+    """Home and away player maps, plus the combined map the handlers resolve names against"""
+    return game_data.home_player_map, game_data.away_player_map, {**game_data.home_player_map,
+                                                                  **game_data.away_player_map}
+
+
+def parse_game(game_data) -> list:
+    """The actions of every event in the game, in replay order"""
+    player_map = player_maps(game_data)[2]
+    parsed = []
+    for inning in game_data.game_summary:
+        for event in inning['events']:
+            try:
+                actions = parse_event(event['type'], event['description'], player_map)
+            except Exception as e:
+                # Keep the failure in the cache so the replay fails on the same event the handler would
+                actions = [Fail(f"{type(e).__name__}: {e}")]
+            parsed.append(actions)
+    return parsed
+
+
+def parsed_path(game_pk, parsed_dir=PARSED_DIR) -> Path:
+    return Path(parsed_dir) / f"game_{game_pk}.json"
+
+
+def cache_stamp(source_path) -> dict:
+    # Names resolve differently with the season registry installed, so it is part of the stamp
+    return {
+        "parser_version": PARSER_VERSION,
+        "source": [os.path.getmtime(source_path), os.path.getsize(source_path)],
+        "player_registry": event_handlers.player_registry is not None,
+    }
+
+
+def write_parsed(path, parsed, stamp):
+    with open(path, 'w') as f:
+        json.dump({"stamp": stamp, "events": [[action_to_dict(action) for action in actions]
+                                              for actions in parsed]}, f)
+
+
+def read_parsed(path, stamp=None):
+    """Cached actions for a game, or None when there is no cache or it was written for a different stamp"""
+    if not Path(path).exists():
+        return None
+    with open(path) as f:
+        cached = json.load(f)
+    if stamp is not None and cached.get("stamp") != stamp:
+        return None
+    return [[action_from_dict(action) for action in actions] for actions in cached["events"]]
+
+
+def load_parsed_events(game_data, source_path, parsed_dir=PARSED_DIR) -> list:
+    """Parsed actions for a scraped game, parsing and caching them next to the scraped games if needed"""
+    stamp = cache_stamp(source_path)
+    path = parsed_path(game_data.game_pk, parsed_dir)
+    parsed = read_parsed(path, stamp)
+    if parsed is None:
+        logging.info(f"Parsing events of game {game_data.game_pk}")
+        parsed = parse_game(game_data)
+        os.makedirs(parsed_dir, exist_ok=True)
+        write_parsed(path, parsed, stamp)
+    return parsed
+
+
+def replay_parsed(game_data, at_bat_summary):
+    """Replay engine for regression.py that applies actions round-tripped through the cache format"""
+    from main import replay_game
+
+    parsed = [[action_from_dict(action_to_dict(action)) for action in actions] for actions in parse_game(game_data)]
+    return replay_game(game_data, at_bat_summary, parsed)
+
+
+if __name__ == "__main__":
+    from main import GameProcessor
+    from player_registry import PlayerRegistry
+    from tqdm import tqdm
+
+    parser = argparse.ArgumentParser(description="Parse every scraped game into cached actions")
+    parser.add_argument("--scraped-dir", default="scraped_games")
+    parser.add_argument("--parsed-dir", default=PARSED_DIR)
+    parser.add_argument("--no-player-registry", action="store_true",
+                        help="parse without the season registry, matching create_dataset(use_player_registry=False)")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    if not args.no_player_registry:
+        event_handlers.set_player_registry(PlayerRegistry.load_or_build(args.scraped_dir))
+    processor = GameProcessor(args.scraped_dir)
+    failed = 0
+    for path in tqdm(sorted(Path(args.scraped_dir).glob("game_*.json"))):
+        game_data = processor.load_game_data(path.stem.split("_")[1])
+        parsed = load_parsed_events(game_data, path, args.parsed_dir)
+        failed += any(isinstance(action, Fail) for actions in parsed for action in actions)
+    print(f"Parsed events cached in {args.parsed_dir}/ (parser version {PARSER_VERSION}), "
+          f"{failed} games have events that fail to parse")
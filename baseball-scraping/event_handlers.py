@@ -2,9 +2,27 @@ import difflib
 import logging
 import re
 import string
-from game_state import Base, Half, FieldPosition, GameState
+from functools import lru_cache
+from game_state import Base, FieldPosition, GameState
+from actions import (BATTING, FIELDING, AdvanceRunners, Occupy, ScoreRunner, MoveRunner, ClearBaseIf, PickoffError,
+                     ReplaceOnBase, ReplaceInLineup, ReplaceFielder, SetFielder, ClearFielderIf, ClearPitcherIf,
+                     apply_actions)
 
+# Optional season-wide player_registry.PlayerRegistry consulted before fuzzy matching, see set_player_registry
+player_registry = None
 
+# player_map id -> (player_map, its size, processed name -> player id).
+# The map itself is kept so its id can't be reused by another dict while cached.
+_name_index_cache = {}
+_NAME_INDEX_CACHE_SIZE = 8
+
+
+def set_player_registry(registry):
+    global player_registry
+    player_registry = registry
+
+
+@lru_cache(maxsize=65536)
 def process_name(name):
     parts = name.split()
     if len(parts) >= 3 and all(len(part) == 2 and part.endswith('.') for part in parts[:-1]):
@@ -20,13 +38,36 @@ def process_name(name):
     return remove_middle_initials(name.lower())
 
 
+def _processed_name_index(player_map):
+    """Mapping from processed names to player IDs, built once per player map"""
+    cached = _name_index_cache.get(id(player_map))
+    if cached is not None and cached[0] is player_map and cached[1] == len(player_map):
+        return cached[2]
+
+    reversed_player_map = {process_name(name): player_id for player_id, name in player_map.items()}
+    if len(_name_index_cache) >= _NAME_INDEX_CACHE_SIZE:
+        _name_index_cache.pop(next(iter(_name_index_cache)))
+    _name_index_cache[id(player_map)] = (player_map, len(player_map), reversed_player_map)
+    return reversed_player_map
+
+
 def get_closest_player_id(player_name, player_map):
     logging.info(f"Attempting to get player ID for: {player_name}")
 
     player_name_processed = process_name(player_name)
 
     # Build a mapping from processed names to player IDs
-    reversed_player_map = {process_name(name): player_id for player_id, name in player_map.items()}
+    reversed_player_map = _processed_name_index(player_map)
+
+    # An exact match is what difflib would pick anyway, so try the hash lookups first
+    player_id = reversed_player_map.get(player_name_processed)
+    if player_id is None and player_registry is not None:
+        # The season's aliases of the players in this game, then a novel spelling against the aliases that share
+        # n-grams with it. difflib over the whole map is left for names the registry can't tell apart
+        player_id = player_registry.resolve(player_name, player_map)
+    if player_id is not None:
+        logging.info(f"Found match for '{player_name}' (ID: {player_id})")
+        return player_id
 
     names_list = list(reversed_player_map.keys())
 
@@ -42,7 +83,7 @@ def get_closest_player_id(player_name, player_map):
         return None
 
 
-def handle_stolen_base(description, game_state, player_map):
+def parse_stolen_base(description, player_map):
     if ':' in description:
         description = description.split(':', 1)[1].strip()
     player_name = description.split(" steals")[0].strip()
@@ -51,17 +92,7 @@ def handle_stolen_base(description, game_state, player_map):
 
     if not player_id:
         logging.info(f"Error: Player '{player_name}' not found in player map.")
-        return
-
-    current_base = None
-    for base, occupant in game_state.bases_occupied.items():
-        if occupant == player_id:
-            current_base = base
-            break
-
-    if not current_base:
-        logging.info(f"Error: Player '{player_name}' (ID: {player_id}) not found on any base.")
-        return
+        return []
 
     if "2nd base" in description:
         new_base = Base.SECOND
@@ -71,18 +102,12 @@ def handle_stolen_base(description, game_state, player_map):
         new_base = None  # Stealing home means scoring
     else:
         logging.info(f"Error: Unrecognized stolen base destination in description: '{description}'")
-        return
+        return []
 
-    if new_base:
-        game_state.bases_occupied[current_base] = -1
-        game_state.bases_occupied[new_base] = player_id
-        logging.info(f"Player '{player_name}' (ID: {player_id}) successfully stole {new_base.name.lower()}.")
-    else:
-        game_state.bases_occupied[current_base] = -1
-        logging.info(f"Player '{player_name}' (ID: {player_id}) successfully stole home. Score updated.")
+    return [MoveRunner(player_id, new_base)]
 
 
-def handle_wild_pitch(description, game_state, player_map):
+def parse_wild_pitch(description, player_map):
     abbreviations = ['Jr.', 'Sr.', 'II', 'III', 'IV', 'V']
     for abbr in abbreviations:
         description = description.replace(abbr, abbr.replace('.', '<dot>'))
@@ -93,6 +118,7 @@ def handle_wild_pitch(description, game_state, player_map):
     pitcher_info = sentences[0]
     base_runner_info = sentences[1:]
 
+    actions = []
     for runner_info in base_runner_info:
         runner_info = runner_info.strip().rstrip('.')
 
@@ -107,17 +133,7 @@ def handle_wild_pitch(description, game_state, player_map):
                 logging.info(f"Error: Player '{runner_name}' not found in player map.")
                 continue
 
-            current_base = next(
-                (base for base, occupant in game_state.bases_occupied.items() if occupant == player_id),
-                None
-            )
-
-            if not current_base:
-                logging.info(f"Error: Player '{runner_name}' (ID: {player_id}) not found on any base.")
-                continue
-
-            game_state.bases_occupied[current_base] = -1
-            logging.info(f"Player '{runner_name}' (ID: {player_id}) scored.")
+            actions.append(MoveRunner(player_id, None))
 
         elif " to " in runner_info:
             runner_name, base_movement = runner_info.rsplit(" to ", 1)
@@ -128,15 +144,6 @@ def handle_wild_pitch(description, game_state, player_map):
                 logging.info(f"Error: Player '{runner_name}' not found in player map.")
                 continue
 
-            current_base = next(
-                (base for base, occupant in game_state.bases_occupied.items() if occupant == player_id),
-                None
-            )
-
-            if not current_base:
-                logging.info(f"Error: Player '{runner_name}' (ID: {player_id}) not found on any base.")
-                continue
-
             if "2nd" in base_movement or "second" in base_movement:
                 new_base = Base.SECOND
             elif "3rd" in base_movement or "third" in base_movement:
@@ -145,12 +152,11 @@ def handle_wild_pitch(description, game_state, player_map):
                 logging.info(f"Error: Unrecognized base movement for '{runner_name}': '{base_movement}'")
                 continue
 
-            game_state.bases_occupied[current_base] = -1
-            game_state.bases_occupied[new_base] = player_id
-            logging.info(f"Player '{runner_name}' (ID: {player_id}) moved to {new_base.name.lower()}.")
+            actions.append(MoveRunner(player_id, new_base))
+    return actions
 
 
-def handle_passed_ball(description, game_state, player_map):
+def parse_passed_ball(description, player_map):
     parts = description.split(". ")
     catcher_info = parts[0]
     base_runner_info = parts[1:]
@@ -172,25 +178,15 @@ def handle_passed_ball(description, game_state, player_map):
         2 if "2nd" in x[1] else 3
     ))
 
+    actions = []
     for runner_name, movement in runner_movements:
         player_id = get_closest_player_id(runner_name, player_map)
         if not player_id:
             logging.info(f"Error: Player '{runner_name}' not found in player map.")
             continue
 
-        current_base = None
-        for base, occupant in game_state.bases_occupied.items():
-            if occupant == player_id:
-                current_base = base
-                break
-
-        if not current_base:
-            logging.info(f"Error: Player '{runner_name}' (ID: {player_id}) not found on any base.")
-            continue
-
         if movement == "scores":
-            game_state.bases_occupied[current_base] = -1
-            logging.info(f"Player '{runner_name}' (ID: {player_id}) scored.")
+            actions.append(MoveRunner(player_id, None))
         else:
             if "3rd" in movement:
                 new_base = Base.THIRD
@@ -200,12 +196,74 @@ def handle_passed_ball(description, game_state, player_map):
                 logging.info(f"Error: Unrecognized base movement for '{runner_name}': '{movement}'")
                 continue
 
-            game_state.bases_occupied[current_base] = -1
-            game_state.bases_occupied[new_base] = player_id
-            logging.info(f"Player '{runner_name}' (ID: {player_id}) moved to {new_base.name.lower()}.")
+            actions.append(MoveRunner(player_id, new_base))
+    return actions
+
+
+# Expanded action keywords and sorted from longest to shortest
+action_keywords = sorted([
+    'grounds into a fielder\'s choice',
+    'grounds into a double play',
+    'grounds into a force out',
+    'intentionally walks',
+    'hits a grand slam',
+    'hits a home run',
+    'hit by pitch',
+    'intentionally walk',
+    'grounds out',
+    'grounds into',
+    'walks',
+    'singles',
+    'doubles',
+    'triples',
+    'homers',
+    'reaches',
+    'hits'
+], key=len, reverse=True)
+action_keywords_pattern = '|'.join(map(re.escape, action_keywords))
+
+INTENTIONAL_WALK_REGEX = re.compile(r"^(.*?)\s+intentionally walks\s+(.*?)\.?$", re.IGNORECASE)
+ACTION_REGEX = re.compile(rf"^(.*?)\s+({action_keywords_pattern})(?:\s+\(.*?\))?(?:\s+[^,]*)?(?:,|$)", re.IGNORECASE)
+ALT_ACTION_REGEX = re.compile(rf"^(.*?)\s+({action_keywords_pattern})\s+(.*?)\.?$", re.IGNORECASE)
+
+# Updated movement_patterns to handle "advances to" and commas
+movement_patterns = [
+    re.compile(r"^(.*?)\s+(?:to|advances to)\s+(1st|2nd|3rd|home)(?:,.*)?$", re.IGNORECASE),
+    re.compile(r"^(.*?)\s+(scores|out at home|out at 1st|out at 2nd|out at 3rd)(?:,.*)?$", re.IGNORECASE),
+]
+
+# Process runner movements with priority
+movement_priority = {
+    'scores': 0,
+    'home': 0,
+    'out at home': 0,
+    '3rd': 1,
+    'out at 3rd': 1,
+    '2nd': 2,
+    'out at 2nd': 2,
+    '1st': 3,
+    'out at 1st': 3,
+}
+
+# How many bases runners should advance based on the batter's action
+bases_to_advance = {
+    'walks': 1,
+    'intentionally walks': 1,
+    'hit by pitch': 1,
+    'singles': 1,
+    'reaches': 1,
+    'doubles': 2,
+    'triples': 3,
+    'homers': 4,
+    'hits a grand slam': 4,
+    'hits a home run': 4,
+    'grounds into a force out': 1,
+    'grounds into a double play': 1,
+    "grounds into a fielder's choice": 1,
+}
 
 
-def attempt_base_update(description, game_state, player_map):
+def parse_base_update(description, player_map):
     logging.info(f"Processing description: '{description}'")
 
     # Step 1: Handle challenge descriptions
@@ -218,7 +276,7 @@ def attempt_base_update(description, game_state, player_map):
             logging.info(f"Adjusted description after challenge: '{description}'")
         else:
             logging.info("No 'overturned:' or 'upheld:' found after 'challenged'")
-            return
+            return []
 
     # Step 2: Normalize and split the description into sentences
     description = description.replace('.', '. ')
@@ -226,39 +284,12 @@ def attempt_base_update(description, game_state, player_map):
 
     if not sentences:
         logging.info("No actionable sentences found in the description.")
-        return
-
-    # Expanded action keywords and sorted from longest to shortest
-    action_keywords = [
-        'grounds into a fielder\'s choice',
-        'grounds into a double play',
-        'grounds into a force out',
-        'intentionally walks',
-        'hits a grand slam',
-        'hits a home run',
-        'hit by pitch',
-        'intentionally walk',
-        'grounds out',
-        'grounds into',
-        'walks',
-        'singles',
-        'doubles',
-        'triples',
-        'homers',
-        'reaches',
-        'hits'
-    ]
-    action_keywords.sort(key=len, reverse=True)
-    action_keywords_pattern = '|'.join(map(re.escape, action_keywords))
+        return []
 
     main_action = sentences[0]
 
     # Special handling for intentional walks
-    intentional_walk_match = re.match(
-        r"^(.*?)\s+intentionally walks\s+(.*?)\.?$",
-        main_action,
-        re.IGNORECASE
-    )
+    intentional_walk_match = INTENTIONAL_WALK_REGEX.match(main_action)
 
     if intentional_walk_match:
         # For intentional walks, the first group is the pitcher and second group is the batter
@@ -266,85 +297,49 @@ def attempt_base_update(description, game_state, player_map):
         action = "intentionally walks"
     else:
         # Regular action handling (unchanged)
-        action_regex = re.compile(
-            rf"^(.*?)\s+({action_keywords_pattern})(?:\s+\(.*?\))?(?:\s+[^,]*)?(?:,|$)",
-            re.IGNORECASE
-        )
-        action_match = action_regex.match(main_action)
+        action_match = ACTION_REGEX.match(main_action)
 
         if action_match:
             batter_name = action_match.group(1).strip()
             action = action_match.group(2).lower()
         else:
-            alt_action_regex = re.compile(
-                rf"^(.*?)\s+({action_keywords_pattern})\s+(.*?)\.?$",
-                re.IGNORECASE
-            )
-            alt_match = alt_action_regex.match(main_action)
+            alt_match = ALT_ACTION_REGEX.match(main_action)
             if alt_match:
                 pitcher_name = alt_match.group(1).strip()
                 action = alt_match.group(2).lower()
                 batter_name = alt_match.group(3).strip()
             else:
                 logging.info("No main action found in the description.")
-                return
+                return []
 
     batter_id = get_closest_player_id(batter_name, player_map)
     if not batter_id:
         logging.info(f"Error: Batter '{batter_name}' not found in player map.")
-        return
+        return []
 
+    actions = []
     # Move existing runners ahead of batter
-    move_existing_runners(action, game_state)
+    if bases_to_advance.get(action, 0):
+        actions.append(AdvanceRunners(bases_to_advance[action]))
 
     # Update bases based on the action
-    if action in ['walks', 'intentionally walks']:
-        occupy_base(Base.FIRST, batter_id, game_state)
-        logging.info(f"Batter '{batter_name}' (ID: {batter_id}) walked to first base.")
-    elif action == 'hit by pitch':
-        occupy_base(Base.FIRST, batter_id, game_state)
-        logging.info(f"Batter '{batter_name}' (ID: {batter_id}) reached first base via hit by pitch.")
-    elif action in ['singles', 'reaches']:
-        occupy_base(Base.FIRST, batter_id, game_state)
-        logging.info(f"Batter '{batter_name}' (ID: {batter_id}) reached first base.")
+    if action in ['walks', 'intentionally walks', 'hit by pitch', 'singles', 'reaches']:
+        actions.append(Occupy(Base.FIRST, batter_id))
     elif action == 'doubles':
-        occupy_base(Base.SECOND, batter_id, game_state)
-        logging.info(f"Batter '{batter_name}' (ID: {batter_id}) reached second base.")
+        actions.append(Occupy(Base.SECOND, batter_id))
     elif action == 'triples':
-        occupy_base(Base.THIRD, batter_id, game_state)
-        logging.info(f"Batter '{batter_name}' (ID: {batter_id}) reached third base.")
+        actions.append(Occupy(Base.THIRD, batter_id))
     elif action in ['homers', 'hits a grand slam', 'hits a home run']:
-        logging.info(f"Batter '{batter_name}' (ID: {batter_id}) hit a home run.")
-        score_runner(batter_id, game_state)
+        actions.append(ScoreRunner(batter_id))
     elif action in ['grounds into a force out', 'grounds into a double play', "grounds into a fielder's choice"]:
         # For force outs and double plays, the batter may or may not reach first base
         # Additional logic may be needed here based on runner movements
-        occupy_base(Base.FIRST, batter_id, game_state)
-        logging.info(f"Batter '{batter_name}' (ID: {batter_id}) reached first base on {action}.")
+        actions.append(Occupy(Base.FIRST, batter_id))
     else:
         logging.info(f"Unrecognized action '{action}' for batter '{batter_name}'.")
 
     # Step 4: Process any additional runner movements
     runner_movements = sentences[1:]
-
-    # Updated movement_patterns to handle "advances to" and commas
-    movement_patterns = [
-        re.compile(r"^(.*?)\s+(?:to|advances to)\s+(1st|2nd|3rd|home)(?:,.*)?$", re.IGNORECASE),
-        re.compile(r"^(.*?)\s+(scores|out at home|out at 1st|out at 2nd|out at 3rd)(?:,.*)?$", re.IGNORECASE),
-    ]
-
-    # Process runner movements with priority
-    movement_priority = {
-        'scores': 0,
-        'home': 0,
-        'out at home': 0,
-        '3rd': 1,
-        'out at 3rd': 1,
-        '2nd': 2,
-        'out at 2nd': 2,
-        '1st': 3,
-        'out at 1st': 3,
-    }
     movements = []
 
     for movement in runner_movements:
@@ -363,97 +358,21 @@ def attempt_base_update(description, game_state, player_map):
     # Sort movements based on priority
     movements.sort()
 
-    # Process movements
     for _, runner_name, action in movements:
         runner_id = get_closest_player_id(runner_name, player_map)
         if not runner_id:
             logging.info(f"Error: Runner '{runner_name}' not found in player map.")
             continue
 
-        current_base = get_runner_current_base(runner_id, game_state)
-        if current_base is None:
-            logging.info(f"Error: Runner '{runner_name}' (ID: {runner_id}) not found on any base.")
-            continue
-
-        if action in ['scores', 'home']:
-            game_state.bases_occupied[current_base] = -1
-            logging.info(f"Runner '{runner_name}' (ID: {runner_id}) scored from {current_base.name.lower()}.")
-        elif action.startswith('out at'):
-            game_state.bases_occupied[current_base] = -1
-            logging.info(f"Runner '{runner_name}' (ID: {runner_id}) was out at {action.split()[-1]}.")
+        if action in ['scores', 'home'] or action.startswith('out at'):
+            actions.append(MoveRunner(runner_id, None, occupy=True))
         else:
             new_base = get_base_enum(action)
             if not new_base:
                 logging.info(f"Error: Unrecognized base '{action}' for runner '{runner_name}'.")
                 continue
-            game_state.bases_occupied[current_base] = -1
-            occupy_base(new_base, runner_id, game_state)
-            logging.info(f"Runner '{runner_name}' (ID: {runner_id}) moved to {new_base.name.lower()}.")
-
-def move_existing_runners(action, game_state):
-    # Define how many bases runners should advance based on the batter's action
-    bases_to_advance = {
-        'walks': 1,
-        'intentionally walks': 1,
-        'hit by pitch': 1,
-        'singles': 1,
-        'reaches': 1,
-        'doubles': 2,
-        'triples': 3,
-        'homers': 4,
-        'hits a grand slam': 4,
-        'hits a home run': 4,
-        'grounds into a force out': 1,
-        'grounds into a double play': 1,
-        "grounds into a fielder's choice": 1,
-    }
-    advance = bases_to_advance.get(action, 0)
-
-    if advance == 0:
-        return
-
-    # Move runners starting from 3rd base to 1st base
-    for base in [Base.THIRD, Base.SECOND, Base.FIRST]:
-        runner_id = game_state.bases_occupied.get(base, -1)
-        if runner_id != -1:
-            new_base_index = base.value + advance
-            if new_base_index >= 4:
-                # Runner scores
-                game_state.bases_occupied[base] = -1
-                logging.info(f"Runner (ID: {runner_id}) scored from {base.name.lower()}.")
-            else:
-                new_base = Base(new_base_index)
-                if game_state.bases_occupied.get(new_base, -1) == -1:
-                    game_state.bases_occupied[base] = -1
-                    game_state.bases_occupied[new_base] = runner_id
-                    logging.info(
-                        f"Runner (ID: {runner_id}) advanced from {base.name.lower()} to {new_base.name.lower()}.")
-                else:
-                    logging.info(
-                        f"Error: Base {new_base.name.lower()} already occupied when moving runner (ID: {runner_id}).")
-
-
-def occupy_base(base, player_id, game_state):
-    if game_state.bases_occupied.get(base, -1) == -1:
-        game_state.bases_occupied[base] = player_id
-    else:
-        logging.info(f"Error: Base {base.name.lower()} already occupied when trying to place player (ID: {player_id}).")
-
-
-def score_runner(player_id, game_state):
-    # Remove runner from bases if present
-    for base in [Base.FIRST, Base.SECOND, Base.THIRD]:
-        if game_state.bases_occupied.get(base, -1) == player_id:
-            game_state.bases_occupied[base] = -1
-            break
-    logging.info(f"Player (ID: {player_id}) scored.")
-
-
-def get_runner_current_base(runner_id, game_state):
-    for base, occupant in game_state.bases_occupied.items():
-        if occupant == runner_id:
-            return base
-    return None
+            actions.append(MoveRunner(runner_id, new_base, occupy=True))
+    return actions
 
 
 def get_base_enum(base_str):
@@ -467,19 +386,20 @@ def get_base_enum(base_str):
     else:
         return None
 
-def handle_balk(description, game_state, player_map):
+def parse_balk(description, player_map):
     if "on a balk" not in description:
         logging.info(f"Error: Not a valid balk event description.")
-        return
+        return []
 
     if "batting," in description:
         parts = description.split("batting, ")[1]
     else:
         logging.info(f"Error: Malformed balk description.")
-        return
+        return []
 
     base_runner_info = parts.split(" on a balk. ")
 
+    actions = []
     for runner_info in base_runner_info:
         runner_info = runner_info.strip()
 
@@ -492,16 +412,6 @@ def handle_balk(description, game_state, player_map):
                 logging.info(f"Error: Player '{runner_name}' not found in player map.")
                 continue
 
-            current_base = None
-            for base, occupant in game_state.bases_occupied.items():
-                if occupant == player_id:
-                    current_base = base
-                    break
-
-            if not current_base:
-                logging.info(f"Error: Player '{runner_name}' (ID: {player_id}) not found on any base.")
-                continue
-
             if "2nd" in base_movement:
                 new_base = Base.SECOND
             elif "3rd" in base_movement:
@@ -512,20 +422,15 @@ def handle_balk(description, game_state, player_map):
                 logging.info(f"Error: Unrecognized base movement for '{runner_name}': '{base_movement}'")
                 continue
 
-            if new_base:
-                game_state.bases_occupied[current_base] = -1
-                game_state.bases_occupied[new_base] = player_id
-                logging.info(f"Player '{runner_name}' (ID: {player_id}) moved to {new_base.name.lower()}.")
-            else:
-                game_state.bases_occupied[current_base] = -1
-                logging.info(f"Player '{runner_name}' (ID: {player_id}) scored.")
+            actions.append(MoveRunner(player_id, new_base))
+    return actions
 
 
-def handle_offensive_sub(description, game_state, player_map):
+def parse_offensive_sub(description, player_map):
     match = re.search(r'(?:runner|hitter)\s+(.+?)\s+replaces\s+(.+?)$', description, re.IGNORECASE)
     if not match:
         logging.info(f"Error: Could not parse player names from description: {description}")
-        return
+        return []
 
     new_player_name = process_name(match.group(1).strip())
     old_player_name = process_name(match.group(2).strip())
@@ -536,35 +441,27 @@ def handle_offensive_sub(description, game_state, player_map):
     if not new_player_id or not old_player_id:
         logging.info(
             f"Warning: Could not find one or both players in the player map: '{new_player_name}', '{old_player_name}'")
-        return
-
-    team = 'away' if game_state.half == Half.TOP else 'home'
-
-    if team == 'away':
-        if(game_state.away_pitcher == old_player_id):
-            game_state.away_pitcher = None
-            logging.info(f"found an offensive sub where the person being subbed out is the pitcher")
-    else:
-        if game_state.home_pitcher == old_player_id:
-            game_state.home_pitcher = None
-            logging.info(f"found an offensive sub where the person being subbed out is the pitcher")
-
-    # We know the player is replaced in the batting order
-    _replace_in_batting_order(game_state, team, old_player_id, new_player_id)
-    # But we remain agnostic about who is going to fill the field position and wait til the next defensive switch
-    _replace_position_player(game_state, team, old_player_id, None)
-
+        return []
+
+    actions = [
+        ClearPitcherIf(BATTING, old_player_id),
+        # We know the player is replaced in the batting order
+        ReplaceInLineup(BATTING, old_player_id, new_player_id),
+        # But we remain agnostic about who is going to fill the field position and wait til the next defensive switch
+        ReplaceFielder(BATTING, old_player_id, None),
+    ]
 
     if "Pinch-runner" in description:
-        _replace_on_base(game_state, old_player_id, new_player_id)
+        actions.append(ReplaceOnBase(old_player_id, new_player_id))
         logging.info(
             f"Pinch-runner: {new_player_name} (ID: {new_player_id}) replaces {old_player_name} (ID: {old_player_id}) on the base paths.")
     else:
         logging.info(
             f"Pinch-hitter: {new_player_name} (ID: {new_player_id}) replaces {old_player_name} (ID: {old_player_id}) in the batting order.")
+    return actions
 
 
-def handle_defensive_switch(description, game_state, player_map):
+def parse_defensive_switch(description, player_map):
     # Determine the format of the description and extract relevant details
     if "remains in the game as" in description:
         # Format: "player_name remains in the game as the new_position"
@@ -584,54 +481,48 @@ def handle_defensive_switch(description, game_state, player_map):
 
     if not player_id:
         logging.info(f"Warning: Player '{player_name}' not found in the player map.")
-        return
-
-    # Determine the team based on the game state
-    team = 'home' if game_state.half == Half.TOP else 'away'
+        return []
 
     # Map the to_position name to the corresponding FieldPosition enum
     to_position = _map_position_name_to_enum(to_position_name)
     logging.info(f"to_position: to_position")
     if to_position is None:
         logging.info(f"Warning: Could not map '{to_position_name}' to a valid field position.")
-        return
+        return []
 
     # We should move the player to the to position
-    game_state.set_position_player(team, to_position, player_id)
-    # Update the defensive positions in the game state using set_position_player method
+    actions = [SetFielder(FIELDING, to_position, player_id)]
     if from_position:
-        current_player_in_from_position = game_state.get_position_player(team, from_position)
-        if current_player_in_from_position == player_id:
-            # Clear the from position if the player is indeed occupying it
-            game_state.set_position_player(team, from_position, None)
+        # Clear the from position if the player is indeed occupying it
+        actions.append(ClearFielderIf(FIELDING, from_position, player_id))
+    return actions
 
 
-def handle_defensive_sub(description, game_state, player_map):
+def parse_defensive_sub(description, player_map):
     new_player_name, old_player_name, target_position = _extract_from_defensive_sub_desc(description)
     new_player_id = get_closest_player_id(new_player_name, player_map)
     old_player_id = get_closest_player_id(old_player_name, player_map)
     target_position = _map_position_name_to_enum(target_position)
 
-    team = 'home' if game_state.half == Half.TOP else 'away'
-
+    actions = []
     if new_player_id:
         if target_position:
             # Update the position in the game state
-            game_state.set_position_player(team, target_position, new_player_id)
-            logging.info(f"Placed {new_player_name} (ID: {new_player_id}) at {target_position} for team {team}.")
+            actions.append(SetFielder(FIELDING, target_position, new_player_id))
         else:
             logging.info(f"Warning: Unable to determine the target position for '{new_player_name}'.")
 
         # Update the batting order by replacing the old player with the new player
         if old_player_id:
-            _replace_in_batting_order(game_state, team, old_player_id, new_player_id)
+            actions.append(ReplaceInLineup(FIELDING, old_player_id, new_player_id))
         else:
             logging.info(f"Warning: Unable to find old player '{old_player_name}' in player map.")
     else:
         logging.info(f"Warning: Unable to find new player '{new_player_name}' in player map.")
+    return actions
 
 
-def handle_pitching_sub(description, game_state, player_map):
+def parse_pitching_sub(description, player_map):
     if "enters the batting order" in description:
         parts = description.split()
         new_player_name = process_name(' '.join(parts[1:3]))
@@ -646,17 +537,15 @@ def handle_pitching_sub(description, game_state, player_map):
 
         if not new_player_id or not old_player_id:
             logging.info(f"Warning: Player '{new_player_name}' or '{old_player_name}' not found in the player map.")
-            return
+            return []
 
-        team = 'home' if game_state.half == Half.TOP else 'away'
-        _replace_in_batting_order(game_state, team, old_player_id, new_player_id, batting_position)
-        return
+        return [ReplaceInLineup(FIELDING, old_player_id, new_player_id, batting_position)]
 
     match = re.match(
         r"Pitching Change:\s*(.+?)\s+replaces\s+(.+?)(?:,\s*batting\s+(\d+)(?:th|st|nd|rd))?(?:,\s*replacing.*)?\.?$",
         description)
     if not match:
-        return
+        return []
 
     new_pitcher_name = process_name(match.group(1))
     old_pitcher_name = process_name(match.group(2))
@@ -666,14 +555,14 @@ def handle_pitching_sub(description, game_state, player_map):
     old_pitcher_id = get_closest_player_id(old_pitcher_name, player_map)
 
     if not new_pitcher_id or not old_pitcher_id:
-        return
+        return []
 
-    team = 'home' if game_state.half == Half.TOP else 'away'
-    _replace_position_player(game_state, team, old_pitcher_id, new_pitcher_id)
+    actions = [ReplaceFielder(FIELDING, old_pitcher_id, new_pitcher_id)]
 
     # If a batting position is specified, update the batting order
     if batting_position:
-        _replace_in_batting_order(game_state, team, old_pitcher_id, new_pitcher_id, batting_position)
+        actions.append(ReplaceInLineup(FIELDING, old_pitcher_id, new_pitcher_id, batting_position))
+    return actions
 
 
 def _map_position_name_to_enum(position_name):
@@ -702,9 +591,9 @@ def _map_position_name_to_enum(position_name):
     return position_mapping.get(cleaned_position_name)
 
 
-def handle_pickoff_error_1b(description, game_state, player_map):
-    logging.info(f"Handling Pickoff Error at 1B")
-    scored_players = []
+def _parse_pickoff_error(base, description, player_map):
+    logging.info(f"Handling Pickoff Error at {base}")
+    scorer_ids = []
 
     if "scores" in description:
         for player_name in player_map.values():
@@ -713,88 +602,31 @@ def handle_pickoff_error_1b(description, game_state, player_map):
                 if not player_id:
                     logging.info(f"Warning: Player '{player_name}' not found in player map.")
                     continue
-                for base, occupant in game_state.bases_occupied.items():
-                    if occupant == player_id:
-                        game_state.bases_occupied[base] = -1
-                        scored_players.append(player_id)
-                        logging.info(f"Player '{player_name}' (ID: {player_id}) scored.")
-                        break
+                scorer_ids.append(player_id)
 
-    runner_on_first = game_state.bases_occupied.get(Base.FIRST, -1)
-    runner_on_second = game_state.bases_occupied.get(Base.SECOND, -1)
+    return [PickoffError(base, tuple(scorer_ids))]
 
-    if runner_on_first != -1 and runner_on_first not in scored_players:
-        game_state.bases_occupied[Base.FIRST] = -1
-        game_state.bases_occupied[Base.SECOND] = runner_on_first
-        logging.info(f"Runner on 1st (Player ID: {runner_on_first}) advanced to 2nd.")
 
-    if runner_on_second != -1 and runner_on_second not in scored_players:
-        game_state.bases_occupied[Base.SECOND] = -1
-        game_state.bases_occupied[Base.THIRD] = runner_on_second
-        logging.info(f"Runner on 2nd (Player ID: {runner_on_second}) advanced to 3rd.")
+def parse_pickoff_error_1b(description, player_map):
+    return _parse_pickoff_error('1B', description, player_map)
 
 
-def handle_pickoff_error_2b(description, game_state, player_map):
-    logging.info(f"Handling Pickoff Error at 2B")
-    scored_players = []
+def parse_pickoff_error_2b(description, player_map):
+    return _parse_pickoff_error('2B', description, player_map)
 
-    if "scores" in description:
-        for player_name in player_map.values():
-            if process_name(player_name) in description.lower():
-                player_id = get_closest_player_id(player_name, player_map)
-                if not player_id:
-                    logging.info(f"Warning: Player '{player_name}' not found in player map.")
-                    continue
-                for base, occupant in game_state.bases_occupied.items():
-                    if occupant == player_id:
-                        game_state.bases_occupied[base] = -1
-                        scored_players.append(player_id)
-                        logging.info(f"Player '{player_name}' (ID: {player_id}) scored.")
-                        break
-
-    runner_on_second = game_state.bases_occupied.get(Base.SECOND, -1)
-    runner_on_first = game_state.bases_occupied.get(Base.FIRST, -1)
-
-    if runner_on_second != -1 and runner_on_second not in scored_players:
-        game_state.bases_occupied[Base.SECOND] = -1
-        game_state.bases_occupied[Base.THIRD] = runner_on_second
-        logging.info(f"Runner on 2nd (Player ID: {runner_on_second}) advanced to 3rd.")
-
-    if runner_on_first != -1 and runner_on_first not in scored_players:
-        game_state.bases_occupied[Base.FIRST] = -1
-        game_state.bases_occupied[Base.SECOND] = runner_on_first
-        logging.info(f"Runner on 1st (Player ID: {runner_on_first}) advanced to 2nd.")
-
-
-def handle_pickoff_error_3b(description, game_state, player_map):
-    logging.info(f"Handling Pickoff Error at 3B")
-    scored_players = []
-
-    if "scores" in description:
-        for player_name in player_map.values():
-            if process_name(player_name) in description.lower():
-                player_id = get_closest_player_id(player_name, player_map)
-                if not player_id:
-                    logging.info(f"Warning: Player '{player_name}' not found in player map.")
-                    continue
-                for base, occupant in game_state.bases_occupied.items():
-                    if occupant == player_id:
-                        game_state.bases_occupied[base] = -1
-                        scored_players.append(player_id)
-                        logging.info(f"Player '{player_name}' (ID: {player_id}) scored.")
-                        break
 
+def parse_pickoff_error_3b(description, player_map):
     # No further base advancements as the pickoff error occurred at 3B
-    # and any runners on bases would have been handled above
+    return _parse_pickoff_error('3B', description, player_map)
 
 
-def handle_pickoff_caught_stealing(description, game_state, player_map):
+def parse_pickoff_caught_stealing(description, player_map):
     logging.info(f"Handling Pickoff Caught Stealing")
 
     # Check if "picked off" occurs exactly once
     if description.lower().count("picked off") != 1:
         logging.info(f"Error: 'Picked off' appears more than once in the description.")
-        return
+        return []
 
     # Extract the player's name who was picked off
     try:
@@ -802,43 +634,35 @@ def handle_pickoff_caught_stealing(description, game_state, player_map):
         player_name = process_name(player_name_part)
     except IndexError:
         logging.info(f"Error: Could not find player's name in the description.")
-        return
+        return []
 
     # Resolve the player ID using the player map
     player_id = get_closest_player_id(player_name, player_map)
     if not player_id:
         logging.info(f"Warning: Player '{player_name}' not found in the player map.")
-        return
+        return []
 
     # Determine which base the player was attempting to steal based on the description
     if "stealing 2nd base" in description.lower():
         base_to_check = Base.FIRST
-        target_base = "2B"
     elif "stealing 3rd base" in description.lower():
         base_to_check = Base.SECOND
-        target_base = "3B"
     elif "stealing home" in description.lower():
         base_to_check = Base.THIRD
-        target_base = "Home"
     else:
         logging.info(f"Error: Could not determine which base the player was attempting to steal.")
-        return
+        return []
 
-    # Check if the player is on the expected base and update the game state
-    runner_on_base = game_state.bases_occupied.get(base_to_check, -1)
-    if runner_on_base == player_id:
-        game_state.bases_occupied[base_to_check] = -1
-        logging.info(f"Player '{player_name}' (ID: {player_id}) was picked off and caught stealing {target_base}.")
-    else:
-        logging.info(f"Warning: No player found on {base_to_check.name} to pick off (Expected Player ID: {player_id}).")
+    # The player is only removed if they are on the expected base
+    return [ClearBaseIf(base_to_check, player_id)]
 
 
-def handle_caught_stealing(description, game_state, player_map):
+def parse_caught_stealing(description, player_map):
     logging.info(f"Handling Caught Stealing")
     # Check if "caught stealing" occurs exactly once
     if description.lower().count("caught stealing") != 1:
         logging.info(f"Warning: 'Caught stealing' appears more than once in the description.")
-        return
+        return []
 
     # Extract the player's name based on the format of the description
     try:
@@ -853,100 +677,30 @@ def handle_caught_stealing(description, game_state, player_map):
         player_name = process_name(player_name_part)
     except IndexError:
         logging.info(f"Warning: Could not find player's name in the description.")
-        return
+        return []
 
     # Resolve the player ID using the player map
     player_id = get_closest_player_id(player_name, player_map)
     if not player_id:
         logging.info(f"Warning: Player '{player_name}' not found in the player map.")
-        return
+        return []
 
     # Determine which base the player was attempting to steal based on the description
     if "2nd base" in description.lower():
         base_to_check = Base.FIRST
-        target_base = "2B"
     elif "3rd base" in description.lower():
         base_to_check = Base.SECOND
-        target_base = "3B"
     elif "home" in description.lower():
         base_to_check = Base.THIRD
-        target_base = "Home"
     else:
         logging.info(f"Warning: Could not determine which base the player was attempting to steal.")
-        return
-
-    # Check if the player is on the expected base and update the game state
-    runner_on_base = game_state.bases_occupied.get(base_to_check, -1)
-    if runner_on_base == player_id:
-        game_state.bases_occupied[base_to_check] = -1
-        logging.info(f"Player '{player_name}' (ID: {player_id}) was caught stealing {target_base}.")
-    else:
-        logging.info(f"Warning: No player found on {base_to_check.name} to be caught stealing (Expected Player ID: {player_id}).")
-        # TODO: there are rare cases when statcast is wrong so we don't have anyone on base to steal
-        # we can see what the description implies, and create a decision point that we return from this function
-        # and then in our process loop if an event handler returns something that means we should overwrite the previous
-        # decision point with our corrected one
-
-def _replace_on_base(game_state, old_player_id, new_player_id):
-    for base, occupant in game_state.bases_occupied.items():
-        if occupant == old_player_id:
-            game_state.bases_occupied[base] = new_player_id
-            logging.info(f"Player {new_player_id} replaces {old_player_id} on {base.name}.")
-            return
-    logging.info(f"Warning: Could not find {old_player_id} on any base to replace.")
-
-
-def _replace_position_player(game_state, team, old_player_id, new_player_id):
-    logging.info(f"entered replace position player/pitcher function: ")
-    logging.info(f" team: team")
-    logging.info(f" old_player_id: old_player_id")
-    logging.info(f" new_player_id: new_player_id")
-
-    # Determine which team's position players and flags we are working with
-    if team == 'home':
-        position_players = game_state.home_position_players
-        current_pitcher = game_state.home_pitcher
-    elif team == 'away':
-        position_players = game_state.away_position_players
-        current_pitcher = game_state.away_pitcher
-    else:
-        raise ValueError("Team must be 'home' or 'away'")
+        return []
 
-    logging.info(f"current_pitcher: {current_pitcher}")
-
-
-    # Replace a position player in the field
-    for position, player_id in position_players.items():
-        if player_id == old_player_id:
-            logging.info(f"Replacing {old_player_id} at {position} with {new_player_id} for {team}")
-            game_state.set_position_player(team, position, new_player_id)
-            return
-
-    # If the old player is the pitcher, replace the pitcher
-    if old_player_id == current_pitcher or current_pitcher is None:
-        logging.info(f"Replacing pitcher for {team}: {old_player_id} with {new_player_id}")
-        if team == 'home':
-            game_state.home_pitcher = new_player_id
-        else:
-            game_state.away_pitcher = new_player_id
-
-
-def _replace_in_batting_order(game_state, team, old_player_id, new_player_id, batting_position=None):
-    lineup = game_state.home_lineup if team == 'home' else game_state.away_lineup
-
-    if batting_position is not None:
-        # If a batting position is specified, insert the new player at that position
-        lineup[batting_position - 1] = new_player_id
-        logging.info(f"Inserted {new_player_id} into the {team} batting order at position {batting_position}.")
-    else:
-        # Find the old player in the batting lineup and replace them with the new player
-        for idx, player_id in enumerate(lineup):
-            if player_id == old_player_id:
-                lineup[idx] = new_player_id
-                logging.info(f"Replaced {old_player_id} with {new_player_id} in the {team} batting order at position {idx + 1}.")
-                return
-
-        logging.info(f"Warning: Could not find {old_player_id} in the {team} batting order to replace with {new_player_id}.")
+    # TODO: there are rare cases when statcast is wrong so we don't have anyone on base to steal
+    # we can see what the description implies, and create a decision point that we return from this function
+    # and then in our process loop if an event handler returns something that means we should overwrite the previous
+    # decision point with our corrected one
+    return [ClearBaseIf(base_to_check, player_id)]
 
 
 def _extract_from_defensive_sub_desc(description):
@@ -984,11 +738,13 @@ def _extract_from_defensive_sub_desc(description):
     return new_player_name, old_player_name, target_position
 
 
-def remove_middle_initials(name):
-    # Pattern to match names with one or more middle initials (case insensitive)
-    pattern = r'^(\w+)\s+(?:[A-Za-z]\.?\s+)+(\w+)$'
+# Pattern to match names with one or more middle initials (case insensitive)
+MIDDLE_INITIALS_PATTERN = re.compile(r'^(\w+)\s+(?:[A-Za-z]\.?\s+)+(\w+)$')
+
 
-    match = re.match(pattern, name)
+@lru_cache(maxsize=65536)
+def remove_middle_initials(name):
+    match = MIDDLE_INITIALS_PATTERN.match(name)
     if match:
         # If the pattern matches, return the name without middle initials
         return f"{match.group(1)} {match.group(2)}"
@@ -997,6 +753,61 @@ def remove_middle_initials(name):
         return name
 
 
+def _handler(parse, name):
+    """Wrap a parser as an event handler that applies its actions to the game state straight away"""
+    def handle(description, game_state, player_map):
+        apply_actions(parse(description, player_map), game_state)
+    handle.__name__ = name
+    return handle
+
+
+handle_stolen_base = _handler(parse_stolen_base, 'handle_stolen_base')
+handle_wild_pitch = _handler(parse_wild_pitch, 'handle_wild_pitch')
+handle_passed_ball = _handler(parse_passed_ball, 'handle_passed_ball')
+attempt_base_update = _handler(parse_base_update, 'attempt_base_update')
+handle_balk = _handler(parse_balk, 'handle_balk')
+handle_offensive_sub = _handler(parse_offensive_sub, 'handle_offensive_sub')
+handle_defensive_switch = _handler(parse_defensive_switch, 'handle_defensive_switch')
+handle_defensive_sub = _handler(parse_defensive_sub, 'handle_defensive_sub')
+handle_pitching_sub = _handler(parse_pitching_sub, 'handle_pitching_sub')
+handle_pickoff_error_1b = _handler(parse_pickoff_error_1b, 'handle_pickoff_error_1b')
+handle_pickoff_error_2b = _handler(parse_pickoff_error_2b, 'handle_pickoff_error_2b')
+handle_pickoff_error_3b = _handler(parse_pickoff_error_3b, 'handle_pickoff_error_3b')
+handle_pickoff_caught_stealing = _handler(parse_pickoff_caught_stealing, 'handle_pickoff_caught_stealing')
+handle_caught_stealing = _handler(parse_caught_stealing, 'handle_caught_stealing')
+
+
+# Dictionary mapping event types to the parsers that turn their descriptions into actions
+event_parsers = {
+    "Stolen Base 2B": parse_stolen_base,
+    "Stolen Base 3B": parse_stolen_base,
+    "Stolen Base Home": parse_stolen_base,
+    "Wild Pitch": parse_wild_pitch,
+    "Passed Ball": parse_passed_ball,
+    "Balk": parse_balk,
+    "Pickoff Error 1B": parse_pickoff_error_1b,
+    "Pickoff Error 2B": parse_pickoff_error_2b,
+    "Pickoff Error 3B": parse_pickoff_error_3b,
+    "Pitching Substitution": parse_pitching_sub,
+    "Defensive Sub": parse_defensive_sub,
+    "Defensive Switch": parse_defensive_switch,
+    "Offensive Substitution": parse_offensive_sub,
+    "Pickoff Caught Stealing 2B": parse_pickoff_caught_stealing,
+    "Pickoff Caught Stealing 3B": parse_pickoff_caught_stealing,
+    "Pickoff Caught Stealing Home": parse_pickoff_caught_stealing,
+    "Caught Stealing 2B": parse_caught_stealing,
+    "Caught Stealing 3B": parse_caught_stealing,
+    "Caught Stealing Home": parse_caught_stealing,
+    "AttemptBaseUpdate": parse_base_update
+}
+
+
+def parse_event(event_type, description, player_map):
+    """The actions an event applies, parsing unknown event types as a generic base update"""
+    parse = event_parsers.get(event_type, parse_base_update)
+    return parse(description, player_map)
+
+
 # Dictionary mapping event types to their handler functions
 event_handlers = {
     "Stolen Base 2B": handle_stolen_base,
@@ -0,0 +1,193 @@
+import argparse
+import json
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, TypedDict
+
+try:
+    # orjson parses scraped games in less than half the time json takes. It's optional, json is used without it
+    import orjson
+    _parse = orjson.loads
+except ImportError:
+    orjson = None
+    _parse = json.loads
+
+# The scraped game format, shared by the scraper and everything that replays its output. Only the standard
+# library is imported here, so the replay side never loads the browser stack.
+
+# Version of the layout the scraper writes. Files without a schema_version are version 1
+SCHEMA_VERSION = 2
+ID_LISTS = ["away_lineup", "away_sub_ins", "away_bullpen", "home_lineup", "home_sub_ins", "home_bullpen"]
+
+# Columns of a decision CSV: the required columns, then one column per lineup slot and per field position for
+# both Home and Away teams. Kept here rather than in main, so reading decision rows doesn't import the replay engine.
+DECISION_COLUMNS = [
+    "Event_Type", "Is_Decision", "Inning", "Half", "At_Bat", "Score_Deficit", "Outs",
+    "Third_Base", "Second_Base", "First_Base", "Home_Pitcher", "Away_Pitcher"
+] + [
+    f"{team}_Lineup_{i}" for i in range(1, 10) for team in ("Home", "Away")
+] + [
+    f"{team}_{pos}" for pos in ["DH", "C", "1B", "2B", "3B", "SS", "LF", "CF", "RF"] for team in ("Home", "Away")
+]
+
+
+class EventRecord(TypedDict):
+    type: Optional[str]
+    description: str
+    # Runs by team abbreviation after the event, when it scored
+    score_update: Optional[dict]
+    outs_update: Optional[int]
+    atbat_index: int
+
+
+class InningRecord(TypedDict):
+    # Like "Top 1st"
+    inning: str
+    events: list
+
+
+@dataclass
+class GameData:
+    """Container for scraped game data. Player ids are ints, also as the keys of the player and position maps"""
+    away_lineup: list
+    away_sub_ins: list
+    away_player_map: dict
+    away_bullpen: list
+    away_position_map: dict
+    home_lineup: list
+    home_sub_ins: list
+    home_player_map: dict
+    home_bullpen: list
+    home_position_map: dict
+    # InningRecords, each with its EventRecords
+    game_summary: list
+    game_pk: str
+    home_abbr: str
+    away_abbr: str
+    schema_version: int = SCHEMA_VERSION
+
+
+def _migrate_from_1(document: dict) -> dict:
+    """Version 1 lineups and bullpens could hold ids as strings; version 2 ids are always ints"""
+    for key in ID_LISTS:
+        document[key] = [int(player_id) for player_id in document[key]]
+    document["schema_version"] = 2
+    return document
+
+
+# Upgrades a document of each version to the next one
+MIGRATIONS = {1: _migrate_from_1}
+
+
+def decode_game_data(document: dict) -> GameData:
+    """
+    A GameData from a parsed scraped game, migrated to the current schema. JSON can only have string keys, so
+    the player and position maps get their int keys back here, once, rather than in every consumer. Event
+    types and innings are interned, so the handful of distinct names is shared by every event of a season.
+    Keys outside the schema, like a live feed's status, are ignored.
+    """
+    version = document.get("schema_version", 1)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Game {document.get('game_pk')} has schema version {version}, this code reads up to "
+                         f"{SCHEMA_VERSION}")
+    while version < SCHEMA_VERSION:
+        document = MIGRATIONS[version](document)
+        version = document["schema_version"]
+
+    intern = sys.intern
+    for inning in document["game_summary"]:
+        inning["inning"] = intern(inning["inning"])
+        for event in inning["events"]:
+            if event["type"] is not None:
+                event["type"] = intern(event["type"])
+    return GameData(
+        away_lineup=document["away_lineup"],
+        away_sub_ins=document["away_sub_ins"],
+        away_player_map={int(player_id): name for player_id, name in document["away_player_map"].items()},
+        away_bullpen=document["away_bullpen"],
+        away_position_map={int(player_id): position for player_id, position in document["away_position_map"].items()},
+        home_lineup=document["home_lineup"],
+        home_sub_ins=document["home_sub_ins"],
+        home_player_map={int(player_id): name for player_id, name in document["home_player_map"].items()},
+        home_bullpen=document["home_bullpen"],
+        home_position_map={int(player_id): position for player_id, position in document["home_position_map"].items()},
+        game_summary=document["game_summary"],
+        game_pk=str(document["game_pk"]),
+        home_abbr=intern(document["home_abbr"]),
+        away_abbr=intern(document["away_abbr"]),
+    )
+
+
+def load_game_data(game_path, parse=None) -> GameData:
+    with open(game_path, "rb") as f:
+        return decode_game_data((parse or _parse)(f.read()))
+
+
+def is_game_data_complete(game_path: Path) -> bool:
+    """Check if existing game data is complete (has non-empty lineups)."""
+    try:
+        with open(game_path, 'r') as f:
+            game_data = json.load(f)
+            return len(game_data.get('away_lineup', [])) > 0 and len(game_data.get('home_lineup', [])) > 0
+    except (json.JSONDecodeError, FileNotFoundError):
+        return False
+
+
+def _legacy_load(game_path) -> tuple:
+    """How a game was read before decode_game_data: GameData(**json.load), then the int conversions that
+    initial_game_state and player_maps made on every replay"""
+    with open(game_path) as f:
+        game_data = GameData(**json.load(f))
+    lists = [[int(player_id) if isinstance(player_id, str) else player_id for player_id in getattr(game_data, key)]
+             for key in ID_LISTS]
+    maps = [{int(k) if isinstance(k, str) else k: v for k, v in getattr(game_data, key).items()}
+            for key in ["home_player_map", "away_player_map", "home_position_map", "away_position_map"]]
+    return game_data, lists, maps
+
+
+def _retained_mb(load, paths) -> float:
+    import tracemalloc
+
+    tracemalloc.start()
+    games = [load(path) for path in paths]
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del games
+    return retained / 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time decoding every scraped game against the previous path")
+    parser.add_argument("--scraped-dir", default="scraped_games")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each path, the fastest is reported")
+    args = parser.parse_args()
+
+    paths = sorted(Path(args.scraped_dir).glob("game_*.json"))
+    paths_to_time = [("GameData(**json.load) + int conversions", _legacy_load),
+                     ("decode_game_data with json", lambda path: load_game_data(path, json.loads))]
+    if orjson is not None:
+        paths_to_time.append(("decode_game_data with orjson", load_game_data))
+    for name, load in paths_to_time:
+        runs = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for path in paths:
+                load(path)
+            runs.append(time.perf_counter() - start)
+        print(f"{name}: {len(paths)} games in {min(runs):.3f}s ({min(runs) / len(paths) * 1e6:.0f} us per game), "
+              f"{_retained_mb(load, paths):.1f} MB held for all of them")
+
+    mismatched = []
+    for path in paths:
+        legacy, lists, maps = _legacy_load(path)
+        decoded = load_game_data(path)
+        same = (lists == [getattr(decoded, key) for key in ID_LISTS]
+                and maps == [decoded.home_player_map, decoded.away_player_map, decoded.home_position_map,
+                             decoded.away_position_map]
+                and legacy.game_summary == decoded.game_summary and legacy.game_pk == decoded.game_pk)
+        if not same:
+            mismatched.append(path.name)
+    print(f"{len(paths) - len(mismatched)} of {len(paths)} games decode to the same values"
+          + (f", mismatched: {', '.join(mismatched[:10])}" if mismatched else ""))
@@ -25,16 +25,195 @@ class FieldPosition(Enum):
 
 
 
+# Marks a dict key or attribute that didn't exist before a journaled change
+_MISSING = object()
+# Stands for the whole contents of a tracked container, journaled by changes that add or remove items
+_CONTENTS = object()
+
+
+def _raw_get(target, key):
+    if key is _CONTENTS:
+        return list(target) if isinstance(target, list) else dict(target)
+    if isinstance(target, GameState):
+        return getattr(target, key, _MISSING)
+    if isinstance(target, dict):
+        return dict.get(target, key, _MISSING)
+    return target[key]
+
+
+def _raw_set(target, key, value):
+    """Apply an undo or redo without journaling it again"""
+    if isinstance(target, GameState):
+        if value is _MISSING:
+            object.__delattr__(target, key)
+        else:
+            object.__setattr__(target, key, value)
+    elif key is _CONTENTS:
+        if isinstance(target, list):
+            list.__setitem__(target, slice(None), value)
+        else:
+            dict.clear(target)
+            dict.update(target, value)
+    elif isinstance(target, TrackedDict):
+        if value is _MISSING:
+            dict.__delitem__(target, key)
+        else:
+            dict.__setitem__(target, key, value)
+    elif isinstance(target, TrackedList):
+        list.__setitem__(target, key, value)
+    else:
+        target[key] = value
+
+
+class TrackedDict(dict):
+    """
+    A GameState dict that journals its changes while the state has a checkpoint open. Assignments are
+    journaled by key, removals by the whole contents so a rollback keeps the order of the keys.
+    """
+    __slots__ = ('owner',)
+
+    def __setitem__(self, key, value):
+        if self.owner._journal is not None:
+            self.owner.record(self, key)
+        dict.__setitem__(self, key, value)
+
+    def _record_contents(self):
+        if self.owner._journal is not None:
+            self.owner.record(self, _CONTENTS)
+
+    def __delitem__(self, key):
+        self._record_contents()
+        dict.__delitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._record_contents()
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        if self:
+            self._record_contents()
+        return dict.popitem(self)
+
+    def clear(self):
+        if self:
+            self._record_contents()
+        dict.clear(self)
+
+
+class TrackedList(list):
+    """
+    A GameState list that journals its changes while the state has a checkpoint open. Assigning an index is
+    journaled by index, anything that can change the length or the order by the whole contents.
+    """
+    __slots__ = ('owner',)
+
+    def __setitem__(self, index, value):
+        if self.owner._journal is not None:
+            self.owner.record(self, _CONTENTS if isinstance(index, slice) else index)
+        list.__setitem__(self, index, value)
+
+    def _record_contents(self):
+        if self.owner._journal is not None:
+            self.owner.record(self, _CONTENTS)
+
+    def __delitem__(self, index):
+        self._record_contents()
+        list.__delitem__(self, index)
+
+    def __iadd__(self, other):
+        self._record_contents()
+        return list.__iadd__(self, other)
+
+    def __imul__(self, count):
+        self._record_contents()
+        return list.__imul__(self, count)
+
+    def append(self, value):
+        self._record_contents()
+        list.append(self, value)
+
+    def extend(self, values):
+        self._record_contents()
+        list.extend(self, values)
+
+    def insert(self, index, value):
+        self._record_contents()
+        list.insert(self, index, value)
+
+    def remove(self, value):
+        self._record_contents()
+        list.remove(self, value)
+
+    def pop(self, index=-1):
+        self._record_contents()
+        return list.pop(self, index)
+
+    def clear(self):
+        self._record_contents()
+        list.clear(self)
+
+    def sort(self, *, key=None, reverse=False):
+        self._record_contents()
+        list.sort(self, key=key, reverse=reverse)
+
+    def reverse(self):
+        self._record_contents()
+        list.reverse(self)
+
+
+def _tracked(container, owner):
+    """A tracked copy of a dict or list, anything else as it is"""
+    if type(container) is dict:
+        container = TrackedDict(container)
+    elif type(container) is list:
+        container = TrackedList(container)
+    else:
+        return container
+    container.owner = owner
+    return container
+
+
+def _untracked(container):
+    if type(container) is TrackedDict:
+        return dict(container)
+    if type(container) is TrackedList:
+        return list(container)
+    return container
+
+
 class GameState:
+    """
+    The replay's view of the game. Between checkpoint() and commit() every attribute assignment and every item
+    assignment into its dicts and lists is journaled, so rollback() can rewind to a checkpoint and redo() can
+    reapply what was rewound, both in the number of changes rather than the size of the game. Outside a
+    checkpoint it is a plain object, so replays that never roll back pay nothing for the journal.
+    """
     __slots__ = ('home_abbr', 'away_abbr', 'inning', 'half', 'score_home', 'score_away', 'outs',
                  'bases_occupied', 'home_lineup', 'away_lineup',
                  'home_pitcher', 'home_sub_ins', 'away_pitcher', 'away_sub_ins',
-                 'home_position_players', 'away_position_players', 'at_bat', 'home_has_dh', 'away_has_dh', 'prev_half')
+                 'home_position_players', 'away_position_players', 'at_bat', 'home_has_dh', 'away_has_dh', 'prev_half',
+                 '_journal', '_redo')
 
     def __init__(self, home_abbr=None, away_abbr=None, inning=1, half=Half.TOP, score_home=0, score_away=0, outs=0,
                  bases_occupied=None, home_lineup=None, away_lineup=None,
                  home_pitcher=None, home_sub_ins=None, away_pitcher=None, away_sub_ins=None,
                  home_position_players=None, away_position_players=None, at_bat=1, home_has_dh=True, away_has_dh=True):
+        self._journal = None
+        self._redo = None
         self.home_abbr = home_abbr
         self.away_abbr = away_abbr
         self.inning = inning
@@ -59,6 +238,70 @@ class GameState:
         self.home_has_dh = home_has_dh
         self.away_has_dh = away_has_dh
 
+    @property
+    def journaling(self) -> bool:
+        return self._journal is not None
+
+    def checkpoint(self) -> int:
+        """Start journaling if it isn't on yet and return a token that rollback() rewinds to"""
+        if self._journal is None:
+            self._journal = []
+            self._redo = []
+            # Containers are swapped for tracked copies, so item assignments into them are journaled too
+            self._convert_containers(lambda container: _tracked(container, self))
+            self.__class__ = JournaledGameState
+        return len(self._journal)
+
+    def record(self, target, key):
+        """
+        Journal the current value of target[key] (or of the attribute key when target is the state) before it
+        is changed. Anything supporting item access can be journaled alongside the state.
+        """
+        if self._journal is None:
+            return
+        self._journal.append((target, key, _raw_get(target, key)))
+        if self._redo:
+            # A new change after a rollback starts a new timeline
+            self._redo.clear()
+
+    def rollback(self, token: int = 0) -> int:
+        """
+        Undo every change made since checkpoint() returned token. Returns the number of changes undone,
+        which is 0 when there is no checkpoint open
+        """
+        undone = 0
+        while self._journal is not None and len(self._journal) > token:
+            target, key, old_value = self._journal.pop()
+            self._redo.append((target, key, _raw_get(target, key)))
+            _raw_set(target, key, old_value)
+            undone += 1
+        return undone
+
+    def redo(self) -> int:
+        """Reapply the changes the last rollbacks undid, as long as nothing was changed since"""
+        redone = 0
+        while self._redo:
+            target, key, new_value = self._redo.pop()
+            self._journal.append((target, key, _raw_get(target, key)))
+            _raw_set(target, key, new_value)
+            redone += 1
+        return redone
+
+    def commit(self):
+        """Keep every change and stop journaling"""
+        if self._journal is None:
+            return
+        self.__class__ = GameState
+        self._convert_containers(_untracked)
+        self._journal = None
+        self._redo = None
+
+    def _convert_containers(self, convert):
+        for name in GameState.__slots__:
+            value = getattr(self, name, _MISSING)
+            if not name.startswith('_') and value is not _MISSING:
+                object.__setattr__(self, name, convert(value))
+
     def update(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
@@ -124,3 +367,13 @@ class GameState:
         }
 
 
+class JournaledGameState(GameState):
+    """What a GameState is while it has a checkpoint open: attribute assignments are journaled"""
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        if name not in ('_journal', '_redo'):
+            # Containers are copied into tracked ones, so later item assignments are seen by the journal
+            value = _tracked(value, self)
+            self.record(self, name)
+        object.__setattr__(self, name, value)
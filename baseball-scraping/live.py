@@ -0,0 +1,310 @@
+"""
+Follow a game while it is being played and write its decision rows as events appear.
+
+The feed has to be a scraped game's JSON (see scraper.py and game_data.GameData) with a status of Live or Final,
+re-served as the game goes on. Nothing turns MLB's own live feed into that layout yet, so for now the only feed
+to follow is StubFeedServer replaying a game that was already scraped.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+
+from main import GameProcessor, game_events, replay_game, DECISION_COLUMNS
+from replay_session import ReplaySession
+from game_data import GameData, decode_game_data
+
+LIVE_DIR = "live"
+# Set by the stub server on every event it serves, seconds since the epoch when the event appeared
+PUBLISHED_KEY = "published_at"
+# A failed poll is retried after the poll interval, doubling up to this many seconds while it keeps failing
+MAX_RETRY_SECONDS = 30
+
+
+def event_fingerprint(event) -> tuple:
+    return event['atbat_index'], event['type'], event['description'], event['outs_update'], event['score_update']
+
+
+def game_data_from_feed(document: dict) -> GameData:
+    """The feed is a scraped game's JSON, with anything the scraper doesn't write ignored"""
+    return decode_game_data(document)
+
+
+def fingerprints(events) -> list:
+    """(at bat, position within the at bat, content) of every event, which is how a changed play is told apart"""
+    positions = {}
+    keys = []
+    for event, _, _ in events:
+        position = positions.get(event['atbat_index'], 0)
+        positions[event['atbat_index']] = position + 1
+        keys.append((position, *event_fingerprint(event)))
+    return keys
+
+
+class LiveGame:
+    """
+    A game replayed while it is being played. Every update replays only the events that are new since the
+    last one. A play that changed, like an overturned call, is rolled back with the ReplaySession and replayed
+    with everything after it.
+    """
+
+    def __init__(self, game_data: GameData, at_bat_index: dict = None):
+        self.session = ReplaySession(game_data, at_bat_index=at_bat_index if at_bat_index is not None else {})
+        self.seen = []
+        # CSV line of every row as it was last emitted
+        self.emitted = []
+
+    def update(self, game_data: GameData) -> tuple:
+        """
+        Replay what changed in the feed. Returns the row number the emitted rows are correct up to, and the CSV
+        lines of every row from there on. The number is below the rows emitted so far when earlier rows changed.
+        """
+        events = game_events(game_data)
+        keys = fingerprints(events)
+        first_changed = next((i for i, (old, new) in enumerate(zip(self.seen, keys)) if old != new),
+                             min(len(self.seen), len(keys)))
+        settled = self._settled_rows()
+        if first_changed < len(self.session):
+            self.session.rewind(first_changed)
+            settled = min(settled, len(self.session.decisions))
+        for event, inning_number, half in events[len(self.session):]:
+            event = {key: value for key, value in event.items() if key != PUBLISHED_KEY}
+            self.session.append(event, inning_number, half)
+        self.seen = keys
+
+        lines = self.session.decisions.iloc[settled:].to_csv(header=False, index=False).splitlines()
+        # Only the first line that differs and everything after it needs to go out again
+        unchanged = next((i for i, (old, new) in enumerate(zip(self.emitted[settled:], lines)) if old != new),
+                         min(len(lines), len(self.emitted) - settled))
+        start = settled + unchanged
+        self.emitted[start:] = lines[unchanged:]
+        return start, lines[unchanged:]
+
+    def _settled_rows(self) -> int:
+        """
+        Rows that can't change anymore. A pinch-runner can replay the at bat they came in during (see
+        GameReplay.replay_pinch_runner), so the current at bat stays open.
+        """
+        at_bats = self.session.decisions["At_Bat"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, at_bats[1:] != at_bats[:-1]]) if len(at_bats) else []
+        return int(starts[-1]) if len(starts) else 0
+
+
+class LiveWriter:
+    """Writes emitted rows to a decision CSV, appending when only new rows came and rewriting on corrections"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lines = []
+        self.path.write_text(",".join(DECISION_COLUMNS) + "\n")
+
+    def __call__(self, start: int, lines: list):
+        if start == len(self.lines):
+            with open(self.path, "a") as f:
+                f.writelines(line + "\n" for line in lines)
+        else:
+            self.path.write_text("\n".join([",".join(DECISION_COLUMNS)] + self.lines[:start] + lines) + "\n")
+        self.lines[start:] = lines
+
+
+def poll(url: str, etag: str = None, timeout: float = 10) -> tuple:
+    """(document, etag) of the feed, or (None, etag) when it didn't change since etag"""
+    request = urllib.request.Request(url, headers={"If-None-Match": etag} if etag else {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.load(response), response.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None, etag
+        raise
+
+
+def retryable(error: Exception) -> bool:
+    """Whether a failed poll could succeed when tried again: the network, a timeout or a 5xx from the server"""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500
+    return isinstance(error, (urllib.error.URLError, TimeoutError, ConnectionError))
+
+
+def tail_game(url: str, emit, at_bat_index: dict = None, poll_interval: float = 1.0,
+              idle_timeout: float = 600) -> dict:
+    """
+    Poll a game feed until it says the game is final, or nothing changed for idle_timeout seconds, and emit
+    decision rows as their events appear. An event is emitted at most one poll interval plus its replay
+    after it shows up in the feed. Polls that fail with a network error, a timeout or a 5xx are retried with
+    backoff, and the error is raised once the feed has been unchanged for idle_timeout.
+    """
+    live_game = None
+    etag = None
+    latencies = []
+    stats = {"polls": 0, "unchanged_polls": 0, "failed_polls": 0, "events": 0, "rows": 0, "corrections": 0}
+    last_change = time.time()
+    first_retry_delay = max(poll_interval, 0.1)
+    retry_delay = first_retry_delay
+    while True:
+        polled_at = time.time()
+        try:
+            document, etag = poll(url, etag)
+        except Exception as e:
+            if not retryable(e) or time.time() - last_change > idle_timeout:
+                raise
+            stats["failed_polls"] += 1
+            logging.warning(f"Polling {url} failed with {type(e).__name__}: {e}, retrying in {retry_delay:.1f}s")
+            time.sleep(min(retry_delay, max(idle_timeout - (time.time() - last_change), 0)))
+            retry_delay = min(retry_delay * 2, MAX_RETRY_SECONDS)
+            continue
+        retry_delay = first_retry_delay
+        stats["polls"] += 1
+        if document is None:
+            stats["unchanged_polls"] += 1
+        else:
+            last_change = polled_at
+            game_data = game_data_from_feed(document)
+            if live_game is None:
+                live_game = LiveGame(game_data, at_bat_index)
+            events_before = len(live_game.session)
+            published = [event.get(PUBLISHED_KEY) for event, _, _ in game_events(game_data)][events_before:]
+            emitted_before = len(live_game.emitted)
+            start, lines = live_game.update(game_data)
+            if lines or start < emitted_before:
+                emit(start, lines)
+            emitted_at = time.time()
+            latencies.extend(emitted_at - (published_at or polled_at) for published_at in published)
+            stats["events"] = len(live_game.session)
+            stats["rows"] = len(live_game.emitted)
+            stats["corrections"] += start < emitted_before
+            if document.get("status") == "Final":
+                break
+        if time.time() - last_change > idle_timeout:
+            logging.warning(f"No change in {url} for {idle_timeout}s, stopping")
+            break
+        time.sleep(max(poll_interval - (time.time() - polled_at), 0))
+
+    if latencies:
+        stats["latency_median"] = float(np.median(latencies))
+        stats["latency_max"] = float(np.max(latencies))
+    stats["session"] = live_game.session if live_game else None
+    return stats
+
+
+class StubFeedServer:
+    """
+    Serves a saved game at /game/<game_pk> as if it were being played, revealing events_per_second events
+    every second from when the server starts. Answers 304 to a poll that already has the current events.
+    """
+
+    def __init__(self, game_data: GameData, events_per_second: float = 10, port: int = 0):
+        self.document = {key: value for key, value in vars(game_data).items()}
+        self.game_pk = str(game_data.game_pk)
+        self.events_per_second = events_per_second
+        self.total = len(game_events(game_data))
+        self.started = None
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != f"/game/{server.game_pk}":
+                    self.send_error(404)
+                    return
+                revealed = server.revealed()
+                etag = f'"{revealed}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = json.dumps(server.snapshot(revealed)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/game/{self.game_pk}"
+
+    def revealed(self) -> int:
+        return min(int((time.time() - self.started) * self.events_per_second) + 1, self.total)
+
+    def snapshot(self, revealed: int) -> dict:
+        """The feed with the first revealed events, each stamped with when it appeared"""
+        summary = []
+        shown = 0
+        for inning in self.document["game_summary"]:
+            if shown == revealed:
+                break
+            events = []
+            for event in inning["events"][:revealed - shown]:
+                events.append(dict(event, **{PUBLISHED_KEY: self.started + shown / self.events_per_second}))
+                shown += 1
+            summary.append(dict(inning, events=events))
+        return dict(self.document, game_summary=summary, status="Final" if revealed == self.total else "Live")
+
+    def start(self) -> "StubFeedServer":
+        self.started = time.time()
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow a game feed and write decision rows as events appear. "
+                                                 "The feed must be in the scraper's JSON layout, MLB's live feed "
+                                                 "isn't read yet, so in practice this follows --stub")
+    parser.add_argument("--url", help="feed to follow, a scraped game's JSON with a status of Live or Final")
+    parser.add_argument("--stub", help="serve this scraped game locally and follow it instead")
+    parser.add_argument("--scraped-dir", default="scraped_games")
+    parser.add_argument("--events-per-second", type=float, default=20, help="pace of the stub server")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--statcast", help="statcast pitch csv to synchronize bases with, when it has the game")
+    parser.add_argument("--output", help="decision CSV to write, by default under live/")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    stub = None
+    url = args.url
+    game_data = None
+    if args.stub:
+        game_data = GameProcessor(args.scraped_dir).load_game_data(args.stub)
+        stub = StubFeedServer(game_data, args.events_per_second).start()
+        url = stub.url
+    if url is None:
+        parser.error("give --url or --stub")
+
+    at_bat_index = {}
+    if args.statcast:
+        from pitch_index import load_pitch_index
+        game_pk = url.rstrip("/").rsplit("/", 1)[-1]
+        at_bat_index = load_pitch_index(args.statcast).game(int(game_pk)).at_bat_index()
+
+    output = args.output or Path(LIVE_DIR) / f"game_{url.rstrip('/').rsplit('/', 1)[-1]}_decisions.csv"
+    start = time.perf_counter()
+    try:
+        stats = tail_game(url, LiveWriter(output), at_bat_index, args.poll_interval)
+    finally:
+        if stub:
+            stub.stop()
+    session = stats.pop("session")
+    print(f"Followed {url} for {time.perf_counter() - start:.1f}s: " +
+          ", ".join(f"{key} {value:.3f}" if isinstance(value, float) else f"{key} {value}"
+                    for key, value in stats.items()))
+    if game_data is not None and session is not None:
+        expected = replay_game(game_data, None, at_bat_index=at_bat_index).to_csv(index=False)
+        print(f"Rows written to {output} match a replay of the final game: {Path(output).read_text() == expected}")
@@ -0,0 +1,282 @@
+import argparse
+import atexit
+import gzip
+import logging
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+LOG_DIR = Path("logs")
+LOG_FORMAT = '%(asctime)s - %(message)s'
+# A log file is archived once it grows past MAX_BYTES, and the BACKUPS newest archives are kept
+MAX_BYTES = 5 * 1024 * 1024
+BACKUPS = 10
+# Records formatted and written with one write call, at most
+BATCH_RECORDS = 1024
+
+
+class RotatingGzipWriter:
+    """
+    Appends text to a log file. Past max_bytes the file is compressed to <name>.1.log.gz, older archives move
+    up one number, and archives beyond backups are deleted.
+    """
+
+    def __init__(self, path, max_bytes: int = MAX_BYTES, backups: int = BACKUPS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+        self.rotations = 0
+
+    def archive_path(self, number: int) -> Path:
+        return self.path.with_name(f"{self.path.stem}.{number}{self.path.suffix}.gz")
+
+    def write(self, text: str):
+        self.file.write(text)
+        self.file.flush()
+        self.size = self.file.tell()
+        if self.size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.file.close()
+        if self.backups > 0:
+            self.archive_path(self.backups).unlink(missing_ok=True)
+            for number in range(self.backups - 1, 0, -1):
+                if self.archive_path(number).exists():
+                    self.archive_path(number).rename(self.archive_path(number + 1))
+            with open(self.path, "rb") as source, gzip.open(self.archive_path(1), "wb") as archive:
+                shutil.copyfileobj(source, archive)
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.size = 0
+        self.rotations += 1
+
+    def close(self):
+        self.file.close()
+
+
+class SinkHandler(logging.Handler):
+    """
+    Puts (created, level, logger name, message) of every record on a sink's queue. A tuple pickles several
+    times faster than the LogRecord a QueueHandler sends, which matters when the queue crosses processes.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__()
+        self.queue = log_queue
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+            if record.exc_info:
+                message += "\n" + logging.Formatter().formatException(record.exc_info)
+            self.queue.put((record.created, record.levelname, record.name, message))
+        except Exception:
+            self.handleError(record)
+
+
+class LogSink:
+    """
+    Log records from every process go on one queue, and a background thread in this process formats them and
+    writes them in batches. Logging in a hot loop only puts the record on the queue. Nothing in it waits on the
+    disk or the console, and the single writer keeps lines from parallel workers whole.
+    """
+
+    def __init__(self, path=None, level=logging.INFO, console: bool = True, max_bytes: int = MAX_BYTES,
+                 backups: int = BACKUPS, multiprocess: bool = True, log_format: str = LOG_FORMAT, context=None):
+        # A multiprocessing queue survives fork and can be handed to spawned workers, see attach_log_queue.
+        # It has to come from the context the workers are started with.
+        self.queue = (context or mp.get_context()).Queue() if multiprocess else queue.SimpleQueue()
+        self.level = level
+        self.writer = RotatingGzipWriter(path, max_bytes, backups) if path else None
+        self.console = sys.stderr if console else None
+        self.formatter = logging.Formatter(log_format)
+        self.records = 0
+        self.writes = 0
+        # Records a failed write kept from the file or the console, and the outputs failing right now
+        self.dropped = 0
+        self._failing = set()
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._stopped = False
+
+    def start(self) -> "LogSink":
+        self._thread.start()
+        attach_log_queue(self.queue, self.level)
+        atexit.register(self.stop)
+        return self
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_RECORDS:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            if records:
+                text = self._format(records)
+                if self.writer:
+                    self._write("log file", self.writer.write, text, len(records))
+                if self.console:
+                    self._write("console", self._write_console, text, len(records))
+                self.records += len(records)
+                self.writes += 1
+            if len(records) < len(batch):
+                return
+
+    def _write_console(self, text: str):
+        self.console.write(text)
+        self.console.flush()
+
+    def _write(self, output: str, write, text: str, records: int):
+        """
+        Write a batch to one output. When that fails, like on a full disk, the batch is dropped for that output
+        and the sink keeps draining the queue, since the workers logging to it would otherwise block on a full
+        queue. A failure is reported to stderr when an output starts failing, not for every batch.
+        """
+        try:
+            write(text)
+        except Exception as e:
+            self.dropped += records
+            if output not in self._failing:
+                self._failing.add(output)
+                print(f"Log sink could not write to the {output}, dropping its records until it can: "
+                      f"{type(e).__name__}: {e}", file=sys.__stderr__, flush=True)
+        else:
+            self._failing.discard(output)
+
+    def _format(self, records: list) -> str:
+        if self.formatter._fmt != LOG_FORMAT:
+            return "".join(self.formatter.format(logging.makeLogRecord(
+                {"created": created, "msecs": created % 1 * 1000, "levelname": level, "name": name, "msg": message}
+            )) + "\n" for created, level, name, message in records)
+        # The default format by hand, with the time text of each second made once
+        lines = []
+        second = None
+        for created, _, _, message in records:
+            if int(created) != second:
+                second = int(created)
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+            lines.append(f"{stamp},{int(created % 1 * 1000):03d} - {message}\n")
+        return "".join(lines)
+
+    def stop(self):
+        """Write what is still queued and close the file. Records logged afterwards are dropped"""
+        if self._stopped:
+            return
+        self._stopped = True
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, SinkHandler) and handler.queue is self.queue:
+                root.removeHandler(handler)
+        self.queue.put(None)
+        self._thread.join()
+        if self.writer:
+            self.writer.close()
+        if self.dropped:
+            print(f"Log sink dropped {self.dropped} records it could not write", file=sys.__stderr__, flush=True)
+
+
+def attach_log_queue(log_queue, level=logging.INFO):
+    """
+    Send this process's records to a sink's queue instead of its own handlers. Forked workers inherit
+    this from the parent; spawned ones call it in their initializer with the sink's queue.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(SinkHandler(log_queue))
+    root.setLevel(level)
+
+
+def active_log_queue():
+    """The queue this process's records go to, None when they don't go to a sink"""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, SinkHandler):
+            return handler.queue
+    return None
+
+
+def start_log_sink(path=None, level=logging.INFO, console: bool = True, **kwargs) -> LogSink:
+    return LogSink(path, level, console, **kwargs).start()
+
+
+def ensure_log_sink(path=None, level=logging.INFO, console: bool = True, **kwargs):
+    """Start a sink, unless this process already sends its records to one. Returns the new sink or None"""
+    if active_log_queue() is not None:
+        return None
+    return start_log_sink(path, level, console, **kwargs)
+
+
+def _log_records(records: int, tag: str):
+    for i in range(records):
+        logging.info(f"{tag} record {i} of {records}, padding to the length of a typical scrape line")
+
+
+def _benchmark_synchronous(path: Path, records: int) -> float:
+    root = logging.getLogger()
+    handlers = [logging.FileHandler(path), logging.StreamHandler(open(os.devnull, "w"))]
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    start = time.perf_counter()
+    _log_records(records, "sync")
+    seconds = time.perf_counter() - start
+    for handler in handlers:
+        root.removeHandler(handler)
+        handler.close()
+    return seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the log sink with synchronous handlers")
+    parser.add_argument("--records", type=int, default=100_000, help="records logged by each process")
+    parser.add_argument("--workers", type=int, default=4, help="processes logging to the sink at once")
+    parser.add_argument("--output", default="/tmp/log_sink_bench")
+    parser.add_argument("--max-bytes", type=int, default=MAX_BYTES)
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    if output.exists():
+        shutil.rmtree(output)
+    output.mkdir(parents=True)
+
+    sync_seconds = _benchmark_synchronous(output / "sync.log", args.records)
+    print(f"FileHandler + StreamHandler: {args.records} records in {sync_seconds:.2f}s "
+          f"({sync_seconds / args.records * 1e6:.1f} us per call)")
+
+    sink = LogSink(output / "sink.log", max_bytes=args.max_bytes)
+    sink.console = open(os.devnull, "w")
+    sink.start()
+    start = time.perf_counter()
+    _log_records(args.records, "main")
+    logged = time.perf_counter() - start
+    workers = [mp.Process(target=_log_records, args=(args.records, f"worker{i}")) for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    sink.stop()
+    drained = time.perf_counter() - start
+    print(f"LogSink: {args.records} records in {logged:.2f}s in the logging loop "
+          f"({logged / args.records * 1e6:.1f} us per call), {args.records * (args.workers + 1)} records from "
+          f"{args.workers + 1} processes written in {drained:.2f}s with {sink.writes} writes, "
+          f"{sink.writer.rotations} rotations")
+
+    lines = []
+    for archive in sorted(output.glob("sink.*.log.gz")):
+        with gzip.open(archive, "rt") as f:
+            lines.extend(f.read().splitlines())
+    lines.extend((output / "sink.log").read_text().splitlines())
+    whole = sum(line.endswith("typical scrape line") for line in lines)
+    print(f"{len(lines)} lines across {len(list(output.glob('sink.*.log.gz')))} archives and the live file, "
+          f"{whole} whole (archives beyond {BACKUPS} are deleted)")
@@ -1,18 +1,27 @@
+import argparse
 import logging
 import re
 import traceback
-from scraper import setup_webdriver, process_box, process_summary, GameData
+from game_data import DECISION_COLUMNS, GameData, load_game_data
 from game_state import GameState, FieldPosition
 from game_state import Half as Half
 from game_state import Base as Base
-from event_handlers import event_handlers
-from statcast_at_bats import get_at_bat_summary_for_game
-from event_handlers import process_name, get_closest_player_id
-import json
+from event_handlers import event_handlers, parse_event
+from statcast_at_bats import get_at_bat_summary_for_game, index_at_bats
+from event_handlers import process_name, get_closest_player_id, set_player_registry
+from actions import ReplaceOnBase, apply_actions
+from event_cache import load_parsed_events, player_maps, PARSED_DIR
+from pitch_index import PitchIndex, load_pitch_index, shared_index_dir
+from scheduler import estimate_costs, run_scheduled
+from sharding import SHARDS_DIR, ERROR_LOG, OUTPUT_DIRS, parse_shard, shard_dir, shard_partition, write_manifest
 import os
+import time
 from pathlib import Path
 import pandas as pd
-from tqdm import tqdm
+import profiling
+from profiling import profiled
+from metrics import StageMetrics
+from log_sink import LOG_DIR, start_log_sink
 
 class GameProcessor:
     def __init__(self, scraped_dir: str = "scraped_games"):
@@ -26,20 +35,19 @@ class GameProcessor:
         if not game_path.exists():
             raise ValueError(f"No data found for game {game_pk}")
 
-        with open(game_path) as f:
-            data = json.load(f)
-            return GameData(**data)
+        return load_game_data(game_path)
 
 
-def create_dataset(num_games: int, input_csv: str, game_id: int = None, scraped_data_dir: str = "scraped_games"):
-    game_url_df = pd.read_csv(input_csv)
-    os.makedirs('games', exist_ok=True)
-    error_log = []
-    processor = GameProcessor(scraped_data_dir)
+STATCAST_CSV = 'helper_files/statcast_reduced2023.csv'
+# Seconds a game may take on a worker before it is quarantined, the slowest real games replay in a few seconds
+GAME_TIMEOUT = 120
 
-    statcast_data = pd.read_csv('helper_files/statcast_reduced2023.csv')
+# Event counts of the replays since the last reset, including how many skipped parsing with statcast_first
+replay_metrics = StageMetrics("replay")
 
-    all_statcast_reduced = pd.read_csv('helper_files/statcast_reduced2023.csv').sort_values(
+def load_statcast_at_bats(statcast_csv: str = STATCAST_CSV) -> pd.DataFrame:
+    """Load the statcast pitch table reduced to the first pitch of every at bat"""
+    return pd.read_csv(statcast_csv).sort_values(
         ['game_pk', 'inning', 'at_bat_number', 'pitch_number']
     ).drop_duplicates(
         subset=['game_pk', 'inning', 'inning_topbot', 'at_bat_number'],
@@ -47,130 +55,396 @@ def create_dataset(num_games: int, input_csv: str, game_id: int = None, scraped_
     ).reset_index(drop=True)
 
 
-    for index, row in tqdm(game_url_df.iterrows()):
-        game_pk = row['game_pk']
+def create_dataset(num_games: int, input_csv: str, game_id: int = None, scraped_data_dir: str = "scraped_games",
+                   profile_path: str = None, statcast_csv: str = STATCAST_CSV, use_player_registry: bool = True,
+                   parsed_dir: str = PARSED_DIR, statcast_first: bool = False, workers: int = 1,
+                   game_timeout: float = GAME_TIMEOUT, games_dir: str = "games", error_log_path: str = ERROR_LOG,
+                   shard: tuple = None, shard_root: str = SHARDS_DIR):
+    """
+    Replay games into decision CSVs under games_dir. With a shard (i, N), only the i-th of N cost balanced
+    parts of the games is replayed, into the shard's directory under shard_root with a manifest for
+    sharding.merge_shards.
+    """
+    started = time.time()
+    if profile_path:
+        profiling.enable_profiling()
+    game_url_df = pd.read_csv(input_csv)
+    error_log = []
+    # Games that produced no CSV, with the first line of why
+    failed = {}
+    processor = GameProcessor(scraped_data_dir)
+    replay_metrics.reset()
 
-        if game_id:
-            if game_pk != game_id:
-                continue
-        if index >= num_games and not game_id:
-            break
+    # Resolve names seen anywhere in the season with hash lookups and an n-gram shortlist before falling back to
+    # difflib. The registry is cached next to the scraped games and only reads games scraped since
+    from player_registry import PlayerRegistry
+    registry = PlayerRegistry.load_or_build(scraped_data_dir) if use_player_registry else None
+    set_player_registry(registry)
 
-        try:
-            logging.info(f"\nProcessing game {game_pk}")
-            game_data = processor.load_game_data(str(game_pk))
-            logging.info(f"Successfully loaded game data")
-
-            at_bat_summary = all_statcast_reduced[all_statcast_reduced["game_pk"] == row["game_pk"]]
-            # at_bat_summary = get_at_bat_summary_for_game(input_csv, str(game_pk))
-
-            # Convert player IDs to integers where needed
-            home_lineup = [int(player_id) if isinstance(player_id, str) else player_id
-                         for player_id in game_data.home_lineup]
-            away_lineup = [int(player_id) if isinstance(player_id, str) else player_id
-                         for player_id in game_data.away_lineup]
-            home_bullpen = [int(player_id) if isinstance(player_id, str) else player_id
-                          for player_id in game_data.home_bullpen]
-            away_bullpen = [int(player_id) if isinstance(player_id, str) else player_id
-                          for player_id in game_data.away_bullpen]
-
-            # Initialize GameState
-            game_state = GameState(
-                home_abbr=game_data.home_abbr,
-                away_abbr=game_data.away_abbr,
-                home_lineup=home_lineup,
-                away_lineup=away_lineup,
-                home_pitcher=home_bullpen[0] if home_bullpen else None,
-                home_sub_ins=home_bullpen,
-                away_pitcher=away_bullpen[0] if away_bullpen else None,
-                away_sub_ins=away_bullpen,
-            )
-
-            # Make sure the lineups are properly set
-            game_state.home_lineup = home_lineup
-            game_state.away_lineup = away_lineup
-
-            # Convert position maps to use integer keys
-            home_position_map = {int(k): v for k, v in game_data.home_position_map.items()}
-            away_position_map = {int(k): v for k, v in game_data.away_position_map.items()}
-
-            # Initialize positions
-            for team, lineup, position_map in [
-                ('home', home_lineup, home_position_map),
-                ('away', away_lineup, away_position_map)
-            ]:
-                logging.info(f"\nSetting up {team} team positions:")
-                for player_id in lineup:
-                    position = position_map.get(player_id)
-                    logging.info(f"  Player {player_id} position: {position}")
-                    field_position = next((fp for fp in FieldPosition if fp.value == position), None)
-                    if field_position:
-                        game_state.set_position_player(team, field_position, player_id)
-                        logging.info(f"    Set {player_id} to {field_position.name}")
-
-            # Convert player maps to use integer keys
-            home_player_map = {int(k) if isinstance(k, str) else k: v
-                             for k, v in game_data.home_player_map.items()}
-            away_player_map = {int(k) if isinstance(k, str) else k: v
-                             for k, v in game_data.away_player_map.items()}
-
-            # Print initial state for verification
-            print_initial_game_state(game_state, home_player_map, away_player_map)
-
-            output_filename = f'games/game_{game_pk}_decisions.csv'
-            # initialize_csv(output_filename)
-
-            # Combine player maps
-            player_map = {**home_player_map, **away_player_map}
-
-            # Define all required columns explicitly
-            columns = [
-                "Event_Type", "Is_Decision", "Inning", "Half", "At_Bat", "Score_Deficit", "Outs",
-                "Third_Base", "Second_Base", "First_Base", "Home_Pitcher", "Away_Pitcher"
-            ]
-
-            # Add columns for each lineup position for both Home and Away teams
-            for i in range(1, 10):  # Lineup positions 1 to 9
-                columns.append(f"Home_Lineup_{i}")
-                columns.append(f"Away_Lineup_{i}")
-
-            # Add columns for each field position in HomePositionPlayers and AwayPositionPlayers            
-            field_positions = [
-                "DH", "C", "1B", "2B", "3B", "SS", "LF", "CF", "RF"
-            ]
-
-            # Append field positions for both Home and Away position players
-            for pos in field_positions:
-                columns.append(f"Home_{pos}")
-                columns.append(f"Away_{pos}")
-
-            # Initialize the DataFrame with all specified columns
-            decision_df = pd.DataFrame(columns=columns)
-
-            for inning in game_data.game_summary:
-                inning_str = inning['inning']
-                half_str, inning_number_str = inning_str.split()
-                inning_number = int(inning_number_str[:-2])
-                half = Half.TOP if half_str == 'Top' else Half.BOTTOM
-
-                for event in inning['events']:
-                    process_event(decision_df, event, game_state, player_map,
-                                at_bat_summary, inning_number, half)
-
-            # now we have a list of the decisions filled out
-            decision_df.to_csv(output_filename, index=False)
-            del decision_df
-
-
-        except Exception as e:
-            error_message = f"Error processing game {game_pk}: {str(e)}\n{traceback.format_exc()}"
-            logging.info(error_message)
-            error_log.append(error_message)
+    # Sorted pitch arrays, so a game's at bats are found with binary search instead of filtering a frame.
+    # They are memory-mapped from the export next to the csv, which the workers map as well.
+    pitch_index = load_pitch_index(statcast_csv)
+
+    if game_id:
+        game_pks = [game_pk for game_pk in game_url_df['game_pk'].tolist() if game_pk == game_id]
+    else:
+        game_pks = game_url_df['game_pk'].iloc[:num_games].tolist()
+
+    if shard:
+        parts = shard_partition(game_pks, game_url_df, shard[1])
+        shard_games = set(parts[shard[0] - 1])
+        game_pks = [game_pk for game_pk in game_pks if game_pk in shard_games]
+        games_dir = shard_dir(shard, shard_root) / OUTPUT_DIRS["process"]
+        error_log_path = shard_dir(shard, shard_root) / ERROR_LOG
+    os.makedirs(games_dir, exist_ok=True)
+
+    if workers > 1:
+        # Games go out longest first so the long ones don't end up running alone at the end, and a game that
+        # hangs is quarantined instead of stalling the run. Each game's profile comes back with its result.
+        costs = estimate_costs(game_pks, scraped_data_dir, game_url_df)
+        report = run_scheduled(game_pks, _replay_in_worker, workers, costs, game_timeout,
+                               initializer=_init_replay_worker,
+                               initargs=(scraped_data_dir, shared_index_dir(statcast_csv), parsed_dir,
+                                         statcast_first, registry, games_dir, profiling.active_profile is not None))
+        for game_pk, error_message, counters, profile in report.results.values():
+            replay_metrics.counters.update(counters)
+            if profile is not None:
+                profiling.active_profile.merge(profile)
+            if error_message:
+                logging.info(error_message)
+                error_log.append(error_message)
+                failed[game_pk] = error_message.splitlines()[0]
+        for game_pk, error in report.errors.items():
+            error_log.append(f"Error processing game {game_pk}: {error}")
+            failed[game_pk] = f"Error processing game {game_pk}: {error}"
+        for game_pk, reason in report.quarantined.items():
+            error_log.append(f"Quarantined game {game_pk}: {reason}")
+            failed[game_pk] = f"Quarantined game {game_pk}: {reason}"
+        print(report.format())
+    else:
+        from tqdm import tqdm
+        for game_pk in tqdm(game_pks):
+            try:
+                replay_and_write(game_pk, processor, pitch_index, parsed_dir, statcast_first, games_dir)
+            except Exception as e:
+                error_message = f"Error processing game {game_pk}: {str(e)}\n{traceback.format_exc()}"
+                logging.info(error_message)
+                error_log.append(error_message)
+                failed[game_pk] = error_message.splitlines()[0]
 
     if error_log:
-        with open('game_processing_errors.log', 'w') as f:
+        with open(error_log_path, 'w') as f:
             for error in error_log:
                 f.write(f"{error}\n\n")
+
+    if shard:
+        write_manifest("process", shard, shard_root, input_csv, parts, failed, started, game_url_df)
+
+    if statcast_first:
+        print(f"{replay_metrics.counters['statcast_fast_path']} of {replay_metrics.counters['events']} events "
+              f"took their bases from Statcast without parsing the description")
+
+    if profiling.active_profile is not None:
+        dump_profile(profile_path or f"profiles/replay_profile_{os.getpid()}.json")
+        # A later create_dataset in this process starts without the profile, unless it asks for one again
+        profiling.disable_profiling()
+
+
+def replay_and_write(game_pk, processor, pitch_index, parsed_dir, statcast_first, games_dir="games"):
+    logging.info(f"\nProcessing game {game_pk}")
+    game_data = processor.load_game_data(str(game_pk))
+    logging.info(f"Successfully loaded game data")
+
+    at_bat_index = pitch_index.game(game_pk).at_bat_index()
+    # at_bat_summary = get_at_bat_summary_for_game(input_csv, str(game_pk))
+
+    # Events are parsed into actions once per parser version, pass parsed_dir=None to parse while replaying
+    parsed_events = None
+    if parsed_dir:
+        parsed_events = load_parsed_events(game_data, processor.scraped_dir / f"game_{game_pk}.json", parsed_dir)
+
+    decision_df = replay_game(game_data, None, parsed_events, statcast_first, at_bat_index)
+
+    output_filename = f'{games_dir}/game_{game_pk}_decisions.csv'
+    # initialize_csv(output_filename)
+
+    # now we have a list of the decisions filled out
+    write_decisions(decision_df, output_filename)
+
+
+# Worker process state for create_dataset(workers > 1), set once per process by _init_replay_worker
+_worker_state = None
+
+
+def _init_replay_worker(scraped_data_dir, index_dir, parsed_dir, statcast_first, registry, games_dir="games",
+                        profile=False):
+    global _worker_state
+    set_player_registry(registry)
+    if profile:
+        profiling.enable_profiling()
+    # Attaching maps the exported arrays, so adding workers doesn't add copies of the index
+    _worker_state = (GameProcessor(scraped_data_dir), PitchIndex.attach(index_dir), parsed_dir, statcast_first,
+                     games_dir)
+
+
+def _replay_in_worker(game_pk):
+    replay_metrics.reset()
+    if profiling.active_profile is not None:
+        # Every game gets a fresh profile, which the parent merges into its own
+        profiling.disable_profiling()
+        profiling.enable_profiling()
+    error_message = None
+    try:
+        replay_and_write(game_pk, *_worker_state)
+    except Exception as e:
+        error_message = f"Error processing game {game_pk}: {str(e)}\n{traceback.format_exc()}"
+    return game_pk, error_message, dict(replay_metrics.counters), profiling.active_profile
+
+
+def replay_game(game_data: GameData, at_bat_summary: pd.DataFrame, parsed_events: list = None,
+                statcast_first: bool = False, at_bat_index: dict = None) -> pd.DataFrame:
+    """
+    Replay every scraped event of a game and return its decision rows.
+    parsed_events holds each event's actions from event_cache, otherwise the descriptions are parsed as we go.
+    With statcast_first, plays whose base changes are overwritten by the next at bat's Statcast bases anyway
+    aren't parsed at all, see bases_settled_by_statcast.
+    at_bat_index can be given instead of at_bat_summary, see pitch_index.GamePitches.at_bat_index.
+    """
+    game_state, player_map = initial_game_state(game_data)
+
+    # Statcast bases of every at bat, looked up by synchronize_bases
+    if at_bat_index is None:
+        at_bat_index = index_at_bats(at_bat_summary)
+
+    replay = GameReplay(game_state, player_map, at_bat_index)
+    events = game_events(game_data)
+
+    for i, (event, inning_number, half) in enumerate(events):
+        actions = parsed_events[i] if parsed_events is not None else None
+        skip_parse = statcast_first and bases_settled_by_statcast(
+            event, events[i + 1] if i + 1 < len(events) else None, at_bat_index)
+        replay_metrics.incr('events')
+        if skip_parse:
+            replay_metrics.incr('statcast_fast_path')
+        replay.append(event, inning_number, half, actions, skip_parse)
+
+    return replay.decision_df
+
+
+class GameReplay:
+    """
+    A game replayed event by event into its decision rows. The at bat in progress is journaled from a
+    checkpoint before its first event, so it can be rolled back and replayed when a later event shows that
+    its Statcast bases were wrong, see replay_pinch_runner. Once the next at bat starts its rows are final.
+    A state that is journaling when the replay starts stays journaling, so any event can be rewound.
+    """
+
+    def __init__(self, game_state: GameState, player_map: dict, at_bat_index: dict):
+        self.game_state = game_state
+        self.player_map = player_map
+        self.at_bat_index = at_bat_index
+        self.decision_df = pd.DataFrame(columns=DECISION_COLUMNS)
+        self.keeps_journal = game_state.journaling
+        # (event, inning number, half, actions, skip_parse) of every event, with the journal position and the
+        # number of rows before it, and the events that started an at bat
+        self.events = []
+        self.checkpoints = []
+        self.rows = []
+        self.at_bat_starts = []
+        self._at_bat_index_copied = False
+
+    def __len__(self):
+        return len(self.events)
+
+    def append(self, event, inning_number, half, actions=None, skip_parse=False):
+        """Replay the next event. An event that fails leaves the replay as it was before it"""
+        if event['type'] and event['atbat_index'] != self.game_state.at_bat:
+            if not self.keeps_journal:
+                # The at bat before is final, so only this one needs journaling
+                self.game_state.commit()
+            self.at_bat_starts.append(len(self.events))
+        elif self.at_bat_starts:
+            self.replay_pinch_runner(event, actions)
+        token = self.game_state.checkpoint()
+        rows = len(self.decision_df)
+        try:
+            process_event(self.decision_df, event, self.game_state, self.player_map, self.at_bat_index,
+                          inning_number, half, actions, skip_parse)
+        except Exception:
+            self.game_state.rollback(token)
+            self._drop_rows(rows)
+            if self.at_bat_starts and self.at_bat_starts[-1] == len(self.events):
+                self.at_bat_starts.pop()
+            raise
+        self.events.append((event, inning_number, half, actions, skip_parse))
+        self.checkpoints.append(token)
+        self.rows.append(rows)
+
+    def rewind(self, index: int) -> int:
+        """Drop event index and every event after it. Returns the number of changes undone"""
+        undone = self.game_state.rollback(self.checkpoints[index])
+        self._drop_rows(self.rows[index])
+        del self.events[index:], self.checkpoints[index:], self.rows[index:]
+        while self.at_bat_starts and self.at_bat_starts[-1] >= index:
+            self.at_bat_starts.pop()
+        return undone
+
+    def _drop_rows(self, rows: int):
+        self.decision_df.drop(index=self.decision_df.index[rows:], inplace=True)
+
+    def replay_pinch_runner(self, event, actions):
+        """
+        A pinch-runner who came in before the first pitch of the at bat is on base in Statcast's row for it,
+        so synchronize_bases put them on base before the events ahead of the substitution. When a substitution
+        finds its pinch-runner already on base, the at bat is rolled back and replayed with the runner they
+        replace in Statcast's bases, then the substitution swaps them as usual.
+        """
+        if event['type'] != 'Offensive Substitution' or 'Pinch-runner' not in event['description']:
+            return
+        if actions is None:
+            actions = parse_event(event['type'], event['description'], self.player_map)
+        swap = next(((action.old_id, action.new_id) for action in actions if isinstance(action, ReplaceOnBase)), None)
+        if swap is None or swap[1] not in self.game_state.bases_occupied.values():
+            return
+        half = 'Top' if self.game_state.half == Half.TOP else 'Bot'
+        key = (str(self.game_state.inning), half, str(self.game_state.at_bat))
+        statcast_bases = self.at_bat_index.get(key)
+        if statcast_bases is None or swap[1] not in statcast_bases:
+            return
+        logging.info(f"Pinch-runner {swap[1]} was on base since the start of at bat {self.game_state.at_bat}, "
+                     f"replaying it with {swap[0]}")
+        if not self._at_bat_index_copied:
+            # The index can be shared with other replays of the game
+            self.at_bat_index = dict(self.at_bat_index)
+            self._at_bat_index_copied = True
+        self.at_bat_index[key] = tuple(swap[0] if runner == swap[1] else runner for runner in statcast_bases)
+        start = self.at_bat_starts[-1]
+        replayed = self.events[start:]
+        self.rewind(start)
+        for item in replayed:
+            self.append(*item)
+
+
+def initial_game_state(game_data: GameData):
+    """The state before the first pitch, and the combined player map the handlers resolve names against"""
+    # Copies, since substitutions change the lineups in place
+    home_lineup = list(game_data.home_lineup)
+    away_lineup = list(game_data.away_lineup)
+    home_bullpen = list(game_data.home_bullpen)
+    away_bullpen = list(game_data.away_bullpen)
+
+    # Initialize GameState
+    game_state = GameState(
+        home_abbr=game_data.home_abbr,
+        away_abbr=game_data.away_abbr,
+        home_lineup=home_lineup,
+        away_lineup=away_lineup,
+        home_pitcher=home_bullpen[0] if home_bullpen else None,
+        home_sub_ins=home_bullpen,
+        away_pitcher=away_bullpen[0] if away_bullpen else None,
+        away_sub_ins=away_bullpen,
+    )
+
+    # Make sure the lineups are properly set
+    game_state.home_lineup = home_lineup
+    game_state.away_lineup = away_lineup
+
+    home_position_map = game_data.home_position_map
+    away_position_map = game_data.away_position_map
+
+    # Initialize positions
+    for team, lineup, position_map in [
+        ('home', home_lineup, home_position_map),
+        ('away', away_lineup, away_position_map)
+    ]:
+        logging.info(f"\nSetting up {team} team positions:")
+        for player_id in lineup:
+            position = position_map.get(player_id)
+            logging.info(f"  Player {player_id} position: {position}")
+            field_position = next((fp for fp in FieldPosition if fp.value == position), None)
+            if field_position:
+                game_state.set_position_player(team, field_position, player_id)
+                logging.info(f"    Set {player_id} to {field_position.name}")
+
+    # Combine the player maps
+    home_player_map, away_player_map, player_map = player_maps(game_data)
+
+    # Print initial state for verification
+    print_initial_game_state(game_state, home_player_map, away_player_map)
+    return game_state, player_map
+
+
+def game_events(game_data: GameData) -> list:
+    """Every event of the game in replay order as (event, inning number, half)"""
+    events = []
+    for inning in game_data.game_summary:
+        inning_str = inning['inning']
+        half_str, inning_number_str = inning_str.split()
+        inning_number = int(inning_number_str[:-2])
+        half = Half.TOP if half_str == 'Top' else Half.BOTTOM
+        events.extend((event, inning_number, half) for event in inning['events'])
+    return events
+
+
+def replay_game_statcast_first(game_data: GameData, at_bat_summary: pd.DataFrame) -> pd.DataFrame:
+    """replay_game with the Statcast fast path, as a regression.py engine"""
+    return replay_game(game_data, at_bat_summary, statcast_first=True)
+
+
+def bases_settled_by_statcast(event, next_item, at_bat_index) -> bool:
+    """
+    Whether an at-bat ending play can skip description parsing. Its base changes are only ever read by the
+    next event, so they don't matter when that event starts a new at bat and synchronize_bases replaces the
+    bases with Statcast's. Caught stealing events are excluded because their synchronization reads the bases.
+    Mid at-bat events (steals, pickoffs, wild pitches, balks, substitutions) have handlers and are always parsed.
+    """
+    if not event['type'] or event['type'] in event_handlers:
+        return False
+    if next_item is None:
+        # Nothing reads the bases after the last play of the game
+        return True
+
+    next_event, next_inning, next_half = next_item
+    if (not next_event['type'] or next_event['atbat_index'] == event['atbat_index'] or
+            next_event['type'] in caught_stealing_events):
+        return False
+    next_half_str = 'Top' if next_half == Half.TOP else 'Bot'
+    return (str(next_inning), next_half_str, str(next_event['atbat_index'])) in at_bat_index
+
+
+def dump_profile(profile_path):
+    profile = profiling.active_profile
+    profile.write(profile_path)
+    logging.info(f"Replay profile written to {profile_path}")
+    print(profile.format_table())
+
+
+@profiled('stage')
+def write_decisions(decision_df, output_filename):
+    decision_df.to_csv(output_filename, index=False)
+
+
+@profiled('stage')
+def append_decision_point(decision_df, decision_point):
+    decision_df.loc[len(decision_df)] = decision_point
+
+
+def run_handler(handler, event, game_state, player_map):
+    profile = profiling.active_profile
+    if profile is None:
+        return handler(event['description'], game_state, player_map)
+    ts = time.perf_counter()
+    try:
+        return handler(event['description'], game_state, player_map)
+    finally:
+        profile.record('handler', handler.__name__, time.perf_counter() - ts)
+
+
+@profiled('stage')
+def apply_parsed_actions(actions, game_state):
+    apply_actions(actions, game_state)
+
+
 def print_initial_game_state(game_state, home_player_map, away_player_map):
     logging.info(f"\nInitial Game State:")
     logging.info(f"Inning: {game_state.inning} {game_state.half.name}")
@@ -258,7 +532,11 @@ def log_game_state(game_state):
     logging.info("=================\n")
 
 
-def process_event(decision_df, event, game_state, player_map, at_bat_summary, inning_number, half):
+def process_event(decision_df, event, game_state, player_map, at_bat_index, inning_number, half, actions=None,
+                  skip_parse=False):
+    profile = profiling.active_profile
+    event_start = time.perf_counter() if profile is not None else None
+
     # if these two are different it's a new inning, and we need to reset outs
     if game_state.inning != inning_number or game_state.half != half:
         game_state.outs = 0
@@ -277,7 +555,6 @@ def process_event(decision_df, event, game_state, player_map, at_bat_summary, in
     event_at_bat = event['atbat_index']
     if game_state.at_bat != event_at_bat and event['type']:
         # We're on a new at bat and can trust statcast
-        previous_at_bat = game_state.at_bat
         game_state.at_bat = event_at_bat
 
         is_offensive_sub = event['type'] == 'Offensive Substitution'
@@ -288,11 +565,7 @@ def process_event(decision_df, event, game_state, player_map, at_bat_summary, in
         # we must have a flag we pass in
         is_caught_stealing = event['type'] in caught_stealing_events
 
-        synchronize_bases(game_state, at_bat_summary, is_offensive_sub, is_caught_stealing, event, player_map)
-
-        # Verify and correct previous at-bat's base configurations
-        if not is_caught_stealing:
-            verify_previous_at_bat_bases(decision_df, previous_at_bat, game_state)
+        synchronize_bases(game_state, at_bat_index, is_offensive_sub, is_caught_stealing, event, player_map)
 
 
     # We label decision events from chance events
@@ -306,19 +579,24 @@ def process_event(decision_df, event, game_state, player_map, at_bat_summary, in
 
     # Save off the pre-event game state
     decision_point = game_state.create_decision_point(event, is_decision, player_map)
-    decision_df.loc[len(decision_df)] = decision_point
+    append_decision_point(decision_df, decision_point)
 
     # Get the handler and modify the game_state
     event_type = event['type']
     handler = event_handlers.get(event_type)
-    if handler:
-        result = handler(event['description'], game_state, player_map)
+    if skip_parse:
+        logging.info(f"Leaving the bases after {event_type} to the next at bat's Statcast row")
+    elif actions is not None:
+        # Already parsed, so there is no string work left to do
+        apply_parsed_actions(actions, game_state)
+    elif handler:
+        result = run_handler(handler, event, game_state, player_map)
         if result:
             logging.info(result)
     else:
         logging.info(f"Handling {event_type} generically by trying to update bases. {event['description']}")
         handler = event_handlers.get('AttemptBaseUpdate')
-        handler(event['description'], game_state, player_map)
+        run_handler(handler, event, game_state, player_map)
 
     # Update the scores if a score change was reported
     if event['score_update']:
@@ -329,32 +607,31 @@ def process_event(decision_df, event, game_state, player_map, at_bat_summary, in
     if event['outs_update']:
         game_state.outs = event['outs_update']
 
+    if profile is not None:
+        profile.record('event', event_type, time.perf_counter() - event_start)
+
     # if game_state.outs == 3:
     #     game_state.outs = 0
 
 
-def synchronize_bases(game_state, at_bat_summary, is_offensive_sub, is_caught_stealing, event, player_map):
+@profiled('stage')
+def synchronize_bases(game_state, at_bat_index, is_offensive_sub, is_caught_stealing, event, player_map):
     logging.info("Synchronizing bases...")
     log_game_state(game_state)
 
 
     current_half = 'Top' if game_state.half == Half.TOP else 'Bot'
 
-    current_at_bat = at_bat_summary[
-        (at_bat_summary['inning'].astype(str) == str(game_state.inning)) &
-        (at_bat_summary['inning_topbot'].astype(str) == current_half) &
-        (at_bat_summary['at_bat_number'].astype(str) == str(game_state.at_bat))
-    ]
+    statcast_bases = at_bat_index.get((str(game_state.inning), current_half, str(game_state.at_bat)))
 
-    if current_at_bat.empty:
+    if statcast_bases is None:
         logging.warning(f"Warning: Statcast does not contain an at-bat for {game_state.at_bat}")
         return
 
-    current_at_bat_row = current_at_bat.iloc[0]
     new_bases_occupied = {
-        Base.FIRST: int(current_at_bat_row['on_1b']) if pd.notna(current_at_bat_row['on_1b']) else -1,
-        Base.SECOND: int(current_at_bat_row['on_2b']) if pd.notna(current_at_bat_row['on_2b']) else -1,
-        Base.THIRD: int(current_at_bat_row['on_3b']) if pd.notna(current_at_bat_row['on_3b']) else -1
+        Base.FIRST: statcast_bases[0],
+        Base.SECOND: statcast_bases[1],
+        Base.THIRD: statcast_bases[2]
     }
     logging.info(f"New bases occupied from Statcast: {new_bases_occupied}")
 
@@ -402,88 +679,6 @@ def synchronize_bases(game_state, at_bat_summary, is_offensive_sub, is_caught_st
     logging.info(f"Updating game state bases to: {new_bases_occupied}")
     game_state.bases_occupied = new_bases_occupied
 
-def verify_previous_at_bat_bases(df, previous_at_bat, current_game_state):
-    # Filter rows for the previous at-bat
-    previous_at_bat_rows = df[df['At_Bat'] == previous_at_bat]
-    if previous_at_bat_rows.empty:
-        logging.info("No previous at-bat rows found.")
-        return
-
-    corrections_needed = False
-    current_bases = {
-        'First_Base': current_game_state.bases_occupied[Base.FIRST],
-        'Second_Base': current_game_state.bases_occupied[Base.SECOND],
-        'Third_Base': current_game_state.bases_occupied[Base.THIRD]
-    }
-    logging.info(f"Current bases occupied: {current_bases}")
-
-    # Check each row in the previous at-bat for impossible base configurations
-    for index, row in previous_at_bat_rows.iterrows():
-        logging.info(f"Checking row {index}")
-        for base, current_runner in current_bases.items():
-            if current_runner != -1:
-                # Check if this runner was on a more advanced base in the previous at-bat
-                if base == 'First_Base':
-                    if row['Second_Base'] == current_runner or row['Third_Base'] == current_runner:
-                        corrections_needed = True
-                        logging.info(f"Correcting runner {current_runner} on {base}")
-                        df.at[index, 'Second_Base'] = -1 if row['Second_Base'] == current_runner else df.at[index, 'Second_Base']
-                        df.at[index, 'Third_Base'] = -1 if row['Third_Base'] == current_runner else df.at[index, 'Third_Base']
-                        df.at[index, 'First_Base'] = current_runner
-                elif base == 'Second_Base':
-                    if row['Third_Base'] == current_runner:
-                        corrections_needed = True
-                        logging.info(f"Correcting runner {current_runner} on {base}")
-                        df.at[index, 'Third_Base'] = -1
-                        df.at[index, 'Second_Base'] = current_runner
-
-    if corrections_needed:
-        logging.info("Corrections were made to the previous at-bat base configurations.")
-    else:
-        logging.info("No corrections needed for previous at-bat base configurations.")
-
-    # Part 2: Handle offensive substitutions
-    logging.info("Handling offensive substitutions if any...")
-    offensive_sub_rows = previous_at_bat_rows[previous_at_bat_rows['Event_Type'] == 'Offensive Substitution']
-
-    for index, sub_row in offensive_sub_rows.iterrows():
-        logging.info(f"Processing offensive substitution at index {index}: {sub_row}")
-
-        if index + 1 < len(df):
-            next_row = df.iloc[index + 1]
-
-            # Find the columns that changed (excluding 'Event_Type')
-            changed_columns = [col for col in df.columns if col != 'Event_Type' and sub_row[col] != next_row[col]]
-            logging.info(f"Changed columns: {changed_columns}")
-
-            if len(changed_columns) == 2:
-                old_player_id = sub_row[changed_columns[0]]
-                new_player_id = next_row[changed_columns[0]]
-                changed_column = changed_columns[0]
-                logging.info(f"Old player ID: {old_player_id}, new player ID: {new_player_id}, changed column: {changed_column}")
-
-                # Check if the new player is already on base in the substitution row
-                bases = ['First_Base', 'Second_Base', 'Third_Base']
-                if any(sub_row[base] == new_player_id for base in bases):
-                    logging.info(f"New player {new_player_id} found on base in substitution row.")
-                    # Correct the rows before this substitution
-                    for prev_index in range(index, -1, -1):
-                        prev_row = df.iloc[prev_index]
-                        logging.info(f"Checking previous row {prev_index} for corrections.")
-
-                        if prev_row['At_Bat'] != previous_at_bat:
-                            break
-
-                        # Use the lineup column that contained the old player before the sub as the source of truth
-                        if prev_row[changed_column] == old_player_id:
-                            for base in bases:
-                                if prev_row[base] == new_player_id:
-                                    logging.info(f"Correcting base {base} at index {prev_index} from {new_player_id} to {old_player_id}")
-                                    df.at[prev_index, base] = old_player_id
-
-    logging.info(f"Completed verification of previous at-bat bases for at-bat {previous_at_bat}.")
-
-
 
 def verify_decision(event, game_state):
     description = event['description'].lower()
@@ -592,18 +787,37 @@ caught_stealing_events = [
 # Now that we have the entire 2023 season scraped, the url you input here only determines which game ids we process
 
 
-if __name__ == "__main__":
-    user_input = input("logging?").strip().lower()
-    if user_input == 'y' or user_input == 'yes':
-        logging.basicConfig(level=logging.INFO)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay scraped games into decision CSVs under games/")
+    parser.add_argument("--games-csv", default="urls/gameday_urls2023.csv")
+    parser.add_argument("--num-games", type=int, default=10000)
+    parser.add_argument("--game-id", type=int, default=None, help="replay only this game")
+    parser.add_argument("--scraped-dir", default="scraped_games")
+    parser.add_argument("--statcast", default=STATCAST_CSV)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--statcast-first", action="store_true",
+                        help="take bases from Statcast without parsing the description when they agree")
+    parser.add_argument("--no-player-registry", action="store_true")
+    parser.add_argument("--profile", help="write a replay profile to this path")
+    parser.add_argument("--logging", action="store_true",
+                        help="log every event at INFO level, to the console and logs/replay.log")
+    parser.add_argument("--shard", type=parse_shard, help="replay only shard i of N, given as i/N, like 2/4")
+    parser.add_argument("--shard-root", default=SHARDS_DIR, help="where each shard writes its games and manifest")
+    args = parser.parse_args(argv)
+
+    if args.logging:
+        # Replay workers are forked with the sink's handler, so their records reach the same file
+        start_log_sink(LOG_DIR / "replay.log")
     else:
-        logging.disable(logging.CRITICAL)    
-    
-    num_games = 10000
-    game_id = None
-    url_file_name = "urls/gameday_urls2023.csv"
+        logging.disable(logging.CRITICAL)
+    create_dataset(args.num_games, args.games_csv, args.game_id, args.scraped_dir, profile_path=args.profile,
+                   statcast_csv=args.statcast, use_player_registry=not args.no_player_registry,
+                   statcast_first=args.statcast_first, workers=args.workers, shard=args.shard,
+                   shard_root=args.shard_root)
 
-    create_dataset(num_games, url_file_name, game_id)
+
+if __name__ == "__main__":
+    main()
 
 
 # TODO: Occasionally in mid at bat events like caught stolen base, that event will report the outs of the next event before those outs
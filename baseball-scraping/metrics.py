@@ -0,0 +1,112 @@
+import json
+import math
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+# Upper bounds (seconds) of the latency histogram buckets, the last bucket catches everything else
+HISTOGRAM_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, float('inf')]
+
+
+def percentile(samples, q):
+    """Linear interpolation percentile of a list of samples, q in [0, 100]"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * q / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class StageMetrics:
+    """Collects per-stage latency samples and event counters for a run"""
+
+    def __init__(self, name: str = "run"):
+        self.name = name
+        self.samples = defaultdict(list)
+        self.counters = Counter()
+        self.start_time = time.time()
+        self.end_time = None
+
+    def reset(self):
+        self.samples.clear()
+        self.counters.clear()
+        self.start_time = time.time()
+        self.end_time = None
+
+    def observe(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds)
+
+    def incr(self, counter: str, amount: int = 1):
+        self.counters[counter] += amount
+
+    @contextmanager
+    def stage(self, stage: str):
+        ts = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - ts)
+
+    def finish(self):
+        self.end_time = time.time()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.end_time or time.time()) - self.start_time
+
+    def rate_per_minute(self, counter: str) -> float:
+        minutes = self.elapsed / 60
+        return self.counters[counter] / minutes if minutes > 0 else 0.0
+
+    def stage_summary(self, stage: str) -> dict:
+        values = self.samples[stage]
+        histogram = [0] * len(HISTOGRAM_BUCKETS)
+        for value in values:
+            histogram[next(i for i, bound in enumerate(HISTOGRAM_BUCKETS) if value <= bound)] += 1
+        return {
+            "count": len(values),
+            "total": sum(values),
+            "mean": sum(values) / len(values) if values else None,
+            "min": min(values) if values else None,
+            "max": max(values) if values else None,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "histogram": {("inf" if math.isinf(bound) else str(bound)): count
+                          for bound, count in zip(HISTOGRAM_BUCKETS, histogram)},
+        }
+
+    def summary(self) -> dict:
+        return {
+            "name": self.name,
+            "start_time": self.start_time,
+            "elapsed_seconds": self.elapsed,
+            "counters": dict(self.counters),
+            "stages": {stage: self.stage_summary(stage) for stage in sorted(self.samples)},
+        }
+
+    def write(self, path) -> Path:
+        """Write the summary as JSON so separate runs can be aggregated and compared"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        return path
+
+    def format_summary(self, rate_counter: str = None) -> str:
+        lines = [f"{'stage':<28}{'count':>7}{'total s':>10}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'max s':>9}"]
+        for stage in sorted(self.samples):
+            s = self.stage_summary(stage)
+            lines.append(f"{stage:<28}{s['count']:>7}{s['total']:>10.2f}{s['p50']:>9.3f}"
+                         f"{s['p95']:>9.3f}{s['p99']:>9.3f}{s['max']:>9.3f}")
+        for counter, value in sorted(self.counters.items()):
+            lines.append(f"{counter}: {value}")
+        lines.append(f"elapsed: {self.elapsed:.1f} seconds")
+        if rate_counter:
+            lines.append(f"{rate_counter} per minute: {self.rate_per_minute(rate_counter):.2f}")
+        return "\n".join(lines)
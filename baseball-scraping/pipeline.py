@@ -0,0 +1,210 @@
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+from pathlib import Path
+
+import pandas as pd
+
+from event_handlers import set_player_registry
+from game_data import is_game_data_complete
+from log_sink import LOG_DIR, active_log_queue, attach_log_queue, ensure_log_sink
+from main import GameProcessor, replay_game, write_decisions, STATCAST_CSV
+from pitch_index import load_pitch_index
+from player_registry import PlayerRegistry
+from scheduler import estimate_costs, longest_first
+
+# Messages sent from the workers back to the parent on the status queue
+SCRAPED, SCRAPE_FAILED, REPLAYED, REPLAY_FAILED = "scraped", "scrape_failed", "replayed", "replay_failed"
+
+
+def decisions_path(game_pk, games_dir="games") -> Path:
+    return Path(games_dir) / f"game_{game_pk}_decisions.csv"
+
+
+def scrape_worker(games_csv, scraped_dir, tasks, replay_queue, status_queue, log_queue=None):
+    """Scrape games from the task queue and hand every finished GameData to the replay stage"""
+    if log_queue is not None:
+        attach_log_queue(log_queue)
+    from scraper import GameScraper, setup_webdriver
+
+    scraper = GameScraper(games_csv, scraped_dir)
+    driver = setup_webdriver()
+    try:
+        while True:
+            row = tasks.get()
+            if row is None:
+                break
+            try:
+                # scrape_game saves the JSON before we enqueue, so the scrape survives a replay crash
+                game_data = scraper.scrape_game(driver, row)
+            except Exception as e:
+                status_queue.put((SCRAPE_FAILED, row['game_pk'], f"{e}\n{traceback.format_exc()}"))
+                continue
+            status_queue.put((SCRAPED, row['game_pk'], None))
+            # Blocks while the replay stage is behind, which throttles the scrapers
+            replay_queue.put(game_data)
+            time.sleep(1)
+    finally:
+        driver.quit()
+        scraper._report_metrics()
+
+
+def replay_worker(statcast_csv, games_dir, replay_queue, status_queue, registry=None):
+    """Replay GameData objects as they arrive and write each game's decision rows immediately"""
+    logging.disable(logging.CRITICAL)
+    set_player_registry(registry)
+    pitch_index = load_pitch_index(statcast_csv)
+
+    while True:
+        game_data = replay_queue.get()
+        if game_data is None:
+            break
+        game_pk = int(game_data.game_pk)
+        if registry is not None:
+            # Games scraped since the registry was built add their own players' names
+            registry.add_player_map(game_data.home_player_map)
+            registry.add_player_map(game_data.away_player_map)
+        try:
+            decision_df = replay_game(game_data, None, at_bat_index=pitch_index.game(game_pk).at_bat_index())
+            write_decisions(decision_df, decisions_path(game_pk, games_dir))
+        except Exception as e:
+            status_queue.put((REPLAY_FAILED, game_pk, f"{e}\n{traceback.format_exc()}"))
+            continue
+        status_queue.put((REPLAYED, game_pk, None))
+
+
+def run_pipeline(games_csv: str, scraped_dir: str = "scraped_games", games_dir: str = "games",
+                 statcast_csv: str = STATCAST_CSV, scrapers: int = 1, replayers: int = 1, queue_size: int = 8,
+                 force: bool = False, use_player_registry: bool = True) -> dict:
+    """
+    Scrape and replay a season at the same time. Games that already have complete scraped data are
+    replayed straight from disk, and games that also have decision rows are skipped unless force is set,
+    so an interrupted run picks up where either stage stopped. Names resolve through the season registry
+    like create_dataset does, built from the games scraped when the run starts.
+    """
+    # Every scraper logs through this process's sink, which writes their lines whole into one file
+    sink = ensure_log_sink(LOG_DIR / "pipeline.log")
+    os.makedirs(games_dir, exist_ok=True)
+    games_df = pd.read_csv(games_csv)
+    processor = GameProcessor(scraped_dir)
+    registry = PlayerRegistry.load_or_build(scraped_dir) if use_player_registry else None
+
+    to_scrape = []
+    to_replay = []
+    for _, row in games_df.iterrows():
+        game_pk = row['game_pk']
+        scraped_path = Path(scraped_dir) / f"game_{game_pk}.json"
+        if not (scraped_path.exists() and is_game_data_complete(scraped_path)):
+            to_scrape.append(row.to_dict())
+        elif force or not decisions_path(game_pk, games_dir).exists():
+            to_replay.append(game_pk)
+
+    # Longest first, so the slowest games aren't the last ones left on the replay workers
+    costs = estimate_costs([row['game_pk'] for row in to_scrape] + to_replay, scraped_dir, games_df)
+    to_scrape = sorted(to_scrape, key=lambda row: -costs[row['game_pk']])
+    to_replay = longest_first(to_replay, costs)
+
+    logging.info(f"Pipeline: {len(to_scrape)} games to scrape, {len(to_replay)} scraped games to replay")
+
+    ctx = mp.get_context()
+    tasks = ctx.Queue()
+    replay_queue = ctx.Queue(maxsize=queue_size)
+    status_queue = ctx.Queue()
+    for row in to_scrape:
+        tasks.put(row)
+    scraper_count = min(scrapers, len(to_scrape))
+    for _ in range(scraper_count):
+        tasks.put(None)
+
+    def start_replay_worker():
+        process = ctx.Process(target=replay_worker,
+                              args=(statcast_csv, games_dir, replay_queue, status_queue, registry))
+        process.start()
+        return process
+
+    scrape_processes = [ctx.Process(target=scrape_worker, args=(games_csv, scraped_dir, tasks, replay_queue,
+                                                                status_queue, active_log_queue()))
+                        for _ in range(scraper_count)]
+    for process in scrape_processes:
+        process.start()
+    replay_processes = [start_replay_worker() for _ in range(replayers)]
+
+    summary = {SCRAPED: 0, SCRAPE_FAILED: 0, REPLAYED: 0, REPLAY_FAILED: 0, "replay_restarts": 0}
+    error_log = []
+
+    def drain_statuses(timeout):
+        try:
+            while True:
+                status, game_pk, error = status_queue.get(timeout=timeout)
+                summary[status] += 1
+                if error:
+                    error_log.append(f"Error in {status} for game {game_pk}: {error}")
+        except queue.Empty:
+            pass
+
+    def supervise_replay_workers():
+        # A crashed replay worker loses at most the game it held, which is still on disk for the next run.
+        # Restart it so the scrapers don't block forever on a full queue.
+        for i, process in enumerate(replay_processes):
+            if not process.is_alive() and process.exitcode != 0:
+                logging.error(f"Replay worker {process.pid} exited with code {process.exitcode}, restarting")
+                summary["replay_restarts"] += 1
+                replay_processes[i] = start_replay_worker()
+
+    def put_for_replay(item):
+        while True:
+            try:
+                replay_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                drain_statuses(0)
+                supervise_replay_workers()
+
+    start = time.time()
+    # Already scraped games share the replay queue with the scrapers' output
+    for game_pk in to_replay:
+        put_for_replay(processor.load_game_data(str(game_pk)))
+
+    while any(process.is_alive() for process in scrape_processes):
+        drain_statuses(0.5)
+        supervise_replay_workers()
+    for process in scrape_processes:
+        if process.exitcode != 0:
+            logging.error(f"Scrape worker {process.pid} exited with code {process.exitcode}")
+
+    for _ in replay_processes:
+        put_for_replay(None)
+    while any(process.is_alive() for process in replay_processes):
+        drain_statuses(0.5)
+    drain_statuses(0.1)
+    summary["seconds"] = time.time() - start
+
+    if error_log:
+        with open('game_processing_errors.log', 'w') as f:
+            for error in error_log:
+                f.write(f"{error}\n\n")
+    logging.info(f"Pipeline finished: {summary}")
+    if sink:
+        sink.stop()
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape games and replay them as soon as they are scraped")
+    parser.add_argument("--games-csv", default="urls/gameday_urls2023.csv")
+    parser.add_argument("--statcast", default=STATCAST_CSV)
+    parser.add_argument("--scrapers", type=int, default=1, help="number of browser drivers")
+    parser.add_argument("--replayers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=8, help="scraped games allowed to wait for replay")
+    parser.add_argument("--force", action="store_true", help="replay games that already have decision rows")
+    parser.add_argument("--no-player-registry", action="store_true",
+                        help="resolve names without the season registry, like main.py --no-player-registry")
+    args = parser.parse_args()
+
+    print(run_pipeline(args.games_csv, statcast_csv=args.statcast, scrapers=args.scrapers,
+                       replayers=args.replayers, queue_size=args.queue_size, force=args.force,
+                       use_player_registry=not args.no_player_registry))
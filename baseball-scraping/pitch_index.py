@@ -0,0 +1,181 @@
+import argparse
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from statcast_at_bats import build_statcast_stub
+
+PITCH_COLUMNS = ['game_pk', 'inning', 'inning_topbot', 'at_bat_number', 'pitch_number', 'on_1b', 'on_2b', 'on_3b']
+HALF_CODES = {"Top": 0, "Bot": 1}
+HALF_NAMES = {code: half for half, code in HALF_CODES.items()}
+PITCH_INDEX_DIR = "helper_files/pitch_index"
+
+
+class GamePitches:
+    """Every pitch of one game as array views, ordered by at bat and pitch number"""
+
+    def __init__(self, arrays: dict):
+        self.arrays = arrays
+
+    def __len__(self):
+        return len(self.arrays['at_bat_number'])
+
+    def bases(self, row: int) -> tuple:
+        """Runners on first, second and third before the pitch, with -1 for an empty base"""
+        return (int(self.arrays['on_1b'][row]), int(self.arrays['on_2b'][row]), int(self.arrays['on_3b'][row]))
+
+    def at_bat_index(self) -> dict:
+        """Bases at the first pitch of every at bat, keyed like statcast_at_bats.index_at_bats"""
+        at_bats = self.arrays['at_bat_number']
+        firsts = np.flatnonzero(np.r_[True, at_bats[1:] != at_bats[:-1]]) if len(at_bats) else []
+        return {
+            (str(int(self.arrays['inning'][row])), HALF_NAMES[int(self.arrays['inning_topbot'][row])],
+             str(int(at_bats[row]))): self.bases(row)
+            for row in firsts
+        }
+
+
+class PitchIndex:
+    """
+    Season pitch table as fixed-width int arrays sorted by game, at bat and pitch number.
+    The pitches of game_pks[i] are rows offsets[i]:offsets[i + 1].
+    """
+
+    def __init__(self, arrays: dict, game_pks: np.ndarray = None, offsets: np.ndarray = None):
+        self.arrays = arrays
+        if game_pks is None:
+            game_pks, starts = np.unique(arrays['game_pk'], return_index=True)
+            offsets = np.r_[starts, len(arrays['game_pk'])].astype(np.int64)
+        self.game_pks = game_pks
+        self.offsets = offsets
+
+    def __len__(self):
+        return int(self.offsets[-1]) if len(self.offsets) else 0
+
+    def game(self, game_pk) -> GamePitches:
+        """Views of one game's pitches, empty when the game isn't in the table"""
+        index = int(np.searchsorted(self.game_pks, int(game_pk)))
+        if index == len(self.game_pks) or self.game_pks[index] != int(game_pk):
+            rows = slice(0, 0)
+        else:
+            rows = slice(int(self.offsets[index]), int(self.offsets[index + 1]))
+        return GamePitches({column: values[rows] for column, values in self.arrays.items()})
+
+    @classmethod
+    def from_frame(cls, pitches: pd.DataFrame) -> "PitchIndex":
+        pitches = pitches.sort_values(['game_pk', 'at_bat_number', 'pitch_number'], kind='stable')
+        game_pks = pitches['game_pk'].to_numpy(dtype=np.int64)
+        arrays = {
+            'inning': pitches['inning'].to_numpy(dtype=np.int8),
+            'inning_topbot': pitches['inning_topbot'].map(HALF_CODES).to_numpy(dtype=np.int8),
+            'at_bat_number': pitches['at_bat_number'].to_numpy(dtype=np.int16),
+            'pitch_number': pitches['pitch_number'].to_numpy(dtype=np.int16),
+        }
+        for column in ['on_1b', 'on_2b', 'on_3b']:
+            arrays[column] = pd.to_numeric(pitches[column]).fillna(-1).to_numpy(dtype=np.int32)
+        unique_pks, starts = np.unique(game_pks, return_index=True)
+        return cls(arrays, unique_pks, np.r_[starts, len(game_pks)].astype(np.int64))
+
+    @classmethod
+    def from_csv(cls, statcast_csv) -> "PitchIndex":
+        """Read only the columns the index needs from the Statcast pitch table"""
+        return cls.from_frame(pd.read_csv(statcast_csv, usecols=PITCH_COLUMNS))
+
+    def export(self, directory=PITCH_INDEX_DIR, source=None):
+        """
+        Write one .npy per column plus the game offset table, so processes can map them instead of loading.
+        The files are written to a temporary directory that then replaces the export, because writing over a
+        mapped .npy would change it under the processes reading it. They keep the old files until they exit.
+        """
+        directory = Path(directory)
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        temp = directory.with_name(f"{directory.name}.{os.getpid()}.tmp")
+        shutil.rmtree(temp, ignore_errors=True)
+        temp.mkdir()
+        for column, values in self.arrays.items():
+            np.save(temp / f"{column}.npy", values)
+        np.save(temp / "game_pks.npy", self.game_pks)
+        np.save(temp / "offsets.npy", self.offsets)
+        with open(temp / "meta.json", "w") as f:
+            json.dump({"columns": list(self.arrays), "source": source}, f)
+        old = directory.with_name(f"{directory.name}.{os.getpid()}.old")
+        if directory.exists():
+            os.replace(directory, old)
+        os.replace(temp, directory)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def attach(cls, directory=PITCH_INDEX_DIR) -> "PitchIndex":
+        """
+        Map an exported index read-only. The pages are shared with every other process mapping it,
+        so replay workers don't each hold a copy.
+        """
+        directory = Path(directory)
+        with open(directory / "meta.json") as f:
+            meta = json.load(f)
+        arrays = {column: np.load(directory / f"{column}.npy", mmap_mode="r") for column in meta["columns"]}
+        return cls(arrays, np.load(directory / "game_pks.npy", mmap_mode="r"),
+                   np.load(directory / "offsets.npy", mmap_mode="r"))
+
+
+def shared_index_dir(statcast_csv) -> Path:
+    return Path(statcast_csv).parent / f"{Path(statcast_csv).stem}_pitch_index"
+
+
+@contextmanager
+def export_lock(directory):
+    """
+    Held while an export is checked and written, so processes starting together export it once and never attach
+    between the old export being moved aside and the new one moved in
+    """
+    with open(f"{directory}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def source_stamp(statcast_csv) -> list:
+    """Mtime and size of the csv an export was made from"""
+    stat = os.stat(statcast_csv)
+    return [stat.st_mtime, stat.st_size]
+
+
+def load_pitch_index(statcast_csv) -> PitchIndex:
+    """
+    The pitch index for a Statcast csv, mapped from the exported directory next to it.
+    The csv is only read when the export is missing or was made from a different version of it.
+    """
+    directory = shared_index_dir(statcast_csv)
+    source = source_stamp(statcast_csv)
+    meta_path = directory / "meta.json"
+    with export_lock(directory):
+        if meta_path.exists():
+            with open(meta_path) as f:
+                if json.load(f).get("source") == source:
+                    return PitchIndex.attach(directory)
+        PitchIndex.from_csv(statcast_csv).export(directory, source)
+        return PitchIndex.attach(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the pitch-level Statcast index")
+    parser.add_argument("--statcast", help="statcast pitch csv, by default a stub is built from games/")
+    parser.add_argument("--output", help="by default next to the statcast csv, where load_pitch_index maps it from")
+    args = parser.parse_args()
+
+    if args.statcast:
+        output = args.output or shared_index_dir(args.statcast)
+        index = PitchIndex.from_csv(args.statcast)
+        with export_lock(output):
+            index.export(output, source_stamp(args.statcast))
+    else:
+        output = args.output or PITCH_INDEX_DIR
+        game_pks = sorted(int(path.name.split("_")[1]) for path in Path("games").glob("game_*_decisions.csv"))
+        index = PitchIndex.from_frame(build_statcast_stub(game_pks))
+        index.export(output)
+    print(f"Indexed {len(index)} pitches of {len(index.game_pks)} games in {output}")
@@ -0,0 +1,161 @@
+import difflib
+import json
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+
+from unidecode import unidecode
+
+from event_handlers import process_name
+
+SUFFIX_PATTERN = re.compile(r'\s+(jr|sr|ii|iii|iv|v)\.?$', re.IGNORECASE)
+NGRAM_SIZE = 3
+
+
+def alias_keys(name: str) -> set:
+    """Every exact-match spelling we accept for a name: processed, unidecoded, without suffix and without dots"""
+    keys = set()
+    for variant in {name, unidecode(name)}:
+        processed = process_name(variant)
+        keys.add(processed)
+        without_suffix = SUFFIX_PATTERN.sub('', processed)
+        keys.add(without_suffix)
+        # "J.P. Crawford", "J. P. Crawford" and "JP Crawford" all become "jp crawford"
+        keys.add(re.sub(r'\.\s*', '', without_suffix).strip())
+        keys.add(re.sub(r'\.\s*', '', processed).strip())
+    keys.discard('')
+    return keys
+
+
+def registry_cache_path(scraped_dir) -> Path:
+    """Where the registry of a scraped directory is cached, next to it like scraped_games_player_registry.json"""
+    scraped_dir = Path(scraped_dir)
+    return scraped_dir.with_name(f"{scraped_dir.name}_player_registry.json")
+
+
+def source_stamps(scraped_dir) -> dict:
+    return {path.name: [os.path.getmtime(path), os.path.getsize(path)]
+            for path in sorted(Path(scraped_dir).glob("game_*.json"))}
+
+
+def ngrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+class PlayerRegistry:
+    """Season-wide index from every observed spelling of a player's name to their MLB id"""
+
+    def __init__(self):
+        self.names = defaultdict(set)  # player id -> observed names
+        self.aliases = defaultdict(set)  # alias key -> player ids
+        self.ngram_index = defaultdict(set)  # character n-gram -> alias keys
+
+    def add(self, player_id: int, name: str):
+        if name in self.names[player_id]:
+            return
+        self.names[player_id].add(name)
+        for key in alias_keys(name):
+            self.aliases[key].add(player_id)
+            for gram in ngrams(key):
+                self.ngram_index[gram].add(key)
+
+    def add_player_map(self, player_map: dict):
+        for player_id, name in player_map.items():
+            self.add(int(player_id), name)
+
+    def add_game(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        self.add_player_map(data.get('home_player_map', {}))
+        self.add_player_map(data.get('away_player_map', {}))
+
+    @classmethod
+    def build(cls, scraped_dir: str = "scraped_games") -> "PlayerRegistry":
+        registry = cls()
+        for path in sorted(Path(scraped_dir).glob("game_*.json")):
+            registry.add_game(path)
+        return registry
+
+    @classmethod
+    def load_or_build(cls, scraped_dir: str = "scraped_games", cache_path=None) -> "PlayerRegistry":
+        """
+        The registry of a scraped directory, cached with the mtime and size of every game it was built from. Only
+        games scraped since are read; a changed or removed game rebuilds it from scratch.
+        """
+        cache_path = Path(cache_path or registry_cache_path(scraped_dir))
+        stamps = source_stamps(scraped_dir)
+        cached = None
+        if cache_path.exists():
+            with open(cache_path) as f:
+                cached = json.load(f)
+        if cached is not None and all(stamps.get(name) == stamp for name, stamp in cached["sources"].items()):
+            registry = cls.from_names(cached["names"])
+            new = [name for name in stamps if name not in cached["sources"]]
+        else:
+            registry = cls()
+            new = list(stamps)
+        if cached is None or new or len(cached["sources"]) != len(stamps):
+            for name in new:
+                registry.add_game(Path(scraped_dir) / name)
+            # Written aside and moved into place, so a process reading the cache never sees half of it
+            temp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+            with open(temp_path, 'w') as f:
+                json.dump({"sources": stamps, "names": registry.names_by_id()}, f)
+            os.replace(temp_path, cache_path)
+        return registry
+
+    def lookup(self, name: str, player_map: dict = None):
+        """
+        Resolve a name with hash lookups only. With a player_map the answer is limited to the players in it.
+        Returns None when the name is unknown or ambiguous.
+        """
+        candidates = set()
+        for key in alias_keys(name):
+            candidates |= self.aliases.get(key, set())
+        if player_map is not None:
+            candidates = {player_id for player_id in candidates if player_id in player_map}
+        return next(iter(candidates)) if len(candidates) == 1 else None
+
+    def search(self, name: str, player_map: dict = None, cutoff: float = 0.6):
+        """Fuzzy fallback for novel spellings, shortlisting alias keys that share n-grams with the name"""
+        query = process_name(name)
+        shared = defaultdict(int)
+        for gram in ngrams(query):
+            for key in self.ngram_index.get(gram, ()):
+                shared[key] += 1
+        if player_map is not None:
+            shared = {key: count for key, count in shared.items()
+                      if any(player_id in player_map for player_id in self.aliases[key])}
+        shortlist = sorted(shared, key=lambda key: (-shared[key], key))[:20]
+        matches = difflib.get_close_matches(query, shortlist, n=1, cutoff=cutoff)
+        if not matches:
+            return None
+        player_ids = [player_id for player_id in self.aliases[matches[0]]
+                      if player_map is None or player_id in player_map]
+        return player_ids[0] if len(player_ids) == 1 else None
+
+    def resolve(self, name: str, player_map: dict = None):
+        player_id = self.lookup(name, player_map)
+        return player_id if player_id is not None else self.search(name, player_map)
+
+    def names_by_id(self) -> dict:
+        return {str(player_id): sorted(names) for player_id, names in self.names.items()}
+
+    @classmethod
+    def from_names(cls, names_by_id: dict) -> "PlayerRegistry":
+        registry = cls()
+        for player_id, names in names_by_id.items():
+            for name in names:
+                registry.add(int(player_id), name)
+        return registry
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.names_by_id(), f)
+
+    @classmethod
+    def load(cls, path) -> "PlayerRegistry":
+        with open(path) as f:
+            return cls.from_names(json.load(f))
@@ -0,0 +1,130 @@
+import json
+import os
+import time
+from functools import wraps
+from pathlib import Path
+
+# The active profile, None when instrumentation is off so the hot path only pays for one check
+active_profile = None
+
+# Setting this environment variable turns profiling on in every process that imports this module,
+# which is how worker processes pick it up
+PROFILE_ENV_VAR = "REPLAY_PROFILE"
+
+
+class ReplayProfile:
+    """Call counts, cumulative time and max time keyed by (category, name)"""
+
+    def __init__(self):
+        # (category, name) -> [count, total seconds, max seconds]
+        self.stats = {}
+
+    def record(self, category: str, name: str, seconds: float):
+        entry = self.stats.get((category, name))
+        if entry is None:
+            self.stats[(category, name)] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+    def merge(self, other: "ReplayProfile"):
+        for key, (count, total, maximum) in other.stats.items():
+            entry = self.stats.get(key)
+            if entry is None:
+                self.stats[key] = [count, total, maximum]
+            else:
+                entry[0] += count
+                entry[1] += total
+                entry[2] = max(entry[2], maximum)
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "entries": [
+                {"category": category, "name": name, "count": count, "total": total, "max": maximum}
+                for (category, name), (count, total, maximum) in self.sorted_items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ReplayProfile":
+        profile = cls()
+        for entry in data["entries"]:
+            profile.stats[(entry["category"], entry["name"])] = [entry["count"], entry["total"], entry["max"]]
+        return profile
+
+    def sorted_items(self):
+        return sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)
+
+    def write(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path) -> "ReplayProfile":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def format_table(self, limit: int = None) -> str:
+        lines = [f"{'category':<10}{'name':<38}{'calls':>9}{'total s':>11}{'mean ms':>10}{'max ms':>10}"]
+        for (category, name), (count, total, maximum) in self.sorted_items()[:limit]:
+            lines.append(f"{category:<10}{name[:37]:<38}{count:>9}{total:>11.3f}"
+                         f"{1000 * total / count:>10.3f}{1000 * maximum:>10.3f}")
+        return "\n".join(lines)
+
+
+def enable_profiling() -> ReplayProfile:
+    global active_profile
+    if active_profile is None:
+        active_profile = ReplayProfile()
+    return active_profile
+
+
+def disable_profiling() -> ReplayProfile:
+    global active_profile
+    profile, active_profile = active_profile, None
+    return profile
+
+
+def merge_profiles(paths) -> ReplayProfile:
+    """Combine profiles dumped by separate worker processes"""
+    merged = ReplayProfile()
+    for path in paths:
+        merged.merge(ReplayProfile.load(path))
+    return merged
+
+
+def profiled(category: str):
+    """Decorator that records the wrapped function's runtime when profiling is on"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = active_profile
+            if profile is None:
+                return func(*args, **kwargs)
+            ts = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.record(category, func.__name__, time.perf_counter() - ts)
+        return wrapper
+    return decorator
+
+
+if os.environ.get(PROFILE_ENV_VAR):
+    enable_profiling()
+
+
+if __name__ == "__main__":
+    # Merge the per-process profile dumps given on the command line into one report
+    import sys
+
+    merged = merge_profiles(sys.argv[1:])
+    merged.write("profiles/replay_profile_merged.json")
+    print(merged.format_table())
@@ -0,0 +1,219 @@
+import argparse
+import http.client
+import io
+import json
+import multiprocessing as mp
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from query_service import PLAYER_ROLES, PlayerIndex, load_service, make_server
+from season_columns import GAMES_DIR, SEASON_DIR, decision_csv_path, load_season
+from situation_index import INDEX_DIR
+
+# Share of each kind of query in the mix
+QUERY_MIX = {"games": 0.4, "players": 0.35, "situations": 0.25}
+# Popularity of the i-th most asked for game, player or situation falls off like 1 / i ** ZIPF_EXPONENT
+ZIPF_EXPONENT = 1.1
+SITUATION_VALUES = {
+    "bases": ["0", "1", "2", "3", "12", "13", "23", "123"],
+    "outs": ["0", "1", "2"],
+    "innings": ["1-3", "4-6", "7-8", "9-"],
+    "half": ["Top", "Bot"],
+    "deficit": ["-3--1", "0", "1", "2-"],
+}
+# What a tool asks for besides the rows' key, each added to a query with the given chance. A player's whole season
+# runs to thousands of rows, so tools page through it or take a few columns
+OPTIONS = {
+    "games": {"decisions=1": 0.3},
+    "players": {"decisions=1": 0.5, "columns=game_pk,row,Event_Type,Inning,Half,Outs,Score_Deficit": 0.5,
+                "limit=500": 0.5},
+    "situations": {"decisions=1": 0.5, "columns=game_pk,row,Event_Type,Inning,Score_Deficit": 0.5,
+                   "limit=500": 0.7},
+}
+
+
+def _zipf_choices(rng: random.Random, items: list, count: int) -> list:
+    weights = 1 / np.arange(1, len(items) + 1) ** ZIPF_EXPONENT
+    return rng.choices(items, weights=weights.tolist(), k=count)
+
+
+def _with_options(rng: random.Random, path: str, kind: str, params: list, full_rows: bool) -> str:
+    params = params + [option for option, chance in OPTIONS[kind].items()
+                       if rng.random() < chance and not (full_rows and option.startswith(("columns", "limit")))]
+    return path + ("?" + "&".join(params) if params else "")
+
+
+def query_mix(season, players: PlayerIndex, queries: int, seed: int = 0, full_rows: bool = False) -> list:
+    """
+    (kind, path) of a day of tool traffic. Games, players and situations are picked with Zipf popularity, so some
+    are asked for again and again, and each gets its OPTIONS. With full_rows every query takes every column and
+    row of its result.
+    """
+    rng = random.Random(seed)
+    kinds = rng.choices(list(QUERY_MIX), weights=list(QUERY_MIX.values()), k=queries)
+    game_pks = season.game_pks.tolist()
+    rng.shuffle(game_pks)
+    # Regulars are asked for more often, so players are ranked by how often they appear
+    player_ids = players.player_ids[np.argsort(-players.appearances(), kind="stable")].tolist()
+    roles = [None, None] + list(PLAYER_ROLES)
+    games = [_with_options(rng, f"/games/{game_pk}", "games", [], full_rows) for game_pk in game_pks]
+    people = [_with_options(rng, f"/players/{player_id}", "players",
+                            [f"role={role}" for role in [rng.choice(roles)] if role], full_rows)
+              for player_id in player_ids]
+    situations = [_with_options(rng, "/situations", "situations",
+                                [f"{name}={rng.choice(values)}" for name, values in SITUATION_VALUES.items()
+                                 if rng.random() < 0.6], full_rows)
+                  for _ in range(2000)]
+    picks = {"games": iter(_zipf_choices(rng, games, queries)), "players": iter(_zipf_choices(rng, people, queries)),
+             "situations": iter(_zipf_choices(rng, situations, queries))}
+    return [(kind, next(picks[kind])) for kind in kinds]
+
+
+def run_clients(url: str, paths: list, clients: int) -> dict:
+    """Send the paths from clients threads, each over one keep-alive connection. Latencies by kind"""
+    address = urlsplit(url)
+    latencies = {kind: [] for kind in QUERY_MIX}
+    errors = []
+    sent = {"bytes": 0}
+    lock = threading.Lock()
+    work = iter(paths)
+
+    def client():
+        connection = http.client.HTTPConnection(address.hostname, address.port, timeout=60)
+        while True:
+            with lock:
+                item = next(work, None)
+            if item is None:
+                break
+            kind, path = item
+            start = time.perf_counter()
+            connection.request("GET", path)
+            response = connection.getresponse()
+            body = response.read()
+            seconds = time.perf_counter() - start
+            with lock:
+                latencies[kind].append(seconds)
+                sent["bytes"] += len(body)
+                if response.status != 200:
+                    errors.append(f"{path}: {response.status} {body[:200]}")
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"seconds": time.perf_counter() - start, "latencies": latencies, "errors": errors, "bytes": sent["bytes"]}
+
+
+def get(url: str, path: str) -> bytes:
+    address = urlsplit(url)
+    connection = http.client.HTTPConnection(address.hostname, address.port, timeout=60)
+    connection.request("GET", path)
+    body = connection.getresponse().read()
+    connection.close()
+    return body
+
+
+def verify_games(url: str, game_pks, games_dir=GAMES_DIR) -> list:
+    """Games whose rows from the service, read like a decision CSV, differ from their decision CSV"""
+    mismatched = []
+    for game_pk in game_pks:
+        served = pd.read_csv(io.BytesIO(get(url, f"/games/{game_pk}?format=csv"))).drop(columns=["game_pk", "row"])
+        if not served.equals(pd.read_csv(decision_csv_path(game_pk, games_dir))):
+            mismatched.append(game_pk)
+    return mismatched
+
+
+def csv_lookup_seconds(game_pks, games_dir=GAMES_DIR) -> float:
+    """Median seconds of looking a game up the way the tools did before, by reading its decision CSV"""
+    seconds = []
+    for game_pk in game_pks:
+        start = time.perf_counter()
+        pd.read_csv(decision_csv_path(game_pk, games_dir))
+        seconds.append(time.perf_counter() - start)
+    return float(np.median(seconds))
+
+
+def _serve(season_dir, index_dir, port, ready):
+    server = make_server(load_service(season_dir, index_dir), port=port)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the query service with a skewed mix of lookups")
+    parser.add_argument("--url", help="a running service, otherwise one is started in a separate process")
+    parser.add_argument("--season-dir", default=SEASON_DIR)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--games-dir", default=GAMES_DIR)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=4, help="concurrent keep-alive connections")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verify", type=int, default=20, help="games whose rows are checked against their CSV")
+    parser.add_argument("--full-rows", action="store_true", help="every query takes all columns and rows")
+    parser.add_argument("--min-qps", type=float, default=200, help="exit with 1 below this many queries per second")
+    parser.add_argument("--report", help="write the figures as JSON")
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if url is None:
+        ready = mp.get_context("fork").Queue()
+        server = mp.get_context("fork").Process(target=_serve, args=(args.season_dir, args.index_dir, 0, ready),
+                                                daemon=True)
+        start = time.perf_counter()
+        server.start()
+        url = f"http://127.0.0.1:{ready.get(timeout=300)}"
+        print(f"Service started in {time.perf_counter() - start:.2f}s at {url}")
+    try:
+        season = load_season(args.season_dir)
+        paths = query_mix(season, PlayerIndex.build(season), args.queries, args.seed, args.full_rows)
+        result = run_clients(url, paths, args.clients)
+        stats = json.loads(get(url, "/stats"))
+        game_pks = random.Random(args.seed).sample(season.game_pks.tolist(), min(args.verify, len(season.game_pks)))
+        checked = game_pks and Path(args.games_dir).exists()
+        mismatched = verify_games(url, game_pks, args.games_dir) if checked else None
+        csv_seconds = csv_lookup_seconds(game_pks, args.games_dir) if checked else None
+    finally:
+        if server is not None:
+            server.terminate()
+
+    qps = args.queries / result["seconds"]
+    report = {"queries": args.queries, "clients": args.clients, "seconds": result["seconds"], "qps": qps,
+              "megabytes": result["bytes"] / 1e6, "errors": len(result["errors"]), "cache": stats["cache"],
+              "latency_ms": {}, "csv_lookup_ms": csv_seconds * 1000 if csv_seconds is not None else None,
+              "mismatched_games": mismatched}
+    print(f"{args.queries} queries from {args.clients} clients in {result['seconds']:.2f}s: {qps:.0f} per second, "
+          f"{report['megabytes']:.1f} MB, {len(result['errors'])} errors")
+    for kind, latencies in result["latencies"].items():
+        if latencies:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            report["latency_ms"][kind] = {"count": len(latencies), "p50": p50, "p95": p95, "p99": p99}
+            print(f"  {kind:<11}{len(latencies):>6} queries, p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms")
+    cache = stats["cache"]
+    print(f"Cache: {cache['hit_rate']:.0%} hits, {cache['entries']} entries, {cache['bytes'] / 1e6:.1f} MB, "
+          f"{cache['evictions']} evictions")
+    if csv_seconds is not None:
+        print(f"Reading a game's decision CSV instead takes {csv_seconds * 1000:.2f} ms (median)")
+    if mismatched is not None:
+        print(f"{len(game_pks) - len(mismatched)} of {len(game_pks)} games match their decision CSV"
+              + (f", mismatched: {mismatched[:10]}" if mismatched else ""))
+    for error in result["errors"][:5]:
+        print(f"  {error}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if result["errors"] or mismatched or qps < args.min_qps else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
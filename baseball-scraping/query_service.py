@@ -0,0 +1,411 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+try:
+    # orjson encodes rows about five times faster than json. It's optional, json is used without it
+    import orjson
+except ImportError:
+    orjson = None
+
+from game_data import DECISION_COLUMNS
+from season_columns import SEASON_DIR, HALF_CODES, BASE_COLUMNS, LINEUP_COLUMNS, FIELDER_COLUMNS, PLAYER_COLUMNS
+from season_columns import load_season, build_season
+from situation_index import (INDEX_DIR, build_situation_index, check_outs, index_is_current, load_situation_index,
+                             parse_bases, parse_range)
+
+PORT = 8050
+# Results of up to STREAM_ROWS rows go out as one body. Larger ones are sent with chunked encoding, CHUNK_ROWS rows
+# at a time, so the whole body is never encoded before the first rows go out.
+STREAM_ROWS = 2000
+CHUNK_ROWS = 2000
+CACHE_BYTES = 64 * 1024 * 1024
+CACHE_ENTRIES = 4096
+# Encoded results are cached up to this share of the cache each, the row numbers of every query are cached
+CACHED_BODY_SHARE = 8
+# The column groups a player lookup can be limited to
+PLAYER_ROLES = {
+    "lineup": LINEUP_COLUMNS["Home"] + LINEUP_COLUMNS["Away"],
+    "base": BASE_COLUMNS,
+    "fielder": FIELDER_COLUMNS["Home"] + FIELDER_COLUMNS["Away"],
+    "pitcher": ["Home_Pitcher", "Away_Pitcher"],
+}
+RESULT_COLUMNS = ["game_pk", "row"] + DECISION_COLUMNS
+# Columns where -1 means an empty cell
+EMPTY_AS_MINUS_ONE = set(PLAYER_COLUMNS) | {"At_Bat"}
+HALF_NAMES = np.array([None] + sorted(HALF_CODES, key=HALF_CODES.get), dtype=object)
+
+
+class PlayerIndex:
+    """
+    Every (player, season row, column) where a player id appears, sorted by player and row. The entries of
+    player_ids[i] are offsets[i]:offsets[i + 1], so a lookup is a binary search and a slice.
+    """
+
+    def __init__(self, player_ids: np.ndarray, offsets: np.ndarray, rows: np.ndarray, columns: np.ndarray):
+        self.player_ids = player_ids
+        self.offsets = offsets
+        self.rows = rows
+        # Index into PLAYER_COLUMNS of each entry
+        self.columns = columns
+
+    @classmethod
+    def build(cls, season) -> "PlayerIndex":
+        ids, rows, codes = [], [], []
+        for code, column in enumerate(PLAYER_COLUMNS):
+            values = np.asarray(season[column])
+            present = np.flatnonzero(values != -1)
+            ids.append(values[present])
+            rows.append(present.astype(np.int32))
+            codes.append(np.full(len(present), code, dtype=np.int8))
+        ids, rows, codes = np.concatenate(ids), np.concatenate(rows), np.concatenate(codes)
+        order = np.lexsort((rows, ids))
+        ids = ids[order]
+        player_ids, starts = np.unique(ids, return_index=True)
+        return cls(player_ids, np.append(starts, len(ids)), rows[order], codes[order])
+
+    def lookup(self, player_id: int, role: str = None) -> np.ndarray:
+        """Season rows a player appears in, in any column or only in those of a role of PLAYER_ROLES"""
+        index = int(np.searchsorted(self.player_ids, player_id))
+        if index == len(self.player_ids) or self.player_ids[index] != player_id:
+            return np.empty(0, dtype=np.int32)
+        entries = slice(int(self.offsets[index]), int(self.offsets[index + 1]))
+        rows = self.rows[entries]
+        if role is not None:
+            codes = [PLAYER_COLUMNS.index(column) for column in PLAYER_ROLES[role]]
+            rows = rows[np.isin(self.columns[entries], codes)]
+        return np.unique(rows)
+
+    def appearances(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+
+class ResultCache:
+    """LRU cache bounded by entries and by bytes, holding row arrays and encoded bodies, whole or in chunks"""
+
+    def __init__(self, max_bytes: int = CACHE_BYTES, max_entries: int = CACHE_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def size(value) -> int:
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        return sum(len(chunk) for chunk in value) if isinstance(value, list) else len(value)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self.size(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.size(self.entries.pop(key))
+            self.entries[key] = value
+            self.bytes += size
+            while self.bytes > self.max_bytes or len(self.entries) > self.max_entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= self.size(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class QueryError(ValueError):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _int_param(params: dict, name: str, default=None):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(400, f"{name} must be an integer, not {value}") from None
+
+
+def _columns_param(params: dict) -> list:
+    if params.get("columns") is None:
+        return RESULT_COLUMNS
+    columns = params["columns"].split(",")
+    unknown = [column for column in columns if column not in RESULT_COLUMNS]
+    if unknown:
+        raise QueryError(400, f"Unknown columns {', '.join(unknown)}")
+    return columns
+
+
+def _decisions_param(params: dict):
+    value = params.get("decisions")
+    return None if value is None else value not in ("0", "false", "False")
+
+
+class QueryService:
+    """
+    Lookups of season rows by game, player and situation. Row numbers of every query are cached, and so are
+    the encoded bodies, up to a share of the cache each.
+    """
+
+    def __init__(self, season, situations, players: PlayerIndex, cache: ResultCache = None):
+        self.season = season
+        self.situations = situations
+        self.players = players
+        self.cache = cache or ResultCache()
+        self.row_game_pks = season.row_game_pks()
+        self.queries = 0
+        self.rows_sent = 0
+
+    def rows(self, kind: str, key: str, params: dict) -> np.ndarray:
+        """Season rows of /games/<game_pk>, /players/<player_id> or /situations"""
+        if kind == "games":
+            try:
+                rows = np.arange(*self.season.game_slice(int(key)).indices(len(self.season)), dtype=np.int32)
+            except (KeyError, ValueError) as e:
+                raise QueryError(404, f"No game {key} in the season") from e
+        elif kind == "players":
+            role = params.get("role")
+            if role is not None and role not in PLAYER_ROLES:
+                raise QueryError(400, f"role must be one of {', '.join(PLAYER_ROLES)}, not {role}")
+            try:
+                rows = self.players.lookup(int(key), role)
+            except ValueError:
+                raise QueryError(404, f"Not a player id: {key}") from None
+        elif kind == "situations":
+            try:
+                situation = dict(outs=check_outs(_int_param(params, "outs")), innings=parse_range(params.get("innings")),
+                                 half=params.get("half"), deficit=parse_range(params.get("deficit")))
+                if params.get("bases") is not None:
+                    situation["bases"] = parse_bases(params["bases"])
+            except ValueError as e:
+                raise QueryError(400, str(e)) from None
+            if situation["half"] is not None and situation["half"] not in HALF_CODES:
+                raise QueryError(400, f"half must be one of {', '.join(HALF_CODES)}")
+            rows = self.situations.rows(**situation).astype(np.int32, copy=False)
+        else:
+            raise QueryError(404, f"Unknown query /{kind}, use /games/<game_pk>, /players/<id> or /situations")
+        decisions = _decisions_param(params)
+        if decisions is not None:
+            rows = rows[np.asarray(self.season["Is_Decision"])[rows] == decisions]
+        return rows
+
+    def cached_rows(self, kind: str, key: str, params: dict) -> np.ndarray:
+        cache_key = ("rows", kind, key, tuple(sorted((name, value) for name, value in params.items()
+                                                     if name not in ("format", "limit", "offset", "columns"))))
+        rows = self.cache.get(cache_key)
+        if rows is None:
+            rows = self.rows(kind, key, params)
+            self.cache.put(cache_key, rows)
+        return rows
+
+    def columns(self, rows: np.ndarray, columns: list = RESULT_COLUMNS) -> list:
+        """Columns of RESULT_COLUMNS of some rows as lists, with names for codes and None for empty cells"""
+        lists = []
+        for column in columns:
+            if column == "game_pk":
+                lists.append(self.row_game_pks[rows].tolist())
+                continue
+            if column == "row":
+                lists.append(rows.tolist())
+                continue
+            values = np.asarray(self.season[column][rows])
+            if column == "Event_Type":
+                lists.append(self.season.event_type_names(values).tolist())
+            elif column == "Half":
+                lists.append(HALF_NAMES[values.astype(np.int64) + 1].tolist())
+            elif column in EMPTY_AS_MINUS_ONE:
+                cells = values.astype(object)
+                cells[values == -1] = None
+                lists.append(cells.tolist())
+            else:
+                lists.append(values.tolist())
+        return lists
+
+    def encode(self, rows: np.ndarray, columns: list, fmt: str) -> bytes:
+        records = list(zip(*self.columns(rows, columns))) if len(rows) else []
+        if fmt == "csv":
+            text = io.StringIO()
+            csv.writer(text, lineterminator="\n").writerows(records)
+            return text.getvalue().encode()
+        if orjson is not None:
+            return orjson.dumps(records)[1:-1]
+        return json.dumps(records, separators=(",", ":"))[1:-1].encode()
+
+    def chunks(self, rows: np.ndarray, total: int, columns: list, fmt: str):
+        """The body of a result in pieces of CHUNK_ROWS rows"""
+        if fmt == "csv":
+            yield (",".join(columns) + "\n").encode()
+        else:
+            yield (f'{{"columns":{json.dumps(columns, separators=(",", ":"))},"count":{total},'
+                   f'"returned":{len(rows)},"rows":[').encode()
+        for start in range(0, len(rows), CHUNK_ROWS):
+            if start and fmt != "csv":
+                yield b","
+            yield self.encode(rows[start:start + CHUNK_ROWS], columns, fmt)
+        if fmt != "csv":
+            yield b"]}"
+
+    def _stream_and_cache(self, body_key, chunks):
+        """Pass chunks on, and cache them once they are all out unless they grew past the share of a body"""
+        kept = []
+        size = 0
+        for chunk in chunks:
+            yield chunk
+            if kept is not None:
+                kept.append(chunk)
+                size += len(chunk)
+                if size > self.cache.max_bytes // CACHED_BODY_SHARE:
+                    kept = None
+        if kept is not None:
+            self.cache.put(body_key, kept)
+
+    def respond(self, path: str, params: dict) -> tuple:
+        """
+        (status, content type, body) of a request. The body is bytes, or an iterator of byte chunks for results
+        over STREAM_ROWS rows. Every query takes format (json or csv), columns (a comma separated subset of
+        RESULT_COLUMNS), decisions (1 or 0) and offset and limit to page through the rows.
+        """
+        self.queries += 1
+        parts = [part for part in path.split("/") if part]
+        if parts == ["stats"]:
+            return 200, "application/json", json.dumps(self.stats()).encode()
+        fmt = params.get("format", "json")
+        if fmt not in ("json", "csv"):
+            raise QueryError(400, "format must be json or csv")
+        if not parts or len(parts) > 2 or (len(parts) == 2) == (parts[0] == "situations"):
+            raise QueryError(404, f"Unknown query {path}, use /games/<game_pk>, /players/<id> or /situations")
+        kind, key = parts[0], parts[1] if len(parts) == 2 else None
+        content_type = "text/csv" if fmt == "csv" else "application/json"
+
+        body_key = ("body", path, tuple(sorted(params.items())))
+        body = self.cache.get(body_key)
+        if body is not None:
+            return 200, content_type, body
+        columns = _columns_param(params)
+        rows = self.cached_rows(kind, key, params)
+        total = len(rows)
+        offset = max(_int_param(params, "offset", 0), 0)
+        limit = _int_param(params, "limit")
+        rows = rows[offset:] if limit is None else rows[offset:offset + max(limit, 0)]
+        self.rows_sent += len(rows)
+        if len(rows) > STREAM_ROWS:
+            return 200, content_type, self._stream_and_cache(body_key, self.chunks(rows, total, columns, fmt))
+        body = b"".join(self.chunks(rows, total, columns, fmt))
+        if len(body) <= self.cache.max_bytes // CACHED_BODY_SHARE:
+            self.cache.put(body_key, body)
+        return 200, content_type, body
+
+    def stats(self) -> dict:
+        return {"rows": len(self.season), "games": len(self.season.game_pks),
+                "players": len(self.players.player_ids), "queries": self.queries, "rows_sent": self.rows_sent,
+                "cache": self.cache.stats()}
+
+
+def load_service(season_dir=SEASON_DIR, index_dir=INDEX_DIR, rebuild=False, cache_bytes=CACHE_BYTES) -> QueryService:
+    """
+    The season and its situation index from disk, building either when it is missing, or both from games/
+    with rebuild. The player index is built in memory.
+    """
+    if rebuild or not (Path(season_dir) / "meta.json").exists():
+        build_season(season_dir=season_dir)
+    season = load_season(season_dir)
+    if rebuild or not index_is_current(season, season_dir, index_dir):
+        situations = build_situation_index(season_dir, index_dir, rebuild_season=False)
+        situations.season = season
+    else:
+        situations = load_situation_index(season, index_dir)
+    return QueryService(season, situations, PlayerIndex.build(season), ResultCache(cache_bytes))
+
+
+def make_server(service: QueryService, host: str = "127.0.0.1", port: int = PORT) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so a client's queries share one connection. Headers and body are separate writes, which
+        # with Nagle's algorithm wait out the client's delayed ACK, about 40 ms a query
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                status, content_type, body = service.respond(url.path, params)
+            except QueryError as e:
+                status, content_type, body = e.status, "application/json", json.dumps({"error": str(e)}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            if isinstance(body, bytes):
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in body:
+                if chunk:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve lookups of the decision dataset by game, player and situation")
+    parser.add_argument("--season-dir", default=SEASON_DIR)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the season and its index from games/ first")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--cache-mb", type=float, default=CACHE_BYTES / 1024 / 1024)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    service = load_service(args.season_dir, args.index_dir, args.rebuild, int(args.cache_mb * 1024 * 1024))
+    server = make_server(service, args.host, args.port)
+    print(f"Loaded {len(service.season)} rows of {len(service.season.game_pks)} games and "
+          f"{len(service.players.player_ids)} players in {time.perf_counter() - start:.2f}s, serving on "
+          f"http://{args.host}:{server.server_address[1]}/ (games/<game_pk>, players/<id>, situations, stats)",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from pathlib import Path
+
+import pandas as pd
+
+from event_handlers import set_player_registry
+from main import GameProcessor, load_statcast_at_bats
+from player_registry import PlayerRegistry
+from statcast_at_bats import at_bats_from_decisions
+
+DEFAULT_ENGINE = "main:replay_game"
+
+# Worker process globals, set once per process by _init_worker
+_engine = None
+_processor = None
+_statcast_by_game = None
+_golden_dir = None
+
+
+def load_engine(spec: str):
+    """Resolve a 'module:function' spec to a replay function taking (game_data, at_bat_summary)"""
+    module_name, function_name = spec.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def read_decisions_as_text(source) -> pd.DataFrame:
+    # Compare the text that ends up on disk so dtype inference can't hide or invent differences
+    return pd.read_csv(source, dtype=str, keep_default_na=False)
+
+
+def diff_decisions(produced: pd.DataFrame, golden: pd.DataFrame) -> dict:
+    """Column by column comparison of a replayed game against its committed decision rows"""
+    buffer = StringIO()
+    produced.to_csv(buffer, index=False)
+    buffer.seek(0)
+    produced = read_decisions_as_text(buffer)
+
+    result = {
+        "rows_produced": len(produced),
+        "rows_golden": len(golden),
+        "missing_columns": sorted(set(golden.columns) - set(produced.columns)),
+        "mismatched_cells": 0,
+        "mismatched_rows": 0,
+        "by_column": {},
+        "by_event_type": {},
+        "first_mismatches": [],
+    }
+
+    rows = min(len(produced), len(golden))
+    columns = [column for column in golden.columns if column in produced.columns]
+    left = produced[columns].iloc[:rows].reset_index(drop=True)
+    right = golden[columns].iloc[:rows].reset_index(drop=True)
+    mismatches = left.ne(right)
+
+    row_mask = mismatches.any(axis=1)
+    result["mismatched_cells"] = int(mismatches.values.sum())
+    result["mismatched_rows"] = int(row_mask.sum())
+    result["by_column"] = {column: int(count) for column, count in mismatches.sum().items() if count}
+    result["by_event_type"] = {event_type: int(count)
+                               for event_type, count in right.loc[row_mask, "Event_Type"].value_counts().items()}
+
+    for index in row_mask[row_mask].index[:5]:
+        changed = mismatches.columns[mismatches.loc[index]]
+        result["first_mismatches"].append({
+            "row": int(index),
+            "event_type": right.at[index, "Event_Type"],
+            "cells": {column: {"produced": left.at[index, column], "golden": right.at[index, column]}
+                      for column in changed},
+        })
+    return result
+
+
+def _init_worker(engine_spec, scraped_dir, golden_dir, statcast_csv, registry=None):
+    global _engine, _processor, _statcast_by_game, _golden_dir
+    logging.disable(logging.CRITICAL)
+    set_player_registry(registry)
+    _engine = load_engine(engine_spec)
+    _processor = GameProcessor(scraped_dir)
+    _golden_dir = Path(golden_dir)
+    if statcast_csv:
+        statcast = load_statcast_at_bats(statcast_csv)
+        _statcast_by_game = {game_pk: at_bats for game_pk, at_bats in statcast.groupby('game_pk')}
+
+
+def compare_game(game_pk: int) -> dict:
+    golden_path = _golden_dir / f"game_{game_pk}_decisions.csv"
+    if not golden_path.exists():
+        return {"game_pk": game_pk, "status": "no_golden"}
+
+    golden = read_decisions_as_text(golden_path)
+    if _statcast_by_game is not None:
+        at_bat_summary = _statcast_by_game.get(game_pk)
+    else:
+        at_bat_summary = at_bats_from_decisions(golden, game_pk)
+
+    ts = time.perf_counter()
+    try:
+        produced = _engine(_processor.load_game_data(str(game_pk)), at_bat_summary)
+    except Exception as e:
+        return {"game_pk": game_pk, "status": "error", "error": f"{type(e).__name__}: {e}"}
+    elapsed = time.perf_counter() - ts
+
+    result = diff_decisions(produced, golden)
+    result["game_pk"] = game_pk
+    result["seconds"] = elapsed
+    identical = (result["rows_produced"] == result["rows_golden"] and not result["mismatched_cells"]
+                 and not result["missing_columns"])
+    result["status"] = "identical" if identical else "mismatch"
+    return result
+
+
+def run_regression(game_pks, engine_spec=DEFAULT_ENGINE, workers=None, scraped_dir="scraped_games",
+                   golden_dir="games", statcast_csv=None, use_player_registry=True) -> dict:
+    # Names resolve through the season registry like create_dataset does by default, built once here
+    registry = PlayerRegistry.load_or_build(scraped_dir) if use_player_registry else None
+    init_args = (engine_spec, scraped_dir, golden_dir, statcast_csv, registry)
+    start = time.perf_counter()
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        _init_worker(*init_args)
+        games = [compare_game(game_pk) for game_pk in game_pks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as executor:
+            games = list(executor.map(compare_game, game_pks, chunksize=8))
+
+    statuses = Counter(game["status"] for game in games)
+    by_event_type = Counter()
+    by_column = Counter()
+    for game in games:
+        by_event_type.update(game.get("by_event_type", {}))
+        by_column.update(game.get("by_column", {}))
+
+    return {
+        "engine": engine_spec,
+        "games": len(games),
+        "wall_seconds": time.perf_counter() - start,
+        "statuses": dict(statuses),
+        "mismatched_rows_by_event_type": dict(by_event_type.most_common()),
+        "mismatched_cells_by_column": dict(by_column.most_common()),
+        "mismatched_games": [game for game in games if game["status"] == "mismatch"],
+        "errored_games": [game for game in games if game["status"] == "error"],
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [f"Engine {report['engine']}: {report['games']} games in {report['wall_seconds']:.1f} seconds",
+             "Statuses: " + ", ".join(f"{status}={count}" for status, count in sorted(report["statuses"].items()))]
+    if report["mismatched_rows_by_event_type"]:
+        lines.append("Mismatched rows by event type:")
+        lines.extend(f"  {event_type:<32}{count:>7}"
+                     for event_type, count in report["mismatched_rows_by_event_type"].items())
+    if report["mismatched_cells_by_column"]:
+        lines.append("Mismatched cells by column:")
+        lines.extend(f"  {column:<32}{count:>7}" for column, count in report["mismatched_cells_by_column"].items())
+    for game in report["errored_games"]:
+        lines.append(f"Game {game['game_pk']} failed: {game['error']}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay games and diff the decision rows against games/")
+    parser.add_argument("--games-csv", default="urls/gameday_urls2023.csv", help="csv with a game_pk column")
+    parser.add_argument("--game-pk", type=int, action="append", help="replay only these games, may be repeated")
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, help="replay function as module:function")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--statcast", help="statcast csv, by default a stub is built from the golden rows")
+    parser.add_argument("--golden-dir", default="games")
+    parser.add_argument("--report", default="regression_report.json")
+    parser.add_argument("--no-player-registry", action="store_true",
+                        help="resolve names without the season registry, like main.py --no-player-registry")
+    args = parser.parse_args(argv)
+
+    game_pks = args.game_pk or [int(game_pk) for game_pk in pd.read_csv(args.games_csv)['game_pk']]
+    report = run_regression(game_pks, args.engine, args.workers, golden_dir=args.golden_dir,
+                            statcast_csv=args.statcast, use_player_registry=not args.no_player_registry)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(format_report(report))
+    print(f"Full report written to {args.report}")
+    return 0 if set(report["statuses"]) <= {"identical", "no_golden"} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import argparse
+import copy
+import logging
+import random
+
+import pandas as pd
+
+from event_cache import load_parsed_events
+from event_handlers import set_player_registry
+from main import STATCAST_CSV, GameProcessor, GameReplay, initial_game_state, game_events, replay_game
+from pitch_index import load_pitch_index
+from player_registry import PlayerRegistry
+from statcast_at_bats import index_at_bats
+
+
+class ReplaySession:
+    """
+    One game replayed event by event, with a GameState checkpoint before every event. When a play that was
+    already replayed changes, like a challenge overturning the call or a scorer correction, revise() rolls the
+    state and the decision rows back to that play's checkpoint and replays from there, instead of replaying
+    the game from the first pitch.
+    """
+
+    def __init__(self, game_data, at_bat_summary: pd.DataFrame = None, at_bat_index: dict = None):
+        game_state, player_map = initial_game_state(game_data)
+        # Journaling from the start, so the replay keeps every change and any event can be rolled back to
+        game_state.checkpoint()
+        self.replay = GameReplay(game_state, player_map,
+                                 at_bat_index if at_bat_index is not None else index_at_bats(at_bat_summary))
+
+    def __len__(self):
+        return len(self.replay)
+
+    @property
+    def decisions(self) -> pd.DataFrame:
+        return self.replay.decision_df
+
+    @property
+    def events(self) -> list:
+        """(event, inning number, half, actions, skip_parse) of every replayed event"""
+        return self.replay.events
+
+    def append(self, event, inning_number, half, actions=None):
+        """Replay the next event. An event that fails leaves the session as it was before it"""
+        self.replay.append(event, inning_number, half, actions)
+
+    def rewind(self, index: int) -> int:
+        """Drop event index and every event after it. Returns the number of changes undone"""
+        return self.replay.rewind(index)
+
+    def revise(self, index: int, event, actions=None) -> int:
+        """
+        Replace event index with a corrected version and replay the events after it again.
+        Returns the number of changes undone to get back to the event.
+        """
+        later = self.events[index + 1:]
+        _, inning_number, half, _, _ = self.events[index]
+        undone = self.rewind(index)
+        self.append(event, inning_number, half, actions)
+        for replayed in later:
+            self.replay.append(*replayed)
+        return undone
+
+
+def replay_session(game_data, at_bat_summary, parsed_events=None, at_bat_index=None) -> ReplaySession:
+    session = ReplaySession(game_data, at_bat_summary, at_bat_index)
+    for i, (event, inning_number, half) in enumerate(game_events(game_data)):
+        session.append(event, inning_number, half, parsed_events[i] if parsed_events is not None else None)
+    return session
+
+
+def replay_revised(game_data, at_bat_summary: pd.DataFrame) -> pd.DataFrame:
+    """Regression engine that replays a game, then revises its middle event with itself"""
+    session = replay_session(game_data, at_bat_summary)
+    if len(session):
+        index = len(session) // 2
+        session.revise(index, session.events[index][0])
+    return session.decisions
+
+
+def _replay_or_none(replay):
+    try:
+        return replay().to_csv(index=False)
+    except Exception:
+        return None
+
+
+def check_game(game_data, parsed_events, at_bat_index, revisions: int, rng: random.Random) -> dict:
+    """
+    Compare a session with replay_game after replaying every event, after revising random events with
+    themselves, and after revising one of them with the description of another event of the same type.
+    """
+    result = {"identical": 0, "mismatched": 0, "undone": 0, "replayed": 0}
+
+    def compare(session_csv, expected_csv):
+        result["identical" if session_csv == expected_csv else "mismatched"] += 1
+
+    expected = _replay_or_none(lambda: replay_game(game_data, None, parsed_events, at_bat_index=at_bat_index))
+    try:
+        session = replay_session(game_data, None, parsed_events, at_bat_index)
+    except Exception:
+        compare(None, expected)
+        return result
+    compare(session.decisions.to_csv(index=False), expected)
+    if not len(session):
+        return result
+
+    for _ in range(revisions):
+        index = rng.randrange(len(session))
+        event, _, _, actions, _ = session.events[index]
+        result["undone"] += session.revise(index, event, actions)
+        result["replayed"] += len(session) - index
+        compare(session.decisions.to_csv(index=False), expected)
+
+    # Revise a play into a different one of the same type, parsed from its new description
+    events = game_events(game_data)
+    candidates = [(i, j) for i, (event, _, _) in enumerate(events) for j, (other, _, _) in enumerate(events)
+                  if i != j and event['type'] == other['type'] and event['description'] != other['description']]
+    if candidates:
+        i, j = rng.choice(candidates)
+        revised_event = dict(events[i][0], description=events[j][0]['description'])
+        revised_game = copy.deepcopy(game_data)
+        game_events(revised_game)[i][0]['description'] = revised_event['description']
+        revised_parsed = None
+        if parsed_events is not None:
+            revised_parsed = list(parsed_events)
+            revised_parsed[i] = None
+        expected = _replay_or_none(lambda: replay_game(revised_game, None, revised_parsed, at_bat_index=at_bat_index))
+        try:
+            result["undone"] += session.revise(i, revised_event)
+            result["replayed"] += len(session) - i
+            produced = session.decisions.to_csv(index=False)
+        except Exception:
+            produced = None
+        compare(produced, expected)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that revising events of a replay session matches a full replay")
+    parser.add_argument("--games-csv", default="urls/gameday_urls2023.csv")
+    parser.add_argument("--num-games", type=int, default=None)
+    parser.add_argument("--scraped-dir", default="scraped_games")
+    parser.add_argument("--statcast", default=STATCAST_CSV)
+    parser.add_argument("--revisions", type=int, default=3, help="random events revised with themselves per game")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    set_player_registry(PlayerRegistry.load_or_build(args.scraped_dir))
+    processor = GameProcessor(args.scraped_dir)
+    pitch_index = load_pitch_index(args.statcast)
+    game_pks = pd.read_csv(args.games_csv)['game_pk'].tolist()[:args.num_games]
+    game_pks = [game_pk for game_pk in game_pks if (processor.scraped_dir / f"game_{game_pk}.json").exists()]
+    rng = random.Random(args.seed)
+
+    totals = {"identical": 0, "mismatched": 0, "undone": 0, "replayed": 0}
+    mismatched = []
+    for game_pk in game_pks:
+        game_data = processor.load_game_data(str(game_pk))
+        parsed_events = load_parsed_events(game_data, processor.scraped_dir / f"game_{game_pk}.json")
+        result = check_game(game_data, parsed_events, pitch_index.game(game_pk).at_bat_index(), args.revisions, rng)
+        for key, value in result.items():
+            totals[key] += value
+        if result["mismatched"]:
+            mismatched.append(game_pk)
+
+    print(f"{len(game_pks)} games, {totals['identical']} replays identical, {totals['mismatched']} mismatched, "
+          f"{totals['undone']} changes undone and {totals['replayed']} events replayed to revise")
+    if mismatched:
+        print(f"Mismatched games: {mismatched}")
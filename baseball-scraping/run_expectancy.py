@@ -0,0 +1,221 @@
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from season_columns import SEASON_DIR, load_season, build_season
+from situation_index import BASE_OUT_STATES, base_mask, batting_deficit
+
+TABLES_DIR = "run_expectancy"
+# Base-out states 0-23 are outs * 8 + the occupied-base mask, and END is three outs or the end of the half
+STATES = BASE_OUT_STATES - 1
+END = STATES
+TO_STATES = STATES + 1
+# Innings used for RE24. Later innings are cut short by walk-offs, so the usual tables leave them out
+RE24_MAX_INNING = 8
+# Runs on one event are counted up to a grand slam
+MAX_RUNS = 4
+RUN_VALUES = MAX_RUNS + 1
+DERIVED_COLUMNS = ["Outs", "First_Base", "Second_Base", "Third_Base", "Inning", "Half", "Score_Deficit"]
+BASE_STATE_NAMES = ["___", "1__", "_2_", "12_", "__3", "1_3", "_23", "123"]
+
+
+def derive_rows(columns: dict, game_ids: np.ndarray) -> dict:
+    """
+    Per row: the base-out state before the event, the state after it (the next row's state, or END when the
+    next row starts another half inning), the runs the batting team scored on it and the runs it scored from
+    there to the end of the half inning. Runs come from the next row's score, so the last event of a game
+    scores nothing.
+    """
+    outs = np.asarray(columns["Outs"]).astype(np.int32)
+    state = np.where(outs >= 3, END, outs * 8 + base_mask(columns["First_Base"], columns["Second_Base"],
+                                                          columns["Third_Base"]))
+    inning = np.asarray(columns["Inning"])
+    half = np.asarray(columns["Half"])
+    deficit = batting_deficit(np.asarray(columns["Score_Deficit"]).astype(np.int32), half)
+
+    same_game = game_ids[1:] == game_ids[:-1]
+    same_half = same_game & (inning[1:] == inning[:-1]) & (half[1:] == half[:-1])
+    to_state = np.full(len(state), END, dtype=np.int32)
+    to_state[:-1] = np.where(same_half, state[1:], END)
+
+    # The batting team's deficit shrinks by the runs it scores. Across a change of half the next row is
+    # from the other team's side, so its deficit is negated back first.
+    next_deficit = np.where(same_half, deficit[1:], -deficit[1:])
+    runs = np.zeros(len(state), dtype=np.int32)
+    runs[:-1] = np.where(same_game, np.maximum(deficit[:-1] - next_deficit, 0), 0)
+
+    # Runs to the end of the half inning, as the half's total minus what was scored before the row
+    half_inning = np.cumsum(np.r_[True, ~same_half])
+    scored = np.cumsum(runs)
+    half_end = np.r_[np.flatnonzero(~same_half), len(runs) - 1]
+    runs_to_end = scored[half_end][half_inning - 1] - scored + runs
+    return {
+        "from_state": state.astype(np.int8),
+        "to_state": to_state.astype(np.int8),
+        "runs": runs.astype(np.int8),
+        "runs_to_end": runs_to_end.astype(np.int16),
+    }
+
+
+def _derive_shard(args) -> dict:
+    season_dir, rows = args
+    season = load_season(season_dir, columns=DERIVED_COLUMNS)
+    game_ids = season.row_game_pks()[rows]
+    return derive_rows({column: season[column][rows] for column in DERIVED_COLUMNS}, game_ids)
+
+
+class RunTables:
+    """Transition counts and run expectancy accumulated over the derived rows of a season"""
+
+    def __init__(self, derived: dict, event_codes: np.ndarray, innings: np.ndarray, event_types: list,
+                 re24_max_inning: int = RE24_MAX_INNING):
+        self.event_types = event_types
+        from_state = derived["from_state"].astype(np.int64)
+        to_state = derived["to_state"].astype(np.int64)
+        # Rows that start with three outs are bookkeeping after the half ended
+        live = from_state < STATES
+        runs = np.minimum(derived["runs"][live], MAX_RUNS).astype(np.int64)
+        # Joint counts of (state before, state after, runs), so a simulation can draw both at once
+        cell = (from_state[live] * TO_STATES + to_state[live]) * RUN_VALUES + runs
+        self.outcomes = np.bincount(cell, minlength=STATES * TO_STATES * RUN_VALUES) \
+            .reshape(STATES, TO_STATES, RUN_VALUES)
+        event_cell = event_codes[live].astype(np.int64) * STATES * TO_STATES * RUN_VALUES + cell
+        self.event_outcomes = np.bincount(event_cell, minlength=len(event_types) * STATES * TO_STATES * RUN_VALUES) \
+            .reshape(len(event_types), STATES, TO_STATES, RUN_VALUES)
+        self.transitions = self.outcomes.sum(axis=2)
+        self.transition_runs = (self.outcomes * np.arange(RUN_VALUES)).sum(axis=2)
+        self.event_transitions = self.event_outcomes.sum(axis=3)
+        counted = live & (innings <= re24_max_inning)
+        self.state_counts = np.bincount(from_state[counted], minlength=STATES)
+        self.state_runs = np.bincount(from_state[counted], weights=derived["runs_to_end"][counted], minlength=STATES)
+
+    @property
+    def re24(self) -> np.ndarray:
+        """Runs expected from each state to the end of the half inning, NaN for states never seen"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.state_runs / self.state_counts
+
+    def re24_table(self) -> pd.DataFrame:
+        return pd.DataFrame(self.re24.reshape(3, 8).T, index=BASE_STATE_NAMES, columns=["0 outs", "1 out", "2 outs"])
+
+    def transition_probabilities(self, event_type: str = None) -> np.ndarray:
+        """Rows are the state before, columns the state after with END last; each seen row sums to 1"""
+        counts = self.transitions if event_type is None else \
+            self.event_transitions[self.event_types.index(event_type)]
+        totals = counts.sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(totals > 0, counts / totals, 0.0)
+
+    def save(self, path):
+        np.savez(path, outcomes=self.outcomes, event_outcomes=self.event_outcomes,
+                 state_counts=self.state_counts, state_runs=self.state_runs, event_types=np.array(self.event_types))
+
+    @classmethod
+    def load(cls, path) -> "RunTables":
+        """Tables saved by a build, without the derived rows"""
+        saved = np.load(path)
+        tables = cls.__new__(cls)
+        tables.event_types = saved["event_types"].tolist()
+        tables.outcomes = saved["outcomes"]
+        tables.event_outcomes = saved["event_outcomes"]
+        tables.state_counts = saved["state_counts"]
+        tables.state_runs = saved["state_runs"]
+        tables.transitions = tables.outcomes.sum(axis=2)
+        tables.transition_runs = (tables.outcomes * np.arange(RUN_VALUES)).sum(axis=2)
+        tables.event_transitions = tables.event_outcomes.sum(axis=3)
+        return tables
+
+
+def _shards(season, workers: int) -> list:
+    """Contiguous row ranges cut at game boundaries, about equal in rows"""
+    cuts = np.searchsorted(season.offsets, np.linspace(0, len(season), workers + 1), side="left")
+    bounds = np.unique(season.offsets[np.clip(cuts, 0, len(season.offsets) - 1)])
+    return [slice(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def build_run_tables(season_dir=SEASON_DIR, tables_dir=TABLES_DIR, rebuild_season=True, workers: int = None,
+                     re24_max_inning: int = RE24_MAX_INNING) -> RunTables:
+    """
+    Derive transitions for the games that are new or changed since the last build, reuse the saved rows of
+    the others, then count everything in one pass. With workers, the derivation is split into shards of
+    whole games that run in separate processes.
+    """
+    season = build_season(season_dir=season_dir) if rebuild_season else load_season(season_dir)
+    with open(Path(season_dir) / "meta.json") as f:
+        sources = json.load(f)["sources"]
+
+    tables_dir = Path(tables_dir)
+    tables_dir.mkdir(parents=True, exist_ok=True)
+    previous = None
+    previous_sources = {}
+    if (tables_dir / "meta.json").exists():
+        with open(tables_dir / "meta.json") as f:
+            meta = json.load(f)
+        previous_sources = meta["sources"]
+        previous_game_pks = np.asarray(meta["game_pks"], dtype=np.int64)
+        previous_offsets = np.asarray(meta["offsets"], dtype=np.int64)
+        previous = {column: np.load(tables_dir / f"{column}.npy") for column in meta["columns"]}
+
+    stale = np.array([previous is None or previous_sources.get(str(game_pk)) != sources[str(game_pk)]
+                      for game_pk in season.game_pks], dtype=bool)
+    derived = {}
+    if stale.all():
+        if workers and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                shards = list(executor.map(_derive_shard, [(season_dir, rows) for rows in _shards(season, workers)]))
+            derived = {column: np.concatenate([shard[column] for shard in shards]) for column in shards[0]}
+        else:
+            derived = _derive_shard((season_dir, slice(0, len(season))))
+    else:
+        pieces = []
+        for i, game_pk in enumerate(season.game_pks):
+            rows = slice(int(season.offsets[i]), int(season.offsets[i + 1]))
+            if stale[i]:
+                pieces.append(_derive_shard((season_dir, rows)))
+            else:
+                j = int(np.searchsorted(previous_game_pks, game_pk))
+                previous_rows = slice(int(previous_offsets[j]), int(previous_offsets[j + 1]))
+                pieces.append({column: values[previous_rows] for column, values in previous.items()})
+        derived = {column: np.concatenate([piece[column] for piece in pieces]) for column in pieces[0]}
+
+    (tables_dir / "meta.json").unlink(missing_ok=True)
+    for column, values in derived.items():
+        np.save(tables_dir / f"{column}.npy", values)
+    tables = RunTables(derived, np.asarray(season["Event_Type"]), np.asarray(season["Inning"]), season.event_types,
+                       re24_max_inning)
+    tables.save(tables_dir / "tables.npz")
+    with open(tables_dir / "meta.json", "w") as f:
+        json.dump({
+            "columns": list(derived),
+            "sources": {str(game_pk): sources[str(game_pk)] for game_pk in season.game_pks},
+            "game_pks": season.game_pks.tolist(),
+            "offsets": season.offsets.tolist(),
+            "derived_games": int(stale.sum()),
+            "event_types": season.event_types,
+        }, f)
+    return tables
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build base-out transition counts and the RE24 table")
+    parser.add_argument("--season-dir", default=SEASON_DIR)
+    parser.add_argument("--output", default=TABLES_DIR)
+    parser.add_argument("--no-season-rebuild", action="store_true", help="use the season file as it is")
+    parser.add_argument("--workers", type=int, default=None, help="derive a full rebuild in this many shards")
+    parser.add_argument("--event-type", help="also print the transition distribution of one event type")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tables = build_run_tables(args.season_dir, args.output, not args.no_season_rebuild, args.workers)
+    print(f"Built run tables from {int(tables.transitions.sum())} transitions in {time.perf_counter() - start:.2f}s")
+    print(tables.re24_table().round(3).to_string())
+    if args.event_type:
+        probabilities = tables.transition_probabilities(args.event_type)
+        states = [f"{BASE_STATE_NAMES[state % 8]} {state // 8}" for state in range(STATES)] + ["END"]
+        frame = pd.DataFrame(probabilities, index=states[:-1], columns=states)
+        print(frame.loc[:, (frame > 0).any()].round(3).to_string())
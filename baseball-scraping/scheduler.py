@@ -0,0 +1,253 @@
+import json
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+
+import pandas as pd
+
+# Costs are in estimated events. A scraped game takes about this many bytes of JSON per event, and the
+# number of pitchers and batters listed in the url csv predicts events as 4 * people - 25.
+BYTES_PER_EVENT = 200
+EVENTS_PER_PERSON = 4
+EVENTS_OFFSET = -25
+DEFAULT_COST = 90
+PEOPLE_COLUMNS = ['home_pitchers', 'away_pitchers', 'home_batters', 'away_batters']
+QUARANTINE_FILE = "quarantined_games.json"
+
+
+def estimate_cost(game_pk, scraped_dir="scraped_games", url_row=None) -> float:
+    """
+    Relative cost of a game from metadata that is free to read, without opening the scraped file. Without
+    scraped_dir only the url csv row is used.
+    """
+    scraped_path = Path(scraped_dir) / f"game_{game_pk}.json" if scraped_dir is not None else None
+    if scraped_path is not None and scraped_path.exists():
+        return max(scraped_path.stat().st_size / BYTES_PER_EVENT, 1)
+    if url_row is not None and all(column in url_row and pd.notna(url_row[column]) for column in PEOPLE_COLUMNS):
+        people = sum(len(str(url_row[column]).split('/')) for column in PEOPLE_COLUMNS)
+        return max(EVENTS_PER_PERSON * people + EVENTS_OFFSET, 1)
+    return DEFAULT_COST
+
+
+def estimate_costs(game_pks, scraped_dir="scraped_games", games_df: pd.DataFrame = None) -> dict:
+    url_rows = {}
+    if games_df is not None:
+        url_rows = {row['game_pk']: row for row in games_df.to_dict('records')}
+    return {game_pk: estimate_cost(game_pk, scraped_dir, url_rows.get(game_pk)) for game_pk in game_pks}
+
+
+def longest_first(game_pks, costs: dict) -> list:
+    # Stable, so equally expensive games keep their input order
+    return sorted(game_pks, key=lambda game_pk: -costs.get(game_pk, DEFAULT_COST))
+
+
+def load_quarantine(path=QUARANTINE_FILE) -> dict:
+    if not Path(path).exists():
+        return {}
+    with open(path) as f:
+        return {int(game_pk): reason for game_pk, reason in json.load(f).items()}
+
+
+def save_quarantine(quarantined: dict, path=QUARANTINE_FILE):
+    with open(path, 'w') as f:
+        json.dump({str(game_pk): reason for game_pk, reason in quarantined.items()}, f, indent=2)
+
+
+@dataclass
+class ScheduleReport:
+    workers: int = 0
+    games: int = 0
+    wall_seconds: float = 0.0
+    busy_seconds: float = 0.0
+    results: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+    quarantined: dict = field(default_factory=dict)
+    worker_restarts: int = 0
+
+    @property
+    def efficiency(self) -> float:
+        """Busy time over wall time times workers, 1.0 when no worker ever waits for a straggler"""
+        capacity = self.wall_seconds * self.workers
+        return self.busy_seconds / capacity if capacity else 0.0
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["efficiency"] = self.efficiency
+        return data
+
+    def format(self) -> str:
+        return (f"{self.games} games on {self.workers} workers in {self.wall_seconds:.1f}s "
+                f"({self.busy_seconds:.1f}s busy, efficiency {self.efficiency:.0%}), "
+                f"{len(self.errors)} errors, {len(self.quarantined)} quarantined")
+
+
+def _worker(task_queue, result_queue, func, initializer, initargs):
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        game_pk = task_queue.get()
+        if game_pk is None:
+            break
+        result_queue.put(("started", os.getpid(), game_pk, None))
+        start = time.perf_counter()
+        try:
+            result = func(game_pk)
+            result_queue.put(("done", os.getpid(), game_pk, (result, None, time.perf_counter() - start)))
+        except Exception as e:
+            error = f"{e}\n{traceback.format_exc()}"
+            result_queue.put(("done", os.getpid(), game_pk, (None, error, time.perf_counter() - start)))
+
+
+def run_scheduled(game_pks, func, workers: int, costs: dict = None, timeout: float = None,
+                  initializer=None, initargs=(), quarantine_path=QUARANTINE_FILE) -> ScheduleReport:
+    """
+    Run func(game_pk) for every game on worker processes. Games are queued longest first and each idle
+    worker is handed the next one, so the cheap games at the end fill in around the expensive ones.
+    A game still running after timeout seconds has its worker killed and replaced, and is recorded in the
+    quarantine file so later runs skip it, like a game whose worker died before finishing it. Games already
+    in the file are skipped.
+    """
+    quarantined = load_quarantine(quarantine_path) if quarantine_path else {}
+    report = ScheduleReport(workers=workers)
+    skipped = {game_pk: reason for game_pk, reason in quarantined.items() if game_pk in set(game_pks)}
+    report.quarantined.update(skipped)
+    pending = [game_pk for game_pk in longest_first(game_pks, costs or {}) if game_pk not in skipped]
+    report.games = len(pending)
+
+    ctx = mp.get_context()
+    result_queue = ctx.Queue()
+    # pid -> (process, its own task queue), so the parent always knows which worker holds which game
+    processes = {}
+    # pid -> (game_pk, time it was handed out or started, whether the worker said it started) of the game each
+    # worker holds. Recorded before the worker can see the game, so one that dies before its "started"
+    # message arrives still has the game accounted for.
+    running = {}
+    handed_out = 0
+    remaining = len(pending)
+
+    def hand_out(pid):
+        nonlocal handed_out
+        game_pk = pending[handed_out] if handed_out < len(pending) else None
+        if game_pk is not None:
+            handed_out += 1
+            running[pid] = (game_pk, time.perf_counter(), False)
+        processes[pid][1].put(game_pk)
+
+    def start_worker():
+        task_queue = ctx.Queue()
+        process = ctx.Process(target=_worker, args=(task_queue, result_queue, func, initializer, initargs))
+        process.start()
+        processes[process.pid] = (process, task_queue)
+        hand_out(process.pid)
+
+    def receive(message):
+        nonlocal remaining
+        status, pid, game_pk, payload = message
+        if running.get(pid, (None,))[0] != game_pk:
+            # The game was quarantined already
+            return
+        if status == "started":
+            running[pid] = (game_pk, time.perf_counter(), True)
+            return
+        del running[pid]
+        result, error, seconds = payload
+        report.busy_seconds += seconds
+        if error:
+            report.errors[game_pk] = error
+        else:
+            report.results[game_pk] = result
+        remaining -= 1
+        if pid in processes:
+            hand_out(pid)
+
+    for _ in range(min(workers, len(pending))):
+        start_worker()
+    start = time.perf_counter()
+
+    while remaining:
+        try:
+            receive(result_queue.get(timeout=0.5))
+        except queue.Empty:
+            pass
+
+        now = time.perf_counter()
+        for pid, (process, _) in list(processes.items()):
+            current = running.get(pid)
+            timed_out = current is not None and current[2] and timeout is not None and now - current[1] > timeout
+            if timed_out:
+                process.kill()
+                process.join()
+            elif not process.is_alive():
+                # Whatever it managed to send before it died counts, anything else is lost with it
+                while True:
+                    try:
+                        receive(result_queue.get_nowait())
+                    except queue.Empty:
+                        break
+            else:
+                continue
+            del processes[pid]
+            current = running.pop(pid, None)
+            if current is not None:
+                game_pk, started, _ = current
+                reason = f"timed out after {timeout}s" if timed_out else f"worker exited with {process.exitcode}"
+                logging.error(f"Quarantining game {game_pk}: {reason}")
+                report.quarantined[game_pk] = reason
+                report.busy_seconds += now - started
+                remaining -= 1
+            if handed_out < len(pending):
+                report.worker_restarts += 1
+                start_worker()
+
+    for process, task_queue in processes.values():
+        task_queue.put(None)
+    for process, _ in processes.values():
+        process.join()
+    report.wall_seconds = time.perf_counter() - start
+
+    if quarantine_path and len(report.quarantined) > len(skipped):
+        save_quarantine({**quarantined, **report.quarantined}, quarantine_path)
+    return report
+
+
+def _exit_at_once(game_pk):
+    """A worker that dies on every game before it can say it started, for --check-crashing-worker"""
+    os._exit(1)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show estimated game costs and quarantined games")
+    parser.add_argument("--games-csv", default="urls/gameday_urls2023.csv")
+    parser.add_argument("--scraped-dir", default="scraped_games")
+    parser.add_argument("--top", type=int, default=10, help="number of most expensive games to list")
+    parser.add_argument("--release", nargs="*", type=int,
+                        help="take these games out of quarantine, or every game when none are given")
+    parser.add_argument("--check-crashing-worker", action="store_true",
+                        help="run games on workers that die at once and check every game ends up quarantined")
+    args = parser.parse_args()
+
+    if args.check_crashing_worker:
+        game_pks = list(range(1, 21))
+        report = run_scheduled(game_pks, _exit_at_once, workers=4, quarantine_path=None)
+        print(report.format())
+        print(f"Every game quarantined: {sorted(report.quarantined) == game_pks}")
+    elif args.release is not None:
+        quarantined = load_quarantine()
+        released = args.release or list(quarantined)
+        save_quarantine({game_pk: reason for game_pk, reason in quarantined.items() if game_pk not in released})
+        print(f"Released {len(set(released) & set(quarantined))} games from {QUARANTINE_FILE}")
+    else:
+        games_df = pd.read_csv(args.games_csv)
+        costs = estimate_costs(games_df['game_pk'].tolist(), args.scraped_dir, games_df)
+        print(f"{len(costs)} games, {sum(costs.values()):.0f} estimated events in total")
+        for game_pk in longest_first(list(costs), costs)[:args.top]:
+            print(f"  {game_pk}: {costs[game_pk]:.0f}")
+        for game_pk, reason in load_quarantine().items():
+            print(f"Quarantined {game_pk}: {reason}")
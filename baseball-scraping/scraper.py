@@ -1,3 +1,4 @@
+import argparse
 from selenium import webdriver
 from selenium.common import TimeoutException
 from selenium.webdriver.chrome.service import Service
@@ -14,9 +15,16 @@ import datetime
 from pathlib import Path
 import pandas as pd
 from typing import Optional
-from dataclasses import dataclass, asdict
+from dataclasses import asdict
 import logging
 from tqdm import tqdm
+from metrics import StageMetrics
+from game_data import GameData, is_game_data_complete
+from log_sink import LOG_DIR, ensure_log_sink
+from sharding import SHARDS_DIR, OUTPUT_DIRS, parse_shard, shard_dir, shard_partition, write_manifest
+
+# Per-stage timings for the current scrape run, reset and reported by GameScraper.scrape_games
+stage_metrics = StageMetrics("scrape")
 
 
 def timeit(method):
@@ -25,6 +33,7 @@ def timeit(method):
         result = method(*args, **kw)
         te = time.time()
         logging.info(f'{method.__name__} took {te - ts:.2f} seconds')
+        stage_metrics.observe(method.__name__, te - ts)
         return result
 
     return timed
@@ -70,11 +79,13 @@ def get_lineup_subs_and_mapping(driver, team_class):
         )
         te = time.time()
         logging.info(f'  Waiting for table took {te - ts:.2f} seconds')
+        stage_metrics.observe('table_wait', te - ts)
 
         ts = time.time()
         rows = table.find_elements(By.TAG_NAME, "tr")[:-1]
         te = time.time()
         logging.info(f'  Finding table rows took {te - ts:.2f} seconds')
+        stage_metrics.observe('table_find_rows', te - ts)
 
         ts = time.time()
         for row in rows:
@@ -104,6 +115,7 @@ def get_lineup_subs_and_mapping(driver, team_class):
                 lineup.append(player_id)
         te = time.time()
         logging.info(f'  Processing rows took {te - ts:.2f} seconds')
+        stage_metrics.observe('table_extraction', te - ts)
 
     except Exception as e:
         logging.info(f"An error occurred while getting the lineup, substitutions, and player mapping: {e}")
@@ -122,11 +134,13 @@ def get_bullpen_and_mapping(driver, team_class):
         )
         te = time.time()
         logging.info(f'  Waiting for table took {te - ts:.2f} seconds')
+        stage_metrics.observe('table_wait', te - ts)
 
         ts = time.time()
         rows = table.find_elements(By.TAG_NAME, "tr")[:-1]  # Exclude the last row (totals)
         te = time.time()
         logging.info(f'  Finding table rows took {te - ts:.2f} seconds')
+        stage_metrics.observe('table_find_rows', te - ts)
 
         ts = time.time()
         for row in rows:
@@ -139,6 +153,7 @@ def get_bullpen_and_mapping(driver, team_class):
             pitcher_id_map[pitcher_id] = pitcher_name
         te = time.time()
         logging.info(f'  Processing rows took {te - ts:.2f} seconds')
+        stage_metrics.observe('table_extraction', te - ts)
 
     except Exception as e:
         logging.info(f"An error occurred while getting the bullpen information: {e}")
@@ -158,16 +173,21 @@ def process_box(driver, box_url):
         driver.get(box_url)
     except TimeoutException:
         logging.info("Initial page load timed out, attempting to continue anyway")
+        stage_metrics.incr('page_load_timeouts')
     te = time.time()
     logging.info(f'  Loading box page took {te - ts:.2f} seconds')
+    stage_metrics.observe('box_page_load', te - ts)
 
     # Wait for a key element that indicates the page is interactive
+    ts = time.time()
     try:
         WebDriverWait(driver, 20).until(
             EC.presence_of_element_located((By.CSS_SELECTOR, ".away-r1"))
         )
     except TimeoutException:
         logging.info("Timed out waiting for key element, some data may be missing")
+        stage_metrics.incr('wait_timeouts')
+    stage_metrics.observe('box_wait', time.time() - ts)
 
     results = {}
     for team in ['away', 'home']:
@@ -218,10 +238,13 @@ def process_summary(driver, summary_url, home_abbr, away_abbr):
         driver.get(summary_url)
     except TimeoutException:
         logging.info("Initial page load timed out, attempting to continue anyway")
+        stage_metrics.incr('page_load_timeouts')
     te = time.time()
     logging.info(f'  Loading summary page took {te - ts:.2f} seconds')
+    stage_metrics.observe('summary_page_load', te - ts)
 
     # Wait for a key element that indicates the page is interactive
+    ts = time.time()
     try:
         WebDriverWait(driver, 20).until(
             EC.presence_of_element_located(
@@ -230,6 +253,8 @@ def process_summary(driver, summary_url, home_abbr, away_abbr):
         )
     except TimeoutException:
         logging.info("Timed out waiting for key element, some data may be missing")
+        stage_metrics.incr('wait_timeouts')
+    stage_metrics.observe('summary_wait', time.time() - ts)
 
     game_summary = []
     current_inning = None
@@ -244,6 +269,7 @@ def process_summary(driver, summary_url, home_abbr, away_abbr):
         )
         te = time.time()
         logging.info(f'  Finding all events took {te - ts:.2f} seconds')
+        stage_metrics.observe('summary_find_events', te - ts)
 
         ts = time.time()
         for event in events:
@@ -392,6 +418,8 @@ def process_summary(driver, summary_url, home_abbr, away_abbr):
                     logging.info(f"    Error processing sub_event: {e}")
         te = time.time()
         logging.info(f'  Processing all events took {te - ts:.2f} seconds')
+        stage_metrics.observe('summary_parse', te - ts)
+        stage_metrics.incr('events_parsed', sum(len(inning['events']) for inning in game_summary))
     except Exception as e:
         logging.info(f"Error finding or processing events: {e}")
 
@@ -401,65 +429,43 @@ def process_summary(driver, summary_url, home_abbr, away_abbr):
     return game_summary
 
 
-@dataclass
-class GameData:
-    """Container for scraped game data"""
-    away_lineup: list
-    away_sub_ins: list
-    away_player_map: dict
-    away_bullpen: list
-    away_position_map: dict
-    home_lineup: list
-    home_sub_ins: list
-    home_player_map: dict
-    home_bullpen: list
-    home_position_map: dict
-    game_summary: list
-    game_pk: str
-    home_abbr: str
-    away_abbr: str
-
-
 class GameScraper:
     def __init__(self, games_csv: str, output_dir: str = "scraped_games"):
+        self.games_csv = games_csv
         self.games_df = pd.read_csv(games_csv)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
 
-        # Setup logging
-        log_dir = Path("logs")
-        log_dir.mkdir(exist_ok=True)
+        # Records go through a queue to a background writer, so the scrape loop never waits on the log file.
+        # Under the pipeline the parent's sink already collects them.
+        self.log_sink = ensure_log_sink(LOG_DIR / "scraping.log")
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        # File handler
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(message)s',
-            handlers=[
-                logging.FileHandler(f"logs/scraping_{timestamp}.log"),
-                logging.StreamHandler()  # Also print to console
-            ]
-        )
+        self.metrics_path = LOG_DIR / f"scrape_metrics_{timestamp}.json"
         self.logger = logging
 
-    def _is_game_data_complete(self, game_path: Path) -> bool:
-        """Check if existing game data is complete (has non-empty lineups)."""
-        try:
-            with open(game_path, 'r') as f:
-                game_data = json.load(f)
-                return len(game_data.get('away_lineup', [])) > 0 and len(game_data.get('home_lineup', [])) > 0
-        except (json.JSONDecodeError, FileNotFoundError):
-            return False
-
-    def scrape_games(self, start_index: int = 0, end_index: Optional[int] = None) -> None:
-        """Scrape games and save data, checking for existing files and data completeness."""
+    is_game_data_complete = staticmethod(is_game_data_complete)
+
+    def scrape_games(self, start_index: int = 0, end_index: Optional[int] = None, shard: tuple = None,
+                     shard_root: str = SHARDS_DIR) -> None:
+        """
+        Scrape games and save data, checking for existing files and data completeness. With a shard (i, N) only
+        the i-th of N cost balanced parts of the games is scraped, into the shard's directory under shard_root
+        with a manifest for sharding.merge_shards.
+        """
+        started = time.time()
+        stage_metrics.reset()
+        games_to_process = self.games_df.iloc[start_index:end_index] if end_index else self.games_df.iloc[
+                                                                                       start_index:]
+        if shard:
+            parts = shard_partition(games_to_process['game_pk'].tolist(), self.games_df, shard[1])
+            games_to_process = games_to_process[games_to_process['game_pk'].isin(parts[shard[0] - 1])]
+            self.output_dir = shard_dir(shard, shard_root) / OUTPUT_DIRS["scrape"]
+            self.output_dir.mkdir(parents=True, exist_ok=True)
         driver = setup_webdriver()
+        failed_games = []
         try:
-            games_to_process = self.games_df.iloc[start_index:end_index] if end_index else self.games_df.iloc[
-                                                                                           start_index:]
 
             self.logger.info(f"Starting scraping of {len(games_to_process)} games")
-            failed_games = []
 
             for idx, row in tqdm(games_to_process.iterrows(), total=len(games_to_process), desc="Scraping games"):
                 game_pk = str(row['game_pk'])
@@ -467,23 +473,19 @@ class GameScraper:
 
                 # Check if the game file already exists and has complete data
                 if output_path.exists():
-                    if self._is_game_data_complete(output_path):
+                    if self.is_game_data_complete(output_path):
                         self.logger.info(f"Game {game_pk} already scraped with complete data, skipping.")
+                        stage_metrics.incr('games_skipped')
                         continue
                     else:
                         self.logger.info(f"Game {game_pk} exists but has incomplete data, re-scraping.")
 
                 try:
-                    start_time = time.time()
-                    game_data = self._scrape_single_game(driver, row)
-                    self._save_game_data(game_data)
-
-                    elapsed = time.time() - start_time
-                    self.logger.info(f"Game {game_pk} scraped successfully in {elapsed:.2f} seconds")
-
+                    self.scrape_game(driver, row)
                 except Exception as e:
                     self.logger.error(f"Failed to scrape game {game_pk}: {str(e)}")
                     failed_games.append((game_pk, str(e)))
+                    stage_metrics.incr('games_failed')
 
                 # Small delay to avoid overwhelming the server
                 time.sleep(1)
@@ -495,6 +497,30 @@ class GameScraper:
 
         finally:
             driver.quit()
+            self._report_metrics()
+            if shard:
+                write_manifest("scrape", shard, shard_root, self.games_csv, parts,
+                               {int(game_pk): error for game_pk, error in failed_games}, started, self.games_df)
+
+    def scrape_game(self, driver, row) -> GameData:
+        """Scrape a single game and save it, the saved JSON is the durable copy of the game"""
+        start_time = time.time()
+        game_data = self._scrape_single_game(driver, row)
+        with stage_metrics.stage('save'):
+            self._save_game_data(game_data)
+
+        elapsed = time.time() - start_time
+        self.logger.info(f"Game {game_data.game_pk} scraped successfully in {elapsed:.2f} seconds")
+        stage_metrics.observe('game_total', elapsed)
+        stage_metrics.incr('games_scraped')
+        return game_data
+
+    def _report_metrics(self) -> None:
+        """Write the per-stage timings to a JSON file and print a summary of the run"""
+        stage_metrics.finish()
+        stage_metrics.write(self.metrics_path)
+        self.logger.info(f"Scrape metrics written to {self.metrics_path}\n"
+                         f"{stage_metrics.format_summary(rate_counter='games_scraped')}")
 
     def _scrape_single_game(self, driver, row) -> GameData:
         """Scrape data for a single game"""
@@ -531,7 +557,13 @@ class GameScraper:
 
 
 if __name__ == "__main__":
-    # Example usage:
-    # First, scrape all games
-    scraper = GameScraper("urls/gameday_urls2023.csv")
-    scraper.scrape_games(start_index=0)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape gameday pages into scraped_games/")
+    parser.add_argument("--games-csv", default="urls/gameday_urls2023.csv")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--end", type=int, default=None)
+    parser.add_argument("--shard", type=parse_shard, help="scrape only shard i of N, given as i/N, like 2/4")
+    parser.add_argument("--shard-root", default=SHARDS_DIR, help="where each shard writes its games and manifest")
+    args = parser.parse_args()
+
+    scraper = GameScraper(args.games_csv)
+    scraper.scrape_games(args.start, args.end, shard=args.shard, shard_root=args.shard_root)
\ No newline at end of file
@@ -0,0 +1,175 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from game_data import DECISION_COLUMNS
+
+SEASON_DIR = "season_columns"
+GAMES_DIR = "games"
+
+# Everything that holds a player id, stored as int32 with -1 for empty
+PLAYER_COLUMNS = [column for column in DECISION_COLUMNS if column not in (
+    "Event_Type", "Is_Decision", "Inning", "Half", "At_Bat", "Score_Deficit", "Outs")]
+BASE_COLUMNS = ["First_Base", "Second_Base", "Third_Base"]
+LINEUP_COLUMNS = {team: [f"{team}_Lineup_{i}" for i in range(1, 10)] for team in ("Home", "Away")}
+FIELDER_COLUMNS = {team: [f"{team}_{pos}" for pos in ["DH", "C", "1B", "2B", "3B", "SS", "LF", "CF", "RF"]]
+                   for team in ("Home", "Away")}
+
+HALF_CODES = {"Top": 0, "Bot": 1}
+
+COLUMN_DTYPES = {
+    "Event_Type": np.int16,  # index into the event type vocabulary
+    "Is_Decision": np.bool_,
+    "Inning": np.int8,
+    "Half": np.int8,
+    "At_Bat": np.int16,
+    "Score_Deficit": np.int16,
+    "Outs": np.int8,
+    **{column: np.int32 for column in PLAYER_COLUMNS},
+}
+
+
+def decision_csv_path(game_pk, games_dir=GAMES_DIR) -> Path:
+    return Path(games_dir) / f"game_{game_pk}_decisions.csv"
+
+
+def game_pk_from_path(path) -> int:
+    return int(Path(path).name.split("_")[1])
+
+
+def read_game_columns(path, columns=None) -> dict:
+    """
+    Read the requested columns of one decision CSV as numpy arrays.
+    Player ids and at-bat numbers use -1 for empty cells, Half uses HALF_CODES and
+    Event_Type is left as strings so the caller decides how to encode it.
+    """
+    df = pd.read_csv(path, usecols=columns)
+    arrays = {}
+    for column in df.columns:
+        values = df[column]
+        if column == "Event_Type":
+            arrays[column] = values.fillna("").astype(str).to_numpy(dtype=object)
+        elif column == "Half":
+            arrays[column] = values.map(HALF_CODES).fillna(-1).to_numpy(dtype=np.int8)
+        elif column == "Is_Decision":
+            arrays[column] = values.astype(str).eq("True").to_numpy()
+        else:
+            arrays[column] = pd.to_numeric(values, errors="coerce").fillna(-1).to_numpy(dtype=COLUMN_DTYPES[column])
+    return arrays
+
+
+def _read_game(path):
+    return game_pk_from_path(path), read_game_columns(path)
+
+
+class Season:
+    """Column arrays for every decision row of a season, concatenated in game_pk order"""
+
+    def __init__(self, columns: dict, game_pks: np.ndarray, offsets: np.ndarray, event_types: list):
+        self.columns = columns
+        self.game_pks = game_pks
+        # Rows of game_pks[i] are offsets[i]:offsets[i + 1]
+        self.offsets = offsets
+        self.event_types = event_types
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, column) -> np.ndarray:
+        return self.columns[column]
+
+    def row_game_pks(self) -> np.ndarray:
+        return np.repeat(self.game_pks, np.diff(self.offsets))
+
+    def game_slice(self, game_pk) -> slice:
+        index = int(np.searchsorted(self.game_pks, game_pk))
+        if index == len(self.game_pks) or self.game_pks[index] != game_pk:
+            raise KeyError(f"Game {game_pk} is not in the season file")
+        return slice(int(self.offsets[index]), int(self.offsets[index + 1]))
+
+    def event_type_code(self, event_type: str) -> int:
+        return self.event_types.index(event_type)
+
+    def event_type_names(self, codes) -> np.ndarray:
+        return np.asarray(self.event_types, dtype=object)[codes]
+
+
+def load_season(season_dir=SEASON_DIR, columns=None, mmap=True) -> Season:
+    season_dir = Path(season_dir)
+    with open(season_dir / "meta.json") as f:
+        meta = json.load(f)
+    mmap_mode = "r" if mmap else None
+    arrays = {column: np.load(season_dir / f"{column}.npy", mmap_mode=mmap_mode)
+              for column in (columns or meta["columns"])}
+    return Season(arrays, np.load(season_dir / "game_pks.npy"), np.load(season_dir / "offsets.npy"),
+                  meta["event_types"])
+
+
+def build_season(games_dir=GAMES_DIR, season_dir=SEASON_DIR, workers=None) -> Season:
+    """
+    Write the season column files, only re-reading decision CSVs that are new or changed
+    since the last build.
+    """
+    season_dir = Path(season_dir)
+    season_dir.mkdir(parents=True, exist_ok=True)
+    sources = {game_pk_from_path(path): path for path in Path(games_dir).glob("game_*_decisions.csv")}
+    stamps = {game_pk: [os.path.getmtime(path), os.path.getsize(path)] for game_pk, path in sources.items()}
+
+    previous = None
+    previous_stamps = {}
+    if (season_dir / "meta.json").exists():
+        previous = load_season(season_dir, mmap=False)
+        with open(season_dir / "meta.json") as f:
+            previous_stamps = {int(game_pk): stamp for game_pk, stamp in json.load(f)["sources"].items()}
+
+    stale = sorted(game_pk for game_pk in sources if previous_stamps.get(game_pk) != stamps[game_pk])
+    games = {}
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for game_pk, arrays in executor.map(_read_game, [sources[game_pk] for game_pk in stale], chunksize=16):
+                games[game_pk] = arrays
+
+    event_types = list(previous.event_types) if previous else []
+    for arrays in games.values():
+        for event_type in pd.unique(arrays["Event_Type"]):
+            if event_type not in event_types:
+                event_types.append(event_type)
+    event_codes = {event_type: code for code, event_type in enumerate(event_types)}
+
+    pieces = {column: [] for column in DECISION_COLUMNS}
+    lengths = []
+    game_pks = sorted(sources)
+    for game_pk in game_pks:
+        if game_pk in games:
+            arrays = games[game_pk]
+            arrays["Event_Type"] = np.fromiter((event_codes[e] for e in arrays["Event_Type"]), dtype=np.int16,
+                                               count=len(arrays["Event_Type"]))
+        else:
+            rows = previous.game_slice(game_pk)
+            arrays = {column: previous[column][rows] for column in DECISION_COLUMNS}
+        for column in DECISION_COLUMNS:
+            pieces[column].append(arrays[column].astype(COLUMN_DTYPES[column], copy=False))
+        lengths.append(len(arrays["Event_Type"]))
+
+    offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+    for column in DECISION_COLUMNS:
+        data = np.concatenate(pieces[column]) if pieces[column] else np.empty(0, dtype=COLUMN_DTYPES[column])
+        np.save(season_dir / f"{column}.npy", data)
+    np.save(season_dir / "game_pks.npy", np.asarray(game_pks, dtype=np.int64))
+    np.save(season_dir / "offsets.npy", offsets)
+    with open(season_dir / "meta.json", "w") as f:
+        json.dump({
+            "columns": DECISION_COLUMNS,
+            "event_types": event_types,
+            "sources": {str(game_pk): stamps[game_pk] for game_pk in game_pks},
+        }, f)
+    return load_season(season_dir)
+
+
+if __name__ == "__main__":
+    season = build_season()
+    print(f"Wrote {len(season)} rows for {len(season.game_pks)} games to {SEASON_DIR}/")
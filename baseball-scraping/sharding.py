@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import heapq
+import json
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from scheduler import estimate_costs
+
+SHARDS_DIR = "shards"
+# What each kind of sharded run writes per game, and where in its shard directory
+OUTPUT_DIRS = {"scrape": "scraped_games", "process": "games"}
+OUTPUT_NAMES = {"scrape": "game_{}.json", "process": "game_{}_decisions.csv"}
+MANIFESTS = {"scrape": "scrape_manifest.json", "process": "process_manifest.json"}
+ERROR_LOG = "game_processing_errors.log"
+
+
+def parse_shard(text: str) -> tuple:
+    """"2/4" is the second of four shards, numbered from 1"""
+    try:
+        index, shards = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"A shard is given as i/N, like 2/4, not {text}") from None
+    if not 1 <= index <= shards:
+        raise ValueError(f"Shard {text} is not one of 1/{shards} to {shards}/{shards}")
+    return index, shards
+
+
+def shard_dir(shard: tuple, root=SHARDS_DIR) -> Path:
+    index, shards = shard
+    return Path(root) / f"shard_{index}_of_{shards}"
+
+
+def partition(game_pks, costs: dict, shards: int) -> list:
+    """
+    Split games into shards of about equal estimated cost: the most expensive game goes first, each to the
+    shard with the least cost so far, ties going to the lower shard and the lower game_pk. The result only
+    depends on the games and their costs, so every node computes the same split on its own.
+    """
+    parts = [[] for _ in range(shards)]
+    loads = [(0.0, shard) for shard in range(shards)]
+    for game_pk in sorted(game_pks, key=lambda game_pk: (-costs[game_pk], game_pk)):
+        load, shard = heapq.heappop(loads)
+        parts[shard].append(game_pk)
+        heapq.heappush(loads, (load + costs[game_pk], shard))
+    return [sorted(part) for part in parts]
+
+
+def partition_digest(parts: list) -> str:
+    return hashlib.sha256(json.dumps([[int(game_pk) for game_pk in part] for part in parts]).encode()).hexdigest()
+
+
+def file_digest(path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def shard_partition(game_pks, games_df: pd.DataFrame, shards: int) -> list:
+    """
+    The partition of a run. Costs come from the url csv alone, not from scraped files, so nodes that
+    scraped different games still agree on it.
+    """
+    costs = estimate_costs(game_pks, None, games_df)
+    return partition(game_pks, costs, shards)
+
+
+def write_manifest(kind: str, shard: tuple, root, games_csv: str, parts: list, failed: dict, started: float,
+                   games_df: pd.DataFrame = None) -> dict:
+    """
+    Record what a shard was given and what it produced. merge_shards trusts only the outputs listed here,
+    with their sizes, so a shard that died halfway leaves its games as missing rather than half written.
+    """
+    index, shards = shard
+    directory = shard_dir(shard, root)
+    games = parts[index - 1]
+    outputs = {}
+    for game_pk in games:
+        path = directory / OUTPUT_DIRS[kind] / OUTPUT_NAMES[kind].format(game_pk)
+        if game_pk not in failed and path.exists():
+            outputs[str(game_pk)] = path.stat().st_size
+    costs = estimate_costs(games, None, games_df)
+    manifest = {
+        "kind": kind,
+        "shard": index,
+        "shards": shards,
+        "games_csv": str(games_csv),
+        "games_csv_sha256": file_digest(games_csv),
+        "partition_sha256": partition_digest(parts),
+        "games": [int(game_pk) for game_pk in games],
+        "estimated_cost": sum(costs.values()),
+        "outputs": outputs,
+        "failed": {str(game_pk): reason for game_pk, reason in failed.items()},
+        "host": socket.gethostname(),
+        "started": started,
+        "seconds": time.time() - started,
+    }
+    with open(directory / MANIFESTS[kind], "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def merge_shards(kind: str, root=SHARDS_DIR, output_dir: str = None, error_log: str = ERROR_LOG,
+                 allow_partial=False) -> dict:
+    """
+    Copy every shard's outputs into one directory and concatenate their error logs. The manifests have to
+    come from the same url csv and partition and cover every shard, unless allow_partial is set.
+    """
+    output_dir = Path(output_dir or OUTPUT_DIRS[kind])
+    paths = sorted(Path(root).glob(f"shard_*_of_*/{MANIFESTS[kind]}"))
+    if not paths:
+        raise ValueError(f"No {MANIFESTS[kind]} under {root}")
+    manifests = []
+    for path in paths:
+        with open(path) as f:
+            manifests.append((path.parent, json.load(f)))
+
+    first = manifests[0][1]
+    for directory, manifest in manifests:
+        for key in ["shards", "games_csv_sha256", "partition_sha256"]:
+            if manifest[key] != first[key]:
+                raise ValueError(f"{directory} has a different {key} than {manifests[0][0]}, "
+                                 f"its shards come from another run")
+    present = {manifest["shard"] for _, manifest in manifests}
+    missing_shards = sorted(set(range(1, first["shards"] + 1)) - present)
+    if missing_shards and not allow_partial:
+        raise ValueError(f"Shards {missing_shards} of {first['shards']} have no manifest under {root}")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    merged = 0
+    missing = []
+    failed = {}
+    with open(error_log, "w") as log:
+        for directory, manifest in sorted(manifests, key=lambda item: item[1]["shard"]):
+            for game_pk in manifest["games"]:
+                size = manifest["outputs"].get(str(game_pk))
+                source = directory / OUTPUT_DIRS[kind] / OUTPUT_NAMES[kind].format(game_pk)
+                if size is None:
+                    failed[game_pk] = manifest["failed"].get(str(game_pk), "no output")
+                elif not source.exists() or source.stat().st_size != size:
+                    missing.append(game_pk)
+                else:
+                    shutil.copy2(source, output_dir / source.name)
+                    merged += 1
+            shard_log = directory / ERROR_LOG
+            if shard_log.exists() and shard_log.stat().st_size:
+                log.write(f"# shard {manifest['shard']}/{manifest['shards']} on {manifest['host']}\n\n")
+                log.write(shard_log.read_text())
+            elif manifest["failed"]:
+                log.write(f"# shard {manifest['shard']}/{manifest['shards']} on {manifest['host']}\n\n")
+                for game_pk, reason in manifest["failed"].items():
+                    log.write(f"Error in game {game_pk}: {reason}\n\n")
+
+    return {
+        "kind": kind,
+        "shards": first["shards"],
+        "missing_shards": missing_shards,
+        "games": sum(len(manifest["games"]) for _, manifest in manifests),
+        "merged": merged,
+        "failed": len(failed),
+        # Listed in a manifest but gone or changed since, these need their shard run again
+        "missing_outputs": missing,
+        "estimated_costs": {manifest["shard"]: round(manifest["estimated_cost"]) for _, manifest in manifests},
+        "seconds": {manifest["shard"]: round(manifest["seconds"], 1) for _, manifest in manifests},
+    }
+
+
+def run_local_shards(shards: int, root, games_csv: str, statcast_csv: str, extra_args=()) -> list:
+    """Replay every shard in its own process at once, each standing in for a node. Returns the exit codes"""
+    from pitch_index import load_pitch_index
+
+    # Exported before the nodes start, so their run times don't include waiting on one of them to export it
+    load_pitch_index(statcast_csv)
+    processes = [subprocess.Popen([sys.executable, "main.py", "--shard", f"{index}/{shards}", "--shard-root",
+                                   str(root), "--games-csv", games_csv, "--statcast", statcast_csv, *extra_args])
+                 for index in range(1, shards + 1)]
+    return [process.wait() for process in processes]
+
+
+def compare_dirs(merged_dir, expected_dir, names) -> list:
+    """Names that differ between two directories or are missing from either"""
+    different = []
+    for name in names:
+        merged, expected = Path(merged_dir) / name, Path(expected_dir) / name
+        if not (merged.exists() and expected.exists() and merged.read_bytes() == expected.read_bytes()):
+            different.append(name)
+    return different
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Merge sharded runs, or run shards as local processes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge_parser = commands.add_parser("merge", help="combine the outputs of every shard")
+    merge_parser.add_argument("kind", choices=list(MANIFESTS))
+    merge_parser.add_argument("--shard-root", default=SHARDS_DIR)
+    merge_parser.add_argument("--output", help="directory to merge into, games/ or scraped_games/ by default")
+    merge_parser.add_argument("--error-log", default=ERROR_LOG)
+    merge_parser.add_argument("--allow-partial", action="store_true", help="merge even when shards are missing")
+    merge_parser.add_argument("--build-season", nargs="?", const="season_columns",
+                              help="also build the season column files from the merged games")
+
+    local_parser = commands.add_parser("local", help="replay N shards as local processes, merge and compare")
+    local_parser.add_argument("--shards", type=int, default=3)
+    local_parser.add_argument("--shard-root", default=str(Path(SHARDS_DIR) / "local"))
+    local_parser.add_argument("--games-csv", default="urls/weird_games.csv")
+    local_parser.add_argument("--statcast", default="helper_files/statcast_reduced2023.csv")
+    local_parser.add_argument("--compare-dir", default="games", help="unsharded outputs the merge should equal")
+    args, rest = parser.parse_known_args(argv)
+    if rest and args.command != "local":
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+
+    if args.command == "merge":
+        summary = merge_shards(args.kind, args.shard_root, args.output, args.error_log, args.allow_partial)
+        print(json.dumps(summary, indent=2))
+        if args.build_season and args.kind == "process":
+            from season_columns import build_season
+
+            season = build_season(args.output or OUTPUT_DIRS["process"], args.build_season)
+            print(f"Season of {len(season.game_pks)} games and {len(season)} rows in {args.build_season}/")
+        return 0 if not summary["missing_outputs"] and not summary["missing_shards"] else 1
+
+    root = Path(args.shard_root)
+    if root.exists():
+        shutil.rmtree(root)
+    start = time.time()
+    # Anything else on the command line, like --workers, goes to every shard's main.py
+    codes = run_local_shards(args.shards, root, args.games_csv, args.statcast, rest)
+    print(f"{args.shards} shards finished in {time.time() - start:.1f}s with exit codes {codes}")
+    merged_dir = root / "merged" / OUTPUT_DIRS["process"]
+    summary = merge_shards("process", root, merged_dir, root / "merged" / ERROR_LOG)
+    print(json.dumps(summary, indent=2))
+    game_pks = pd.read_csv(args.games_csv)["game_pk"].tolist()
+    names = [OUTPUT_NAMES["process"].format(game_pk) for game_pk in game_pks]
+    different = compare_dirs(merged_dir, args.compare_dir, names)
+    print(f"{len(names) - len(different)} of {len(names)} merged games equal {args.compare_dir}/"
+          + (f", different: {', '.join(different[:10])}" if different else ""))
+    return 0 if not different and not any(codes) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
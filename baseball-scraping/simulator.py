@@ -0,0 +1,199 @@
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from game_state import GameState, Base, Half
+from run_expectancy import TABLES_DIR, STATES, END, TO_STATES, RUN_VALUES, BASE_STATE_NAMES, RunTables
+
+# Outcomes of an event are (state after, runs) pairs, numbered state after * RUN_VALUES + runs
+OUTCOMES = TO_STATES * RUN_VALUES
+OUTCOME_STATES = np.repeat(np.arange(TO_STATES), RUN_VALUES).astype(np.int8)
+OUTCOME_RUNS = np.tile(np.arange(RUN_VALUES), TO_STATES).astype(np.int8)
+# Extra innings start with a runner on second, the state _2_ with no outs
+GHOST_RUNNER_STATE = 2
+EXTRA_INNINGS = 10
+# Safety stops for half innings and games that never end, which real transition tables don't produce
+MAX_EVENTS = 200
+MAX_INNINGS = 30
+
+# The first event of each option of a decision, as the event types it is drawn from. None draws from every event
+DECISIONS = {
+    "steal 2B": {"steal": ["Stolen Base 2B", "Caught Stealing 2B"], "stay": None},
+    "steal 3B": {"steal": ["Stolen Base 3B", "Caught Stealing 3B"], "stay": None},
+    "intentional walk": {"walk": ["Intent Walk"], "pitch": None},
+    "sac bunt": {"bunt": ["Sac Bunt"], "swing away": None},
+}
+
+
+class OutcomeSampler:
+    """
+    Draws the next (state, runs) for many simulations at once. The cumulative probabilities of state s are
+    shifted by s into one sorted array, so one searchsorted of state + u draws every simulation's outcome.
+    """
+
+    def __init__(self, counts: np.ndarray):
+        counts = counts.reshape(STATES, OUTCOMES).astype(np.float64)
+        totals = counts.sum(axis=1, keepdims=True)
+        # A state never seen ends the half inning
+        unseen = totals[:, 0] == 0
+        counts[unseen, END * RUN_VALUES] = 1
+        totals[unseen] = 1
+        cumulative = np.cumsum(counts / totals, axis=1)
+        cumulative[:, -1] = 1.0
+        self.cumulative = (cumulative + np.arange(STATES)[:, None]).ravel()
+        self.seen = ~unseen
+
+    def draw(self, states: np.ndarray, uniforms: np.ndarray) -> tuple:
+        flat = np.searchsorted(self.cumulative, states + uniforms, side="right")
+        outcomes = flat - states * OUTCOMES
+        return OUTCOME_STATES[outcomes], OUTCOME_RUNS[outcomes]
+
+
+def _without_no_ops(outcomes: np.ndarray) -> np.ndarray:
+    """Drop events that leave the state and score alone, like substitutions, so every draw is a play"""
+    outcomes = outcomes.copy()
+    states = np.arange(STATES)
+    outcomes[states, states, 0] = 0
+    return outcomes
+
+
+def situation(game_state: GameState) -> tuple:
+    """(base-out state, inning, half, home lead) of a game state"""
+    occupied = [game_state.bases_occupied.get(base, -1) not in (-1, None)
+                for base in (Base.FIRST, Base.SECOND, Base.THIRD)]
+    mask = occupied[0] * 1 + occupied[1] * 2 + occupied[2] * 4
+    state = END if game_state.outs >= 3 else game_state.outs * 8 + mask
+    return state, game_state.inning, game_state.half, game_state.score_home - game_state.score_away
+
+
+class InningSimulator:
+    """Monte Carlo rest-of-inning and rest-of-game simulations from empirical base-out transitions"""
+
+    def __init__(self, tables: RunTables, seed: int = 0):
+        self.tables = tables
+        self.seed = seed
+        self.sampler = OutcomeSampler(_without_no_ops(tables.outcomes))
+        self.events = 0
+
+    @classmethod
+    def load(cls, tables_dir=TABLES_DIR, seed: int = 0) -> "InningSimulator":
+        return cls(RunTables.load(Path(tables_dir) / "tables.npz"), seed)
+
+    def first_event_sampler(self, event_types: list, state: int) -> OutcomeSampler:
+        codes = [self.tables.event_types.index(event_type) for event_type in event_types
+                 if event_type in self.tables.event_types]
+        outcomes = _without_no_ops(self.tables.event_outcomes[codes].sum(axis=0))
+        sampler = OutcomeSampler(outcomes)
+        if state != END and not sampler.seen[state]:
+            raise ValueError(f"No {', '.join(event_types)} from {state_name(state)} in the transition tables")
+        return sampler
+
+    def half_innings(self, states: np.ndarray, rng: np.random.Generator, first: OutcomeSampler = None) -> np.ndarray:
+        """Runs scored from each start state to the end of its half inning"""
+        states = states.astype(np.int64)
+        runs = np.zeros(len(states), dtype=np.int32)
+        active = np.flatnonzero(states != END)
+        sampler = first or self.sampler
+        for _ in range(MAX_EVENTS):
+            if not len(active):
+                break
+            next_states, scored = sampler.draw(states[active], rng.random(len(active)))
+            runs[active] += scored
+            states[active] = next_states
+            self.events += len(active)
+            active = active[next_states != END]
+            sampler = self.sampler
+        return runs
+
+    def rest_of_inning(self, state: int, simulations: int, first_events: list = None, seed: int = None) -> np.ndarray:
+        """Runs the batting team scores from state to the end of the half inning, one value per simulation"""
+        rng = np.random.default_rng(self.seed if seed is None else seed)
+        first = self.first_event_sampler(first_events, state) if first_events else None
+        return self.half_innings(np.full(simulations, state), rng, first)
+
+    def rest_of_game(self, state: int, inning: int, half: Half, home_lead: int, simulations: int,
+                     first_events: list = None, seed: int = None) -> np.ndarray:
+        """Final home lead of every simulation, with games still tied after MAX_INNINGS left at 0"""
+        rng = np.random.default_rng(self.seed if seed is None else seed)
+        first = self.first_event_sampler(first_events, state) if first_events else None
+        lead = np.full(simulations, home_lead, dtype=np.int32)
+        finished = np.zeros(simulations, dtype=bool)
+        starts = np.full(simulations, state)
+        while inning <= MAX_INNINGS:
+            playing = np.flatnonzero(~finished)
+            if not len(playing):
+                break
+            runs = self.half_innings(starts[playing], rng, first)
+            lead[playing] += runs if half == Half.BOTTOM else -runs
+            if inning >= 9:
+                # The bottom of the ninth or later isn't played with the home team ahead, and ends the game unless tied
+                finished |= lead > 0 if half == Half.TOP else lead != 0
+            first = None
+            if half == Half.TOP:
+                half = Half.BOTTOM
+            else:
+                half = Half.TOP
+                inning += 1
+            starts = np.full(simulations, GHOST_RUNNER_STATE if inning >= EXTRA_INNINGS else 0)
+        return lead
+
+    def compare(self, game_state: GameState, options: dict, simulations: int = 100_000, horizon: str = "inning",
+                seed: int = None) -> dict:
+        """
+        Simulate each option of a decision from the same game state, where an option is the event types its
+        first event is drawn from. Every option uses the same seed, so the differences come from the
+        decision rather than from the draws.
+        """
+        state, inning, half, home_lead = situation(game_state)
+        results = {}
+        for name, first_events in options.items():
+            if horizon == "inning":
+                runs = self.rest_of_inning(state, simulations, first_events, seed)
+                results[name] = {"runs": float(runs.mean()), "scoring": float((runs > 0).mean())}
+            else:
+                lead = self.rest_of_game(state, inning, half, home_lead, simulations, first_events, seed)
+                batting_lead = lead if half == Half.BOTTOM else -lead
+                results[name] = {"win": float((batting_lead > 0).mean() + (batting_lead == 0).mean() / 2)}
+        return results
+
+
+def state_name(state: int) -> str:
+    return "END" if state == END else f"{BASE_STATE_NAMES[state % 8]} {state // 8} outs"
+
+
+def parse_state(text: str) -> GameState:
+    """A GameState from bases like "1_3", outs, inning, half and home lead, as "1_3,1,7,Top,-1" """
+    bases, outs, inning, half, home_lead = text.split(",")
+    game_state = GameState(inning=int(inning), half=Half(half), outs=int(outs), score_home=max(int(home_lead), 0),
+                           score_away=max(-int(home_lead), 0))
+    for base, mark in zip((Base.FIRST, Base.SECOND, Base.THIRD), bases):
+        if mark != "_":
+            game_state.bases_occupied[base] = 0
+    return game_state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate innings from the run tables and compare decisions")
+    parser.add_argument("--tables-dir", default=TABLES_DIR, help="built by run_expectancy.py")
+    parser.add_argument("--simulations", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--state", default="1__,0,8,Bot,0", help="bases,outs,inning,half,home lead")
+    parser.add_argument("--decision", choices=list(DECISIONS), default="steal 2B")
+    parser.add_argument("--horizon", choices=["inning", "game"], default="inning")
+    args = parser.parse_args()
+
+    simulator = InningSimulator.load(args.tables_dir, args.seed)
+    start = time.perf_counter()
+    runs = simulator.rest_of_inning(0, args.simulations)
+    seconds = time.perf_counter() - start
+    print(f"{args.simulations} half innings from {state_name(0)}: {runs.mean():.3f} runs, {simulator.events} plays "
+          f"in {seconds:.2f}s ({simulator.events / seconds:,.0f} plays/s)")
+
+    game_state = parse_state(args.state)
+    print(f"{args.decision} from {state_name(situation(game_state)[0])}, inning {game_state.inning} "
+          f"{game_state.half.value}, home lead {game_state.score_home - game_state.score_away}:")
+    for name, result in simulator.compare(game_state, DECISIONS[args.decision], args.simulations // 10,
+                                          args.horizon).items():
+        print(f"  {name}: " + ", ".join(f"{key} {value:.3f}" for key, value in result.items()))
@@ -0,0 +1,270 @@
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+
+from season_columns import SEASON_DIR, HALF_CODES, load_season, build_season
+
+INDEX_DIR = "situation_index"
+
+# Base-out states 0-23 are outs * 8 + the occupied-base mask; rows logged with three outs share state 24
+BASE_OUT_STATES = 25
+# Innings 1-3, 4-6, 7-8, 9 and extras
+INNING_EDGES = np.array([4, 7, 9, 10])
+INNING_BUCKETS = len(INNING_EDGES) + 1
+# Runs the batting team trails by, with 3 or more either way sharing a bucket
+DEFICIT_LIMIT = 3
+DEFICIT_BUCKETS = 2 * DEFICIT_LIMIT + 1
+KEYS = BASE_OUT_STATES * INNING_BUCKETS * len(HALF_CODES) * DEFICIT_BUCKETS
+
+
+def base_mask(first, second, third) -> np.ndarray:
+    return (np.asarray(first) != -1) * 1 + (np.asarray(second) != -1) * 2 + (np.asarray(third) != -1) * 4
+
+
+def batting_deficit(score_deficit, half) -> np.ndarray:
+    """Runs the batting team trails by. Score_Deficit is home minus away, so in the top it's the visitors' deficit"""
+    return np.where(np.asarray(half) == HALF_CODES["Top"], score_deficit, -np.asarray(score_deficit))
+
+
+def situation_keys(columns) -> np.ndarray:
+    """Index key of every row of a season or a slice of its columns"""
+    outs = np.asarray(columns["Outs"]).astype(np.int32)
+    bases = base_mask(columns["First_Base"], columns["Second_Base"], columns["Third_Base"])
+    base_out = np.where(outs >= 3, BASE_OUT_STATES - 1, outs * 8 + bases)
+    inning = np.digitize(np.asarray(columns["Inning"]), INNING_EDGES)
+    half = np.asarray(columns["Half"]).astype(np.int32)
+    deficit = np.clip(batting_deficit(np.asarray(columns["Score_Deficit"]).astype(np.int32), half),
+                      -DEFICIT_LIMIT, DEFICIT_LIMIT) + DEFICIT_LIMIT
+    keys = ((base_out * INNING_BUCKETS + inning) * len(HALF_CODES) + half) * DEFICIT_BUCKETS + deficit
+    return keys.astype(np.int16)
+
+
+def _as_list(value) -> list:
+    return list(value) if isinstance(value, (list, tuple, set, range)) else [value]
+
+
+def check_outs(outs):
+    """outs as rows() takes it, an int or a list, once every value is a number of outs from 0 to 3"""
+    if outs is not None and any(isinstance(out, bool) or out not in range(4) for out in _as_list(outs)):
+        raise ValueError(f"Outs are 0 to 3, not {outs}")
+    return outs
+
+
+def _range(value, lowest, highest) -> tuple:
+    """An int, or an inclusive (low, high) pair with None for an open end"""
+    if isinstance(value, tuple):
+        low, high = value
+        return lowest if low is None else low, highest if high is None else high
+    return value, value
+
+
+class SituationIndex:
+    """
+    Season rows grouped by base-out state, inning bucket, half and deficit bucket. The rows of key k are
+    order[key_offsets[k]:key_offsets[k + 1]], in season order, so a query only touches the groups it matches.
+    """
+
+    def __init__(self, season, keys: np.ndarray, order: np.ndarray, key_offsets: np.ndarray):
+        self.season = season
+        self.keys = keys
+        self.order = order
+        self.key_offsets = key_offsets
+
+    def _matching_keys(self, bases, outs, innings, half, deficit) -> np.ndarray:
+        if outs is None:
+            outs_values = [0, 1, 2, 3]
+        else:
+            outs_values = _as_list(check_outs(outs))
+        if bases is None:
+            masks = range(8)
+        else:
+            # Occupied bases as 1, 2 and 3, so (1, 3) is first and third and () the bases empty
+            masks = [sum(1 << (base - 1) for base in bases)]
+        base_outs = sorted({BASE_OUT_STATES - 1 if out >= 3 else out * 8 + mask
+                            for out in outs_values for mask in masks})
+        low, high = _range(innings, 1, 99) if innings is not None else (1, 99)
+        inning_buckets = range(np.digitize(low, INNING_EDGES), np.digitize(high, INNING_EDGES) + 1)
+        halves = [HALF_CODES[half]] if half is not None else sorted(HALF_CODES.values())
+        low, high = _range(deficit, -99, 99) if deficit is not None else (-99, 99)
+        low, high = np.clip([low, high], -DEFICIT_LIMIT, DEFICIT_LIMIT)
+        deficit_buckets = np.arange(low, high + 1) + DEFICIT_LIMIT
+        # Every combination of the matching buckets, by broadcasting one axis per key component
+        keys = np.array(base_outs)[:, None, None, None] * INNING_BUCKETS + np.array(inning_buckets)[:, None, None]
+        keys = (keys * len(HALF_CODES) + np.array(halves)[:, None]) * DEFICIT_BUCKETS + deficit_buckets
+        return np.sort(keys.ravel())
+
+    def rows(self, bases=None, outs=None, innings=None, half=None, deficit=None, decisions=None) -> np.ndarray:
+        """
+        Season row numbers matching a situation. bases is the occupied bases like (2,), outs an int or list,
+        innings and deficit an int or inclusive (low, high) pair, half "Top" or "Bot", and decisions filters
+        on Is_Decision. deficit is what the batting team trails by.
+        """
+        keys = self._matching_keys(bases, outs, innings, half, deficit)
+        groups = [self.order[self.key_offsets[key]:self.key_offsets[key + 1]] for key in keys]
+        rows = np.concatenate(groups) if groups else np.empty(0, dtype=self.order.dtype)
+        # Buckets can be wider than the filter, so the exact values are checked on the candidate rows only
+        keep = np.ones(len(rows), dtype=bool)
+        if bases is not None and (outs is None or max(_as_list(outs)) >= 3):
+            # The three-out state doesn't tell the bases apart
+            mask = base_mask(*(self.season[base][rows] for base in ["First_Base", "Second_Base", "Third_Base"]))
+            keep &= mask == sum(1 << (base - 1) for base in bases)
+        if innings is not None:
+            low, high = _range(innings, 1, 99)
+            inning = self.season["Inning"][rows]
+            keep &= (inning >= low) & (inning <= high)
+        if deficit is not None:
+            low, high = _range(deficit, -99, 99)
+            trailing = batting_deficit(self.season["Score_Deficit"][rows], self.season["Half"][rows])
+            keep &= (trailing >= low) & (trailing <= high)
+        if decisions is not None:
+            keep &= self.season["Is_Decision"][rows] == decisions
+        return np.sort(rows[keep])
+
+    def count(self, **situation) -> int:
+        return len(self.rows(**situation))
+
+    def value_counts(self, column, **situation) -> dict:
+        """Occurrences of each value of a column in the matching rows, by event type name for Event_Type"""
+        values, counts = np.unique(self.season[column][self.rows(**situation)], return_counts=True)
+        if column == "Event_Type":
+            values = self.season.event_type_names(values)
+        return dict(sorted(zip(values.tolist(), counts.tolist()), key=lambda item: -item[1]))
+
+    def mean(self, column, **situation) -> float:
+        values = self.season[column][self.rows(**situation)]
+        return float(values.mean()) if len(values) else float("nan")
+
+
+def index_is_current(season, season_dir=SEASON_DIR, index_dir=INDEX_DIR) -> bool:
+    """
+    Whether the index was built from the season as it is now: the same decision CSV of every game, at the same
+    rows. A season rebuilt without the index, like run_expectancy.py and training_matrix.py do, shifts the rows.
+    """
+    index_meta = Path(index_dir) / "meta.json"
+    if not index_meta.exists():
+        return False
+    meta = json.loads(index_meta.read_text())
+    with open(Path(season_dir) / "meta.json") as f:
+        sources = json.load(f)["sources"]
+    return (meta["game_pks"] == season.game_pks.tolist() and meta["offsets"] == season.offsets.tolist()
+            and meta["sources"] == sources)
+
+
+def load_situation_index(season, index_dir=INDEX_DIR) -> SituationIndex:
+    index_dir = Path(index_dir)
+    return SituationIndex(season, np.load(index_dir / "keys.npy", mmap_mode="r"), np.load(index_dir / "order.npy"),
+                          np.load(index_dir / "key_offsets.npy"))
+
+
+def build_situation_index(season_dir=SEASON_DIR, index_dir=INDEX_DIR, rebuild_season=True) -> SituationIndex:
+    """
+    Index the season file, rebuilding it first from games/ unless rebuild_season is off. Keys of games
+    whose decision CSV didn't change since the last build are reused, only new or changed games are keyed.
+    """
+    season = build_season(season_dir=season_dir) if rebuild_season else load_season(season_dir)
+    with open(Path(season_dir) / "meta.json") as f:
+        sources = json.load(f)["sources"]
+
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    previous_keys = None
+    previous_sources = {}
+    if (index_dir / "meta.json").exists():
+        # Read rather than mapped, since keys.npy is rewritten below
+        previous_keys = np.load(index_dir / "keys.npy")
+        with open(index_dir / "meta.json") as f:
+            meta = json.load(f)
+        previous_sources = meta["sources"]
+        previous_game_pks = np.asarray(meta["game_pks"], dtype=np.int64)
+        previous_offsets = np.asarray(meta["offsets"], dtype=np.int64)
+
+    pieces = []
+    keyed = 0
+    for i, game_pk in enumerate(season.game_pks):
+        rows = slice(int(season.offsets[i]), int(season.offsets[i + 1]))
+        if previous_keys is not None and previous_sources.get(str(game_pk)) == sources[str(game_pk)]:
+            j = int(np.searchsorted(previous_game_pks, game_pk))
+            pieces.append(previous_keys[previous_offsets[j]:previous_offsets[j + 1]])
+        else:
+            pieces.append(situation_keys({column: season[column][rows] for column in
+                                          ["Outs", "First_Base", "Second_Base", "Third_Base", "Inning", "Half",
+                                           "Score_Deficit"]}))
+            keyed += 1
+    keys = np.concatenate(pieces) if pieces else np.empty(0, dtype=np.int16)
+    # A stable sort keeps every key's rows in season order
+    order = np.argsort(keys, kind="stable").astype(np.int32)
+    key_offsets = np.searchsorted(keys[order], np.arange(KEYS + 1)).astype(np.int64)
+
+    (index_dir / "meta.json").unlink(missing_ok=True)
+    np.save(index_dir / "keys.npy", keys)
+    np.save(index_dir / "order.npy", order)
+    np.save(index_dir / "key_offsets.npy", key_offsets)
+    with open(index_dir / "meta.json", "w") as f:
+        json.dump({
+            "sources": {str(game_pk): sources[str(game_pk)] for game_pk in season.game_pks},
+            "game_pks": season.game_pks.tolist(),
+            "offsets": season.offsets.tolist(),
+            "keyed_games": keyed,
+        }, f)
+    return SituationIndex(season, keys, order, key_offsets)
+
+
+def parse_range(text):
+    """"1" is one value, "7-" seven or more, "1-3" one to three and "-2--1" minus two to minus one"""
+    if text is None:
+        return None
+    match = re.fullmatch(r"(-?\d+)?(?:(-)(-?\d+)?)?", text)
+    if match is None:
+        raise ValueError(f"Not a value or a range: {text}")
+    low, separator, high = match.groups()
+    if not separator:
+        return int(low)
+    return int(low) if low else None, int(high) if high else None
+
+
+def parse_bases(text):
+    """"13" is first and third and "0" the bases empty, as the tuple rows() takes"""
+    if text is None:
+        return None
+    if text == "0":
+        return ()
+    if not text or any(base not in "123" for base in text) or len(set(text)) < len(text):
+        raise ValueError(f"Bases are 0 or occupied bases like 2 or 13, each once, not {text}")
+    return tuple(sorted(int(base) for base in text))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the situation index and count the rows of a situation")
+    parser.add_argument("--season-dir", default=SEASON_DIR)
+    parser.add_argument("--output", default=INDEX_DIR)
+    parser.add_argument("--no-season-rebuild", action="store_true", help="index the season file as it is")
+    parser.add_argument("--bases", help="occupied bases like 2 or 13, 0 for empty")
+    parser.add_argument("--outs", type=int)
+    parser.add_argument("--innings", help="an inning or a range like 7- or 1-3")
+    parser.add_argument("--half", choices=list(HALF_CODES))
+    parser.add_argument("--deficit", help="runs the batting team trails by, or a range")
+    parser.add_argument("--decisions", action="store_true", help="only Is_Decision rows")
+    args = parser.parse_args()
+
+    try:
+        situation = dict(outs=check_outs(args.outs), innings=parse_range(args.innings), half=args.half,
+                         deficit=parse_range(args.deficit), decisions=True if args.decisions else None)
+        if args.bases is not None:
+            situation["bases"] = parse_bases(args.bases)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    index = build_situation_index(args.season_dir, args.output, not args.no_season_rebuild)
+    print(f"Indexed {len(index.keys)} rows in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    rows = index.rows(**situation)
+    seconds = time.perf_counter() - start
+    print(f"{len(rows)} rows in {seconds * 1000:.2f} ms")
+    for event_type, count in list(index.value_counts("Event_Type", **situation).items())[:10]:
+        print(f"  {event_type}: {count}")
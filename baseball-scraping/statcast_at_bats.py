@@ -1,4 +1,5 @@
 import csv
+import os
 from io import StringIO
 import pandas as pd
 
@@ -42,3 +43,58 @@ def get_at_bat_summary_for_game(input_csv, game_id):
     # Convert the modified CSV string to a pandas DataFrame
     return pd.read_csv(StringIO(modified_csv))
 
+
+
+def index_at_bats(at_bat_summary) -> dict:
+    """
+    Map (inning, inning_topbot, at_bat_number), all as strings, to the runners on first, second and third
+    at the first row of that at bat, with -1 for an empty base
+    """
+    index = {}
+    keys = zip(at_bat_summary['inning'].astype(str), at_bat_summary['inning_topbot'].astype(str),
+               at_bat_summary['at_bat_number'].astype(str))
+    runners = zip(at_bat_summary['on_1b'], at_bat_summary['on_2b'], at_bat_summary['on_3b'])
+    for key, bases in zip(keys, runners):
+        if key not in index:
+            index[key] = tuple(int(runner) if pd.notna(runner) else -1 for runner in bases)
+    return index
+
+
+def at_bats_from_decisions(decisions, game_pk):
+    """
+    Approximate one game's reduced statcast at-bat table from its decision rows.
+    The first decision row of each at bat holds the bases after they were synchronized with statcast.
+    """
+    first = decisions.drop_duplicates(subset=['Inning', 'Half', 'At_Bat'], keep='first')
+    return pd.DataFrame({
+        'game_pk': int(game_pk),
+        'inning': first['Inning'],
+        'inning_topbot': first['Half'],
+        'at_bat_number': first['At_Bat'],
+        'pitch_number': 1,
+        'outs_when_up': first['Outs'],
+        # Rows read as text use empty strings for empty bases
+        'on_1b': first['First_Base'].replace('', None),
+        'on_2b': first['Second_Base'].replace('', None),
+        'on_3b': first['Third_Base'].replace('', None),
+    })
+
+
+def build_statcast_stub(game_pks, games_dir="games"):
+    """
+    Stand in for helper_files/statcast_reduced2023.csv, which is not committed, by rebuilding
+    the at-bat table from the committed decision CSVs.
+    """
+    frames = []
+    for game_pk in game_pks:
+        path = os.path.join(games_dir, f"game_{game_pk}_decisions.csv")
+        if not os.path.exists(path):
+            continue
+        decisions = pd.read_csv(
+            path, usecols=['Inning', 'Half', 'At_Bat', 'Outs', 'First_Base', 'Second_Base', 'Third_Base']
+        )
+        frames.append(at_bats_from_decisions(decisions, game_pk))
+
+    if not frames:
+        raise Exception(f"No decision CSVs found in {games_dir} for the requested games")
+    return pd.concat(frames, ignore_index=True)
@@ -1,41 +1,31 @@
 import os
-import pandas as pd
+from validate import validate_csv_dir
 
-def check_pitcher_nulls(directory):
-    # List to store files with nulls in Home_Pitcher or Away_Pitcher columns
-    files_with_nulls = []
-    csv_files_found = False
 
+def check_pitcher_nulls(directory):
     # Verify the directory exists
     if not os.path.isdir(directory):
         print(f"The directory '{directory}' does not exist.")
         return
 
-    # Iterate through each file in the directory
-    for filename in os.listdir(directory):
-        if filename.endswith('.csv'):
-            csv_files_found = True
-            file_path = os.path.join(directory, filename)
-            try:
-                # Load the CSV file
-                df = pd.read_csv(file_path)
-
-                # Check for nulls in Home_Pitcher or Away_Pitcher columns
-                if df['Home_Pitcher'].isnull().any() or df['Away_Pitcher'].isnull().any():
-                    files_with_nulls.append(filename)
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
+    report = validate_csv_dir(directory, checks=["pitchers_not_null"])
 
     # Report results
-    if not csv_files_found:
+    if report.unreadable:
+        for filename, error in report.unreadable:
+            print(f"Error processing {filename}: {error}")
+    failed_games = report.checks["pitchers_not_null"].failed_games
+    if report.games == 0:
         print("No CSV files found in the specified directory.")
-    elif files_with_nulls:
+    elif failed_games:
         print("Files with null values in Home_Pitcher or Away_Pitcher columns:")
-        for file in files_with_nulls:
-            print(file)
+        for game_pk in failed_games:
+            print(f"game_{game_pk}_decisions.csv")
     else:
         print("No files with null values in Home_Pitcher or Away_Pitcher columns found.")
 
-# Example usage
-directory_path = './games'
-check_pitcher_nulls(directory_path)
+
+if __name__ == "__main__":
+    # Example usage
+    directory_path = './games'
+    check_pitcher_nulls(directory_path)
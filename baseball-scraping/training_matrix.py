@@ -0,0 +1,222 @@
+import argparse
+import json
+import resource
+import time
+from pathlib import Path
+
+import numpy as np
+
+TRAINING_DIR = "training"
+MATRIX_FILE = "matrix.int32"
+VOCAB_FILE = "vocab.json"
+# Situation features first, then every player column as an index into the player vocabulary.
+# season_columns, and with it pandas, is only imported to export, so reading batches stays light.
+FEATURE_COLUMNS = ["Is_Decision", "Event_Type", "Inning", "Half", "Outs", "Score_Deficit", "Base_State"]
+# Vocabulary index of an empty base, lineup slot or field position
+EMPTY_PLAYER = 0
+# Rows encoded at a time, so exporting never holds more than this many rows of the season in memory
+CHUNK_ROWS = 1 << 18
+
+
+class PlayerVocabulary:
+    """Player ids in the order they got their index. Index 0 is the empty player, and indices are never reused"""
+
+    def __init__(self, player_ids=()):
+        self.player_ids = np.asarray(player_ids, dtype=np.int64)
+        self._sorted = np.argsort(self.player_ids, kind="stable")
+
+    def __len__(self):
+        return len(self.player_ids) + 1
+
+    def extend(self, player_ids: np.ndarray):
+        """Give the ids not in the vocabulary yet the next indices, in id order"""
+        ids = np.unique(player_ids[player_ids != -1])
+        new = ids[~np.isin(ids, self.player_ids)]
+        if len(new):
+            self.player_ids = np.concatenate([self.player_ids, new])
+            self._sorted = np.argsort(self.player_ids, kind="stable")
+
+    def encode(self, player_ids: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(self.player_ids, player_ids, sorter=self._sorted)
+        positions = np.minimum(positions, max(len(self.player_ids) - 1, 0))
+        indices = self._sorted[positions] + 1 if len(self.player_ids) else np.zeros(len(player_ids), dtype=np.int64)
+        return np.where(player_ids == -1, EMPTY_PLAYER, indices).astype(np.int32)
+
+    def decode(self, indices: np.ndarray) -> np.ndarray:
+        """Player ids of vocabulary indices, -1 for the empty player"""
+        return np.r_[-1, self.player_ids][indices]
+
+
+def base_state(first: np.ndarray, second: np.ndarray, third: np.ndarray) -> np.ndarray:
+    """Occupied bases as a bit mask: 1 for first, 2 for second, 4 for third"""
+    return ((first != -1) * 1 + (second != -1) * 2 + (third != -1) * 4).astype(np.int32)
+
+
+def export_training_matrix(season, output_dir=TRAINING_DIR) -> "TrainingMatrix":
+    """
+    Encode every decision row of a season into one int32 matrix file. A previous export's player and event
+    type vocabularies are extended rather than rebuilt, so an index keeps meaning the same player.
+    """
+    from season_columns import PLAYER_COLUMNS, BASE_COLUMNS
+
+    matrix_columns = FEATURE_COLUMNS + PLAYER_COLUMNS
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    vocabulary = PlayerVocabulary()
+    event_types = []
+    if (output_dir / VOCAB_FILE).exists():
+        with open(output_dir / VOCAB_FILE) as f:
+            previous = json.load(f)
+        vocabulary = PlayerVocabulary(previous["players"])
+        event_types = list(previous["event_types"])
+    for column in PLAYER_COLUMNS:
+        vocabulary.extend(np.asarray(season[column]))
+    # New event types go after the previous ones, and the season's codes are mapped onto the merged list
+    event_types += [event_type for event_type in season.event_types if event_type not in event_types]
+    event_codes = np.asarray([event_types.index(event_type) for event_type in season.event_types], dtype=np.int32)
+
+    rows = len(season)
+    # Removed first, so a directory without the vocabulary is an interrupted export
+    (output_dir / VOCAB_FILE).unlink(missing_ok=True)
+    matrix = np.memmap(output_dir / MATRIX_FILE, dtype=np.int32, mode="w+", shape=(rows, len(matrix_columns)))
+    decision_rows = []
+    for start in range(0, rows, CHUNK_ROWS):
+        chunk = slice(start, min(start + CHUNK_ROWS, rows))
+        block = np.empty((chunk.stop - chunk.start, len(matrix_columns)), dtype=np.int32)
+        for j, column in enumerate(matrix_columns):
+            if column == "Base_State":
+                bases = (season[base][chunk] for base in ["First_Base", "Second_Base", "Third_Base"])
+                block[:, j] = base_state(*bases)
+            elif column in PLAYER_COLUMNS:
+                block[:, j] = vocabulary.encode(np.asarray(season[column][chunk]))
+            elif column == "Event_Type":
+                block[:, j] = event_codes[np.asarray(season[column][chunk])]
+            else:
+                block[:, j] = season[column][chunk]
+        matrix[chunk] = block
+        decision_rows.append(start + np.flatnonzero(block[:, 0]))
+    matrix.flush()
+    del matrix
+
+    np.save(output_dir / "decision_rows.npy", np.concatenate(decision_rows).astype(np.int64))
+    np.save(output_dir / "game_pks.npy", np.asarray(season.game_pks, dtype=np.int64))
+    np.save(output_dir / "offsets.npy", np.asarray(season.offsets, dtype=np.int64))
+    with open(output_dir / VOCAB_FILE, "w") as f:
+        json.dump({
+            "rows": rows,
+            "columns": matrix_columns,
+            "players": vocabulary.player_ids.tolist(),
+            "event_types": event_types,
+            "base_columns": BASE_COLUMNS,
+        }, f)
+    return TrainingMatrix(output_dir)
+
+
+class TrainingMatrix:
+    """
+    The exported matrix mapped read-only. Nothing is read until rows are asked for, and batches copy only
+    their own rows, so a training job starts right away and its memory doesn't grow with the season.
+    """
+
+    def __init__(self, directory=TRAINING_DIR):
+        self.directory = Path(directory)
+        with open(self.directory / VOCAB_FILE) as f:
+            meta = json.load(f)
+        self.columns = meta["columns"]
+        self.column_index = {column: j for j, column in enumerate(self.columns)}
+        self.event_types = meta["event_types"]
+        self.vocabulary = PlayerVocabulary(meta["players"])
+        self.matrix = np.memmap(self.directory / MATRIX_FILE, dtype=np.int32, mode="r",
+                                shape=(meta["rows"], len(self.columns)))
+        self.decision_rows = np.load(self.directory / "decision_rows.npy", mmap_mode="r")
+        self.game_pks = np.load(self.directory / "game_pks.npy")
+        self.offsets = np.load(self.directory / "offsets.npy")
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def column(self, name, rows=slice(None)) -> np.ndarray:
+        return self.matrix[rows, self.column_index[name]]
+
+    def epoch_rows(self, rng: np.random.Generator, shuffle=True, decision_fraction: float = None) -> np.ndarray:
+        """
+        Row numbers of one epoch. With decision_fraction, Is_Decision rows are repeated (or subsampled) until
+        they make up that share of the epoch, while every other row is used exactly once.
+        """
+        if decision_fraction is not None and not 0 < decision_fraction < 1:
+            raise ValueError(f"decision_fraction must be between 0 and 1, got {decision_fraction}")
+        rows = np.arange(len(self), dtype=np.int64)
+        if decision_fraction is not None:
+            is_decision = np.zeros(len(self), dtype=bool)
+            is_decision[self.decision_rows] = True
+            others = rows[~is_decision]
+            wanted = int(round(decision_fraction / (1 - decision_fraction) * len(others)))
+            decisions = np.asarray(self.decision_rows)
+            if len(decisions) and wanted > len(decisions):
+                extra = rng.choice(decisions, wanted - len(decisions), replace=True)
+                decisions = np.concatenate([decisions, extra])
+            elif len(decisions):
+                decisions = rng.choice(decisions, wanted, replace=False)
+            rows = np.concatenate([others, decisions])
+        if shuffle:
+            rng.shuffle(rows)
+        return rows
+
+    def batches(self, batch_size: int = 1024, shuffle=True, decision_fraction: float = None, seed: int = 0,
+                epochs: int = 1, drop_last=False):
+        """
+        Yield int32 arrays of batch_size rows. The same seed gives the same batches. Rows are read in file
+        order within a batch, which keeps reads from the mapped file close together.
+        """
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            rows = self.epoch_rows(rng, shuffle, decision_fraction)
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                if drop_last and len(batch) < batch_size:
+                    break
+                yield self.matrix[np.sort(batch)]
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the decision rows as an int32 training matrix")
+    parser.add_argument("--season-dir", default="season_columns", help="season columns to export, built if missing")
+    parser.add_argument("--deltas", help="export from a delta_season directory instead")
+    parser.add_argument("--output", default=TRAINING_DIR)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--decision-fraction", type=float, default=None,
+                        help="oversample Is_Decision rows to this share of each epoch")
+    parser.add_argument("--read-only", action="store_true", help="time an epoch of an existing export")
+    args = parser.parse_args()
+    if args.decision_fraction is not None and not 0 < args.decision_fraction < 1:
+        parser.error("--decision-fraction must be between 0 and 1")
+
+    if not args.read_only:
+        from season_columns import load_season, build_season
+
+        if args.deltas:
+            from delta_season import load_delta_season
+            season = load_delta_season(args.deltas)
+        elif Path(args.season_dir, "meta.json").exists():
+            season = load_season(args.season_dir)
+        else:
+            season = build_season(season_dir=args.season_dir)
+        start = time.perf_counter()
+        exported = export_training_matrix(season, args.output)
+        print(f"Exported {len(exported)} rows x {len(exported.columns)} columns with {len(exported.vocabulary)} "
+              f"players in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    training = TrainingMatrix(args.output)
+    opened = time.perf_counter() - start
+    rows = decisions = 0
+    for batch in training.batches(args.batch_size, decision_fraction=args.decision_fraction):
+        rows += len(batch)
+        decisions += int(batch[:, training.column_index["Is_Decision"]].sum())
+    print(f"Opened in {opened * 1000:.1f} ms, one epoch of {rows} rows ({decisions / max(rows, 1):.1%} decisions) "
+          f"in {time.perf_counter() - start:.2f}s, max RSS {max_rss_mb():.0f} MB")
@@ -0,0 +1,196 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+
+import numpy as np
+
+from season_columns import (BASE_COLUMNS, LINEUP_COLUMNS, FIELDER_COLUMNS, SEASON_DIR, GAMES_DIR,
+                            read_game_columns, game_pk_from_path, load_season)
+
+
+def _has_duplicates(block: np.ndarray) -> np.ndarray:
+    """Rows of a (rows, slots) player id block where a non-empty id appears twice"""
+    ordered = np.sort(block, axis=1)
+    return ((ordered[:, 1:] == ordered[:, :-1]) & (ordered[:, 1:] != -1)).any(axis=1)
+
+
+def _stack(columns: dict, names: list) -> np.ndarray:
+    return np.column_stack([columns[name] for name in names])
+
+
+def check_pitchers_not_null(columns, game_ids):
+    return (columns["Home_Pitcher"] == -1) | (columns["Away_Pitcher"] == -1)
+
+
+def check_runner_on_one_base(columns, game_ids):
+    return _has_duplicates(_stack(columns, BASE_COLUMNS))
+
+
+def check_outs_in_range(columns, game_ids):
+    return (columns["Outs"] < 0) | (columns["Outs"] > 3)
+
+
+def check_at_bat_monotone(columns, game_ids):
+    at_bat = columns["At_Bat"].astype(np.int32)
+    failed = np.zeros(len(at_bat), dtype=bool)
+    # Missing at-bat numbers are -1 and don't take part in the ordering
+    failed[1:] = ((game_ids[1:] == game_ids[:-1]) & (at_bat[1:] < at_bat[:-1]) &
+                  (at_bat[1:] != -1) & (at_bat[:-1] != -1))
+    return failed
+
+
+def check_lineup_consistent(columns, game_ids):
+    failed = np.zeros(len(game_ids), dtype=bool)
+    for names in LINEUP_COLUMNS.values():
+        lineup = _stack(columns, names)
+        failed |= (lineup == -1).any(axis=1) | _has_duplicates(lineup)
+    return failed
+
+
+def check_fielders_consistent(columns, game_ids):
+    failed = np.zeros(len(game_ids), dtype=bool)
+    for names in FIELDER_COLUMNS.values():
+        failed |= _has_duplicates(_stack(columns, names))
+    return failed
+
+
+def check_fielders_in_lineup(columns, game_ids):
+    failed = np.zeros(len(game_ids), dtype=bool)
+    for team, names in FIELDER_COLUMNS.items():
+        fielders = _stack(columns, names)
+        lineup = _stack(columns, LINEUP_COLUMNS[team])
+        missing = (fielders[:, :, None] != lineup[:, None, :]).all(axis=2) & (fielders != -1)
+        failed |= missing.any(axis=1)
+    return failed
+
+
+# Name -> (columns it reads, function returning a mask of failing rows)
+CHECKS = {
+    "pitchers_not_null": (["Home_Pitcher", "Away_Pitcher"], check_pitchers_not_null),
+    "runner_on_one_base": (BASE_COLUMNS, check_runner_on_one_base),
+    "outs_in_range": (["Outs"], check_outs_in_range),
+    "at_bat_monotone": (["At_Bat"], check_at_bat_monotone),
+    "lineup_consistent": (LINEUP_COLUMNS["Home"] + LINEUP_COLUMNS["Away"], check_lineup_consistent),
+    "fielders_consistent": (FIELDER_COLUMNS["Home"] + FIELDER_COLUMNS["Away"], check_fielders_consistent),
+    "fielders_in_lineup": (FIELDER_COLUMNS["Home"] + FIELDER_COLUMNS["Away"] +
+                           LINEUP_COLUMNS["Home"] + LINEUP_COLUMNS["Away"], check_fielders_in_lineup),
+}
+
+
+def required_columns(checks) -> list:
+    columns = []
+    for check in checks:
+        columns.extend(column for column in CHECKS[check][0] if column not in columns)
+    return columns
+
+
+@dataclass
+class CheckResult:
+    failed_rows: int = 0
+    failed_games: list = field(default_factory=list)
+
+
+@dataclass
+class ValidationReport:
+    games: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+    checks: dict = field(default_factory=dict)
+    unreadable: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.unreadable and all(result.failed_rows == 0 for result in self.checks.values())
+
+    def add(self, check: str, game_pks: np.ndarray, failed: np.ndarray):
+        result = self.checks.setdefault(check, CheckResult())
+        result.failed_rows += int(failed.sum())
+        result.failed_games.extend(int(game_pk) for game_pk in np.unique(game_pks[failed]))
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def format(self) -> str:
+        lines = [f"Validated {self.rows} rows in {self.games} games in {self.seconds:.2f} seconds"]
+        for check, result in self.checks.items():
+            status = "ok" if result.failed_rows == 0 else \
+                f"{result.failed_rows} rows in {len(result.failed_games)} games"
+            lines.append(f"  {check:<22}{status}")
+        for path, error in self.unreadable:
+            lines.append(f"  unreadable {path}: {error}")
+        return "\n".join(lines)
+
+
+def _validate_file(args):
+    path, checks = args
+    try:
+        game_pk = game_pk_from_path(path)
+        columns = read_game_columns(path, required_columns(checks))
+    except Exception as e:
+        return str(path), None, None, str(e)
+    game_ids = np.full(len(next(iter(columns.values()))), game_pk, dtype=np.int64)
+    return str(path), game_pk, {check: CHECKS[check][1](columns, game_ids) for check in checks}, None
+
+
+def validate_csv_dir(directory=GAMES_DIR, checks=None, workers=None) -> ValidationReport:
+    """Validate every decision CSV in a directory, reading only the columns the checks need"""
+    checks = list(checks or CHECKS)
+    report = ValidationReport(checks={check: CheckResult() for check in checks})
+    start = time.perf_counter()
+    paths = sorted(Path(directory).glob("game_*_decisions.csv"))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_validate_file, [(path, checks) for path in paths], chunksize=32)
+        for path, game_pk, failures, error in results:
+            if error:
+                report.unreadable.append((path, error))
+                continue
+            report.games += 1
+            game_pks = np.full(len(next(iter(failures.values()))), game_pk, dtype=np.int64)
+            report.rows += len(game_pks)
+            for check, failed in failures.items():
+                report.add(check, game_pks, failed)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def validate_season(season_dir=SEASON_DIR, checks=None) -> ValidationReport:
+    """Validate the columnar season file written by season_columns.build_season"""
+    checks = list(checks or CHECKS)
+    start = time.perf_counter()
+    season = load_season(season_dir, columns=required_columns(checks))
+    game_pks = season.row_game_pks()
+    report = ValidationReport(games=len(season.game_pks), rows=len(season),
+                              checks={check: CheckResult() for check in checks})
+    for check in checks:
+        report.add(check, game_pks, CHECKS[check][1](season.columns, game_pks))
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check invariants of the decision dataset")
+    parser.add_argument("--games-dir", default=GAMES_DIR)
+    parser.add_argument("--season", nargs="?", const=SEASON_DIR,
+                        help="validate a columnar season directory instead of the CSVs")
+    parser.add_argument("--check", choices=list(CHECKS), action="append", help="default: all checks")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--report", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.season:
+        report = validate_season(args.season, args.check)
+    else:
+        report = validate_csv_dir(args.games_dir, args.check, args.workers)
+    print(report.format())
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report.to_dict(), f, indent=2)
+    return 0 if report.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())